@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
-import circuit.circuit as circ
 from circuit.cnf import SatVar, Solver, Cnf
+from transform import emit_or, emit_and, emit_xor, emit_not, emit_eq
 
 # circ full_adder {
 #      inputs: a, b, cin
@@ -26,25 +26,35 @@ s1 = SatVar('s1')
 s2 = SatVar('s2')
 
 
+# The gates share their clauses with transform(): each one is the output
+# of the matching emit_* function, collected in a Cnf.
+
+def mk_gate(emit, s, *args):
+    """Take an emit_* function of transform, the output s and the inputs
+    of the gate. Return the cnf of the gate, over the VarPool of s"""
+    cnf = Cnf(pool = s.pool)
+    emit(cnf, int(s), *[int(x) for x in args])
+    return cnf
+
 def mk_or(s, a, b):
     """Take 2 inputs a, b and 1 output s. Return the cnf of the gate s <=> a | b"""
-    return (a | b | ~s) & (s | ~a) & (s | ~b)
+    return mk_gate(emit_or, s, a, b)
 
 def mk_and(s, a, b):
     """Take 2 inputs a, b and one output s. Return the cnf of the gate s <=> a & b"""
-    return (~a | ~b | s) & (~s | a) & (~s | b)
+    return mk_gate(emit_and, s, a, b)
 
 def mk_xor(s, a, b):
     """Take 2 inputs a, b and 1 output s. Return the cnf of the gate s <=> a ^ b"""
-    return (~s | a | b) & (~s | ~a | ~b) & (s | ~a | b) & (s | a | ~b)
+    return mk_gate(emit_xor, s, a, b)
 
 def mk_not(s, a):
     """Take 1 inputs a and 1 output s. Return the cnf of the gate s <=> ~a"""
-    return (s | a) & (~s | ~a)
+    return mk_gate(emit_not, s, a)
 
 def mk_eq(s, a):
     """Take 1 inputs a and 1 output s. Return the cnf of the gate s <=> a"""
-    return (s | ~a) & (~s | a)
+    return mk_gate(emit_eq, s, a)
 
 def mk_adder() -> Cnf:
     return mk_xor(s0, a, b) & mk_xor(s, cin, s0) & mk_and(s1, a, b) & mk_and(s2, cin, s0) & mk_or(cout, s1, s2)
@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import tempfile
+
+import circuit.circuit as circ
+
+# This file contains performance benchmarks for the circuit and CNF
+# APIs. Run it without arguments to run all benchmarks, or give the
+# names of the benchmarks to run, e.g. ./bench.py parse
+
+red = '\033[31m'
+blue = '\033[34;1m'
+green = '\033[32m'
+cyan = '\033[36m'
+normal = '\033[0m'
+
+def print_result(message):
+    print (blue + "[RESUL] " + normal + message)
+
+def print_info(message):
+    print (cyan + "[INFO ] " + normal + message)
+
+def benchmarks():
+    files = sorted(f for f in os.listdir('./benchmarks') if f.endswith('.crc'))
+    return ['./benchmarks/' + f for f in files]
+
+def timeit(f, repeat=1):
+    '''Returns the best wall clock time of repeat calls to f().'''
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    return best
+
+def allocated(f):
+    '''Returns the result of f() and the memory it allocated.'''
+    import tracemalloc
+
+    tracemalloc.start()
+    result = f()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+def ripple_carry_adder(width):
+    '''Returns the text of a generated width-bit ripple carry adder.'''
+    a = ['a_%d' % i for i in range(width)]
+    b = ['b_%d' % i for i in range(width)]
+    s = ['s_%d' % i for i in range(width + 1)]
+    lines = ['circ rca%d {' % width,
+             '\tinputs: %s' % ', '.join(a + b),
+             '\toutputs: %s' % ', '.join(s),
+             '\tc_0 = 0']
+    for i in range(width):
+        lines.append('\tp_%d = a_%d ^ b_%d' % (i, i, i))
+        lines.append('\ts_%d = p_%d ^ c_%d' % (i, i, i))
+        lines.append('\tc_%d = (a_%d & b_%d) | (p_%d & c_%d)' % (i+1, i, i, i, i))
+    lines.append('\ts_%d = c_%d' % (width, width))
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+def lookahead_adder(width):
+    '''Returns the text of a generated width-bit adder computing its
+    carries as in the cla benchmarks, g | (a | b) & c.'''
+    a = ['a_%d' % i for i in range(width)]
+    b = ['b_%d' % i for i in range(width)]
+    s = ['s_%d' % i for i in range(width + 1)]
+    lines = ['circ cla%d {' % width,
+             '\tinputs: %s' % ', '.join(a + b),
+             '\toutputs: %s' % ', '.join(s),
+             '\tw_0 = 0']
+    for i in range(width):
+        lines.append('\ts_%d = (a_%d ^ b_%d) ^ w_%d' % (i, i, i, i))
+        lines.append('\tw_%d = (a_%d & b_%d) | ((a_%d | b_%d) & w_%d)' % (i+1, i, i, i, i, i))
+    lines.append('\ts_%d = w_%d' % (width, width))
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+# =============================================================================
+# Parser
+# =============================================================================
+
+def bench_parse():
+    from circuit.circuit import Parser
+    try:
+        import fplparser as fpl
+    except ImportError:
+        # The reference parser needs funcparserlib
+        fpl = None
+        print_info("funcparserlib is not installed, timing the hand-written parser only")
+
+    # Only the parsers are timed, not the construction of the Circuit
+    def compare(name, text, repeat):
+        t_new = timeit(lambda: Parser(text).parse(), repeat)
+        if fpl is None:
+            print_result('%-24s hand-written %9.4fs' % (name, t_new))
+            return
+        t_old = timeit(lambda: fpl.circuit_parts.parse(fpl.tokenize(text)), repeat)
+        print_result('%-24s funcparserlib %9.4fs  hand-written %9.4fs  speedup %5.1fx'
+                     % (name, t_old, t_new, t_old / t_new))
+
+    for bench in benchmarks():
+        with open(bench) as f:
+            compare(os.path.basename(bench), f.read(), 5)
+    for width in [1000, 10000, 100000]:
+        text = ripple_carry_adder(width)
+        compare('rca%d (%d eqs)' % (width, 3*width + 2), text, 1)
+
+def bench_cache():
+    old = os.environ.get('CIRCUIT_CACHE_DIR')
+    try:
+        with tempfile.TemporaryDirectory() as d:
+            os.environ['CIRCUIT_CACHE_DIR'] = d
+            for width in [1000, 10000]:
+                path = os.path.join(d, 'rca%d.crc' % width)
+                with open(path, 'w') as f:
+                    f.write(ripple_carry_adder(width))
+                t_parse = timeit(lambda: circ.parse(path, cache=False))
+                circ.parse(path)
+                t_load = timeit(lambda: circ.parse(path))
+                print_result('%-24s parse %9.4fs  cached %9.4fs  speedup %5.1fx'
+                             % ('rca%d' % width, t_parse, t_load, t_parse / t_load))
+    finally:
+        if old is None:
+            del os.environ['CIRCUIT_CACHE_DIR']
+        else:
+            os.environ['CIRCUIT_CACHE_DIR'] = old
+
+# =============================================================================
+# Simulation
+# =============================================================================
+
+def bench_batch():
+    import random
+    from circuit.batch import pack
+
+    n = 4096
+    for name in ('cra32', 'cla32', 'csa16', 'faulty32'):
+        c = circ.parse('./benchmarks/%s.crc' % name)
+        inputs = sorted(c.getInputs())
+        vectors = [[random.choice([False, True]) for x in inputs] for _ in range(n)]
+        dicts = [dict(zip(inputs, v)) for v in vectors]
+        c.simulate(dicts[0])
+        t_one = timeit(lambda: [c.simulate(v) for v in dicts[:256]], 3) / 256
+        t_batch = timeit(lambda: c.simulate_batch(vectors), 3) / n
+        words = pack(vectors)
+        t_packed = timeit(lambda: c.simulate_batch(words), 3) / n
+        print_result('%-12s simulate %7.2fus  simulate_batch %7.4fus (%5.1fx)  '
+                     'packed %7.4fus (%6.1fx) per vector'
+                     % (name, t_one * 1e6, t_batch * 1e6, t_one / t_batch,
+                        t_packed * 1e6, t_one / t_packed))
+
+def bench_codegen():
+    import random
+
+    for name in ('cra32', 'cla32', 'csa16', 'faulty32'):
+        c = circ.parse('./benchmarks/%s.crc' % name)
+        program = c.compile()
+        vectors = [{x: random.choice([False, True]) for x in c.getInputs()} for _ in range(1000)]
+        c.compiled_eval(vectors[0])
+        c.compiled_eval(vectors[0], outputs = True)
+        t_sim = timeit(lambda: [program.simulate(v) for v in vectors], 3)
+        t_all = timeit(lambda: [c.compiled_eval(v) for v in vectors], 3)
+        t_out = timeit(lambda: [c.compiled_eval(v, outputs = True) for v in vectors], 3)
+        print_result('%-12s Program.simulate %7.2fus  compiled_eval %7.2fus (%4.1fx)  '
+                     'outputs only %7.2fus (%4.1fx) per vector'
+                     % (name, t_sim * 1e3, t_all * 1e3, t_sim / t_all, t_out * 1e3, t_sim / t_out))
+
+# =============================================================================
+# CNF
+# =============================================================================
+
+def bench_cnf():
+    from transform import transform
+    from circuit.cnf import SatVar, Cnf
+
+    c1 = circ.parse('./benchmarks/cra32.crc')
+    c2 = circ.parse('./benchmarks/cla32.crc')
+    t = timeit(lambda: transform(c1, 'c1_') & transform(c2, 'c2_'), 3)
+    print_result('%-24s %9.4fs' % ('miter cra32/cla32', t))
+
+    def chain(n):
+        xs = [SatVar('x%d' % i) for i in range(n + 1)]
+        cnf = Cnf()
+        for i in range(n):
+            cnf = cnf & (~xs[i] | xs[i+1])
+        return cnf
+    for n in [1000, 10000, 100000]:
+        print_result('%-24s %9.4fs' % ('%d times cnf & clause' % n, timeit(lambda: chain(n))))
+
+    # Tseitin transformation of large and deep circuits
+    from circuit.circuit import Parser, Circuit, Variable, BinOp
+    import operator
+    for width in [10000, 100000]:
+        c = Parser(ripple_carry_adder(width)).circuit()
+        result = []
+        t = timeit(lambda: result.append(transform(c)))
+        print_result('%-24s %9.4fs  %8d clauses' % ('transform rca%d' % width, t, len(result[0])))
+    xs = [Variable('x%d' % i) for i in range(100000)]
+    e = xs[0]
+    for x in xs[1:]:
+        e = BinOp(operator.xor, '^', e, x)
+    c = Circuit('parity', xs, [Variable('p')], [(Variable('p'), e)])
+    result = []
+    t = timeit(lambda: result.append(transform(c)))
+    print_result('%-24s %9.4fs  %8d clauses' % ('transform depth 100000', t, len(result[0])))
+
+# =============================================================================
+# SAT solvers
+# =============================================================================
+
+def miter(c1, c2, encoding='tseitin', flatten=False):
+    '''Returns the miter CNF of two circuits with the same inputs and
+    outputs, which is unsatisfiable iff they are equivalent.'''
+    from transform import transform, emit_eq, emit_xor, POSITIVE, BOTH
+    from circuit.cnf import SatVar, Cnf
+
+    cnf = Cnf()
+    transform(c1, 'c1_', cnf, encoding, flatten = flatten)
+    transform(c2, 'c2_', cnf, encoding, flatten = flatten)
+    for x in c1.getInputs():
+        emit_eq(cnf, int(SatVar('c1_' + x)), int(SatVar('c2_' + x)))
+    # The differences are only constrained to be true
+    polarity = POSITIVE if encoding == 'pg' else BOTH
+    diffs = [int(SatVar('miter_' + x)) for x in sorted(c1.getOutputs())]
+    for x, d in zip(sorted(c1.getOutputs()), diffs):
+        emit_xor(cnf, d, int(SatVar('c1_' + x)), int(SatVar('c2_' + x)), polarity)
+    cnf.addClause(diffs)
+    return cnf
+
+def bench_sat():
+    from circuit.cnf import Solver, findSolver
+
+    command = findSolver()
+    if command is None:
+        print_info('No SAT solver executable found, timing the built-in solver only')
+    pairs = [('cra8', 'cla8'), ('cra16', 'cla16'), ('cra16', 'csa16'),
+             ('faulty16', 'cla16'), ('cra32', 'cla32'), ('faulty32', 'cla32'),
+             ('cra32', 'faulty32')]
+    for a, b in pairs:
+        cnf = miter(circ.parse('./benchmarks/%s.crc' % a), circ.parse('./benchmarks/%s.crc' % b))
+        result = []
+        t_cdcl = timeit(lambda: result.append(Solver('cdcl').solve(cnf)))
+        line = '%-24s %-5s cdcl %9.4fs' % ('%s/%s' % (a, b), 'SAT' if result[0] else 'UNSAT', t_cdcl)
+        if command is not None:
+            t_ext = timeit(lambda: Solver('dimacs').solve(cnf))
+            line += '  %s %9.4fs' % (os.path.basename(command), t_ext)
+        print_result(line)
+
+def bench_pg():
+    from circuit.cnf import Solver, VarPool
+    from transform import transform, POSITIVE
+
+    pairs = [('cra16', 'cla16'), ('cra16', 'csa16'), ('faulty16', 'cla16'),
+             ('cra32', 'cla32'), ('faulty32', 'cla32'), ('cra32', 'faulty32')]
+    for a, b in pairs:
+        c1 = circ.parse('./benchmarks/%s.crc' % a)
+        c2 = circ.parse('./benchmarks/%s.crc' % b)
+        with VarPool():
+            full = miter(c1, c2)
+            pg = miter(c1, c2, 'pg')
+            result = []
+            t_full = timeit(lambda: result.append(Solver('cdcl').solve(full)), 3)
+            t_pg = timeit(lambda: result.append(Solver('cdcl').solve(pg)), 3)
+            assert bool(result[0]) == bool(result[-1])
+            print_result('%-20s %-5s clauses %6d -> %6d  solve %7.4fs -> %7.4fs'
+                         % ('%s/%s' % (a, b), 'SAT' if result[0] else 'UNSAT',
+                            len(full), len(pg), t_full, t_pg))
+
+    # The outputs of a miter are compared, so they need both polarities,
+    # and most of the savings come from outputs used with one polarity
+    for name in ('cra32', 'csa16', 'faulty32'):
+        c = circ.parse('./benchmarks/%s.crc' % name)
+        with VarPool():
+            full = transform(c)
+            pg = transform(c, encoding='pg', polarity=dict.fromkeys(c.getOutputs(), POSITIVE))
+            print_result('%-20s outputs true  clauses %6d -> %6d' % (name, len(full), len(pg)))
+
+def bench_flatten():
+    from circuit.circuit import Parser
+    from circuit.cnf import Solver, VarPool
+    from transform import transform
+
+    pairs = [('cra16', 'cla16'), ('cra16', 'csa16'), ('faulty16', 'cla16'),
+             ('cra32', 'cla32'), ('faulty32', 'cla32'), ('cra32', 'faulty32')]
+    for a, b in pairs:
+        c1 = circ.parse('./benchmarks/%s.crc' % a)
+        c2 = circ.parse('./benchmarks/%s.crc' % b)
+        with VarPool():
+            binary = miter(c1, c2)
+            flat = miter(c1, c2, flatten = True)
+            t_binary = timeit(lambda: Solver('cdcl').solve(binary), 3)
+            t_flat = timeit(lambda: Solver('cdcl').solve(flat), 3)
+            print_result('%-20s clauses %6d -> %6d  vars %5d -> %5d  solve %7.4fs -> %7.4fs'
+                         % ('%s/%s' % (a, b), len(binary), len(flat), len(binary.getIds()),
+                            len(flat.getIds()), t_binary, t_flat))
+
+    # Wide gates written as left-deep chains
+    n = 64
+    inputs = ['x%d' % i for i in range(n)]
+    for op in '&|^':
+        text = 'circ chain {\n inputs: %s\n outputs: o\n o = %s\n}\n' % (
+            ', '.join(inputs), (' %s ' % op).join(inputs))
+        c = Parser(text).circuit()
+        with VarPool():
+            binary = transform(c)
+            flat = transform(c, flatten = True)
+            print_result('%-20s clauses %6d -> %6d  vars %5d -> %5d'
+                         % ('%d-input %s chain' % (n, op), len(binary), len(flat),
+                            len(binary.getIds()), len(flat.getIds())))
+
+def bench_simulation():
+    import ec
+    from circuit.circuit import Parser
+
+    def buggy(name):
+        # The first & of the circuit turned into a |
+        with open('./benchmarks/%s.crc' % name) as f:
+            return Parser(f.read().replace('&', '|', 1)).circuit()
+
+    pairs = [('fa', 'fa4'), ('twoa', 'twob'), ('cra16', 'cla16'), ('faulty16', 'cla16'),
+             ('cra32', 'cla32'), ('faulty32', 'cla32'), ('cra32', 'buggy cla32')]
+    for a, b in pairs:
+        c1 = circ.parse('./benchmarks/%s.crc' % a)
+        if b.startswith('buggy '):
+            c2 = buggy(b.split()[1])
+        else:
+            c2 = circ.parse('./benchmarks/%s.crc' % b)
+        found = []
+        t_sim = timeit(lambda: found.append(ec.simulate(c1, c2)), 3)
+        t_sat = timeit(lambda: ec.check(c1, c2, simulation = False), 3)
+        t_check = timeit(lambda: ec.check(c1, c2), 3)
+        print_result('%-20s %-12s simulation %7.4fs  check %7.4fs -> %7.4fs'
+                     % ('%s/%s' % (a, b), 'found' if found[0] else 'not found',
+                        t_sim, t_sat, t_check))
+
+def bench_sweep():
+    import circuit.aig as aig
+    import circuit.fraig as fraig
+    from circuit.circuit import Parser
+    from circuit.cnf import VarPool
+
+    pairs = [('cra16', 'cla16'), ('cra16', 'csa16'), ('faulty16', 'cla16'),
+             ('cra32', 'cla32'), ('faulty32', 'cla32'), ('cra32', 'faulty32')]
+    circuits = [(a + '/' + b, circ.parse('./benchmarks/%s.crc' % a),
+                 circ.parse('./benchmarks/%s.crc' % b)) for a, b in pairs]
+    # Beyond the benchmarks: generated adders with different carry chains
+    for width in (64, 128, 256):
+        circuits.append(('rca%d/cla%d' % (width, width),
+                         Parser(ripple_carry_adder(width)).circuit(),
+                         Parser(lookahead_adder(width)).circuit()))
+    for name, c1, c2 in circuits:
+        result = []
+        t_sweep = timeit(lambda: result.append(fraig.check(c1, c2)[0]))
+        g = aig.miter(aig.fromCircuit(c1), aig.fromCircuit(c2))
+        with VarPool():
+            s = fraig.Sweeper(g)
+            s.sweep(g.cone([g.getLiteral('miter_output')]))
+        line = '%-20s %-5s sweep %8.4fs  %5d -> %5d ands  %4d sat calls' % (
+            name, 'EQ' if result[0] else 'DIFF', t_sweep, s.stats['nodes'],
+            s.stats['fraig nodes'], s.stats['sat calls'])
+        if len(c1.getInputs()) <= 128:
+            t_sat = timeit(lambda: result.append(aig.check(c1, c2)[0]))
+            assert result[0] == result[-1]
+            line += '  monolithic %8.4fs' % t_sat
+        print_result(line)
+
+def bench_preprocess():
+    from circuit.cnf import Solver, VarPool, Cnf, Clause
+    from circuit.preprocess import Preprocessor
+
+    pairs = [('cra16', 'cla16'), ('cra16', 'csa16'), ('faulty16', 'cla16'),
+             ('cra32', 'cla32'), ('faulty32', 'cla32'), ('cra32', 'faulty32')]
+    for a, b in pairs:
+        with VarPool():
+            cnf = miter(circ.parse('./benchmarks/%s.crc' % a), circ.parse('./benchmarks/%s.crc' % b))
+            p = Preprocessor(cnf)
+            t_pre = timeit(lambda: p.simplify())
+            # None means that the preprocessor proved unsatisfiability
+            simplified = Preprocessor(cnf).simplify() or Cnf([Clause()])
+            t_plain = timeit(lambda: Solver('cdcl').solve(cnf))
+            t_simp = timeit(lambda: Solver('cdcl', preprocess = True).solve(cnf))
+            print_result('%-20s clauses %6d -> %6d  vars %5d -> %5d  preprocess %7.4fs  '
+                         'solve %7.4fs -> %7.4fs'
+                         % ('%s/%s' % (a, b), len(cnf), len(simplified), len(cnf.getIds()),
+                            len(simplified.getIds()), t_pre, t_plain, t_simp))
+
+def bench_dimacs():
+    from transform import transform
+    from circuit.circuit import Parser
+    from circuit.cnf import VarPool, readDimacs
+
+    # The string based writer and a line by line reader, for comparison
+    def join(cnf, f):
+        f.write(b'p cnf %d %d\n' % (cnf.maxVar, len(cnf)))
+        for c in cnf.iterClauses():
+            f.write((' '.join(map(str, c)) + ' 0\n').encode())
+    def lines(path):
+        clauses = []
+        with open(path) as f:
+            for line in f:
+                if line[0] not in 'cp':
+                    clauses.append([int(l) for l in line.split()[:-1]])
+        return clauses
+
+    with tempfile.TemporaryDirectory() as d, VarPool():
+        path = os.path.join(d, 'rca.cnf')
+        for width in [10000, 100000]:
+            cnf = transform(Parser(ripple_carry_adder(width)).circuit())
+            name = 'rca%d (%d clauses)' % (width, len(cnf))
+            def write(f):
+                with open(path, 'wb') as g:
+                    f(cnf, g)
+            t_old = timeit(lambda: write(join))
+            t_new = timeit(lambda: write(lambda cnf, g: cnf.writeDimacs(g)))
+            print_result('%-28s write: join %9.4fs  numpy %9.4fs  speedup %5.1fx'
+                         % (name, t_old, t_new, t_old / t_new))
+            t_old = timeit(lambda: lines(path))
+            with VarPool():
+                t_new = timeit(lambda: readDimacs(path))
+            print_result('%-28s read:  lines %8.4fs  numpy %9.4fs  speedup %5.1fx'
+                         % (name, t_old, t_new, t_old / t_new))
+
+def bench_incremental():
+    from transform import transform
+    from circuit.cnf import Solver
+
+    # Enumerate solutions, blocking each one, with one solver for all
+    # calls and with a new solver for each call
+    def solutions(cnf, n, fresh):
+        solver = Solver('cdcl')
+        for _ in range(n):
+            if fresh:
+                solver = Solver('cdcl')
+            solution = solver.solve(cnf)
+            if not solution:
+                break
+            cnf &= ~solution
+    for name in ['cra8', 'cra16']:
+        c = circ.parse('./benchmarks/%s.crc' % name)
+        t_fresh = timeit(lambda: solutions(transform(c), 100, True))
+        t_inc = timeit(lambda: solutions(transform(c), 100, False))
+        print_result('%-24s fresh %9.4fs  incremental %9.4fs  speedup %5.1fx'
+                     % ('%s, 100 solutions' % name, t_fresh, t_inc, t_fresh / t_inc))
+
+# =============================================================================
+# And-Inverter Graphs
+# =============================================================================
+
+def bench_aig():
+    import random
+    from circuit.circuit import Parser
+
+    for width in [1000, 10000]:
+        text = ripple_carry_adder(width)
+        c, m_circ = allocated(lambda: Parser(text).circuit())
+        g, m_aig = allocated(lambda: c.toAig())
+        print_result('%-24s memory: circuit %7.1fMB  aig %7.1fMB  ratio %5.1fx'
+                     % ('rca%d' % width, m_circ / 1e6, m_aig / 1e6, m_circ / m_aig))
+        v = {x: random.choice([False, True]) for x in c.getInputs()}
+        t_circ = timeit(lambda: c.simulate(v), 3)
+        t_aig = timeit(lambda: g.simulate(v), 3)
+        print_result('%-24s simulate: circuit %9.4fs  aig %9.4fs  speedup %5.1fx'
+                     % ('rca%d' % width, t_circ, t_aig, t_circ / t_aig))
+
+# =============================================================================
+# Nodes and literals
+# =============================================================================
+
+def bench_objects():
+    from circuit.circuit import Parser
+    from circuit.cnf import SatVar, VarPool
+
+    def nodes(c):
+        # All nodes of c, shared subexpressions once
+        result = dict()
+        stack = list(c.equations.values())
+        while stack:
+            nd = stack.pop()
+            if id(nd) not in result:
+                result[id(nd)] = nd
+                stack.extend(nd.getChildren())
+        return list(result.values())
+
+    texts = []
+    for bench in benchmarks():
+        with open(bench) as f:
+            texts.append(f.read())
+    suite = [('benchmarks/ (%d files)' % len(texts), texts),
+             ('rca10000', [ripple_carry_adder(10000)])]
+    for name, texts in suite:
+        cs, m = allocated(lambda: [Parser(t).circuit() for t in texts])
+        nds = [nd for c in cs for nd in nodes(c)]
+        print_result('%-24s memory %7.2fMB  %8d nodes  %6.1f bytes/node'
+                     % (name, m / 1e6, len(nds), m / len(nds)))
+        t = timeit(lambda: set(nds).issuperset(nds), 3)
+        print_result('%-24s hash %9.4fs  %6.2f Mnodes/s'
+                     % (name, t, 2 * len(nds) / t / 1e6))
+        t = timeit(lambda: [c.simulate({x: True for x in c.getInputs()}) for c in cs], 3)
+        print_result('%-24s simulate %9.4fs' % (name, t))
+
+    with VarPool():
+        n = 100000
+        xs, m = allocated(lambda: [SatVar('x%d' % i) for i in range(n)])
+        print_result('%-24s memory %7.2fMB  %6.1f bytes/variable'
+                     % ('%d SatVars' % n, m / 1e6, m / n))
+        t = timeit(lambda: [~~x for x in xs], 3)
+        print_result('%-24s %9.4fs  %6.2f Mlits/s' % ('~~x', t, 2 * n / t / 1e6))
+        t = timeit(lambda: [x | ~y | z for x, y, z in zip(xs, xs[1:], xs[2:])], 3)
+        print_result('%-24s %9.4fs  %6.2f Mclauses/s' % ('x | ~y | z', t, n / t / 1e6))
+
+# =============================================================================
+# Main code
+# =============================================================================
+
+if __name__ == '__main__':
+    sys.setrecursionlimit(10000)
+    all_benchmarks = [name[6:] for name in sorted(globals()) if name.startswith('bench_')]
+    for name in sys.argv[1:] or all_benchmarks:
+        print_info("===========================================")
+        print_info("Benchmark: %s" % name)
+        print_info("===========================================")
+        globals()['bench_' + name]()
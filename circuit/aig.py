@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+
+'''And-Inverter Graphs.
+
+An AIG represents a circuit with two-input AND gates and inverters only.
+Nodes are numbered: node 0 is the constant False, the other nodes are
+inputs or AND gates. Edges are literals, i.e. 2*node + c, where the
+complement bit c inverts the edge; so literal 0 is False, literal 1 is
+True and lit ^ 1 is the negation of lit. The two fanins of the AND gates
+are stored in flat integer arrays, and a structural hash table ensures
+that an AND gate over the same two fanins is only created once. Since
+AND gates are created after their fanins, node numbers are a
+topological order.
+
+Named signals (inputs, outputs and internal signals of a circuit) map
+to literals. Use fromCircuit() and Aig.toCircuit() to convert from and
+to Circuit, Aig.simulate() to simulate, Aig.tseitin() to get a CNF and
+check() to check the equivalence of two circuits or AIGs. SAT sweeping
+of AIGs is in circuit.fraig.
+'''
+
+import operator
+from array import array
+
+from circuit.circuit import Literal, Variable, BinOp, UnOp, Circuit, nogc
+from circuit.cnf import SatVar, Clause, Cnf, Solver, VarPool
+
+FALSE = 0
+TRUE = 1
+
+def node(lit):
+    '''Returns the node of literal lit.'''
+    return lit >> 1
+
+def complemented(lit):
+    '''Returns True if literal lit is complemented.'''
+    return lit & 1 == 1
+
+class Aig(object):
+    '''An And-Inverter Graph with named signals.'''
+
+    def __init__(self, name='aig'):
+        self.name = name
+        # Fanin literals per node; -1 for the constant and the inputs
+        self.left = array('i', [-1])
+        self.right = array('i', [-1])
+        self.strash = dict()
+        self.inputs = []
+        self.outputs = []
+        self.signals = dict()
+
+    def __len__(self):
+        return len(self.left)
+
+    def getInputs(self):
+        '''Returns the list of input names, in creation order.'''
+        return self.inputs
+
+    def getOutputs(self):
+        '''Returns the list of output names.'''
+        return self.outputs
+
+    def getSignals(self):
+        '''Returns the names of all named signals, inputs included.'''
+        return self.signals.keys()
+
+    def getLiteral(self, x):
+        '''Returns the literal of the named signal x.'''
+        return self.signals[x]
+
+    def getAndCount(self):
+        '''Returns the number of AND gates.'''
+        return len(self.left) - 1 - len(self.inputs)
+
+    def isAnd(self, n):
+        '''Returns True if node n is an AND gate.'''
+        return self.left[n] >= 0
+
+    def getFanins(self, n):
+        '''Returns the two fanin literals of AND gate n.'''
+        return self.left[n], self.right[n]
+
+    def addInput(self, x):
+        '''Creates a new input named x and returns its literal.'''
+        if x in self.signals:
+            raise ValueError("signal '%s' already defined" % x)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.inputs.append(x)
+        lit = self.signals[x] = 2 * (len(self.left) - 1)
+        return lit
+
+    def setSignal(self, x, lit):
+        '''Names literal lit x.'''
+        self.signals[x] = lit
+
+    def addOutput(self, x, lit):
+        '''Names literal lit x and makes it an output.'''
+        self.signals[x] = lit
+        self.outputs.append(x)
+
+    def mkAnd(self, a, b):
+        '''Returns the literal of a & b.'''
+        if a > b:
+            a, b = b, a
+        if a == FALSE or a == b ^ 1:
+            return FALSE
+        if a == TRUE or a == b:
+            return b
+        # Both fanins packed in one int: smaller and faster than a tuple
+        k = a << 32 | b
+        try:
+            return self.strash[k]
+        except KeyError:
+            self.left.append(a)
+            self.right.append(b)
+            lit = self.strash[k] = 2 * (len(self.left) - 1)
+            return lit
+
+    def mkOr(self, a, b):
+        '''Returns the literal of a | b.'''
+        return self.mkAnd(a ^ 1, b ^ 1) ^ 1
+
+    def mkXor(self, a, b):
+        '''Returns the literal of a ^ b.'''
+        return self.mkAnd(self.mkAnd(a, b ^ 1) ^ 1, self.mkAnd(a ^ 1, b) ^ 1) ^ 1
+
+    def copy(self, other, prefix=''):
+        '''Copies the AND gates of AIG other into this AIG, which must
+        already have inputs with the names of the inputs of other. The
+        named signals of other are named here with the given prefix.
+        Returns the list mapping the nodes of other to literals.'''
+
+        lits = [FALSE] * len(other)
+        for x in other.inputs:
+            lits[node(other.signals[x])] = self.signals[x]
+        for n in range(1, len(other)):
+            a = other.left[n]
+            if a >= 0:
+                b = other.right[n]
+                lits[n] = self.mkAnd(lits[a >> 1] ^ (a & 1), lits[b >> 1] ^ (b & 1))
+        for x, lit in other.signals.items():
+            self.signals[prefix + x] = lits[lit >> 1] ^ (lit & 1)
+        return lits
+
+    def cone(self, lits):
+        '''Returns a list of flags, True for the nodes in the fan-in cones
+        of the given literals.'''
+
+        mark = [False] * len(self)
+        for lit in lits:
+            mark[lit >> 1] = True
+        for n in range(len(self) - 1, 0, -1):
+            if mark[n] and self.left[n] >= 0:
+                mark[self.left[n] >> 1] = True
+                mark[self.right[n] >> 1] = True
+        return mark
+
+    def simulate(self, inputs, mask=True):
+        '''Simulates the AIG. inputs maps input names to Booleans, or to
+        ints holding one vector per bit, in which case mask must have
+        all the used bits set. Returns a dictionary mapping all named
+        signals to their values.'''
+
+        v = self.values(inputs, mask)
+        return {x: (v[lit >> 1] ^ mask) if lit & 1 else v[lit >> 1]
+                for x, lit in self.signals.items()}
+
+    def values(self, inputs, mask=True):
+        '''Like simulate(), but returns the list of the values of all
+        nodes.'''
+
+        v = [mask ^ mask] * len(self)
+        for x in self.inputs:
+            v[self.signals[x] >> 1] = inputs[x]
+        left, right = self.left, self.right
+        for n in range(1, len(self)):
+            a = left[n]
+            if a >= 0:
+                b = right[n]
+                v[n] = ((v[a >> 1] ^ mask) if a & 1 else v[a >> 1]) & \
+                       ((v[b >> 1] ^ mask) if b & 1 else v[b >> 1])
+        return v
+
+    def tseitin(self, prefix='', roots=None, cnf=None):
+        '''Returns the Tseitin transformation of the AIG as a Cnf. Only the
+        cone of the given named signals (all of them by default) is
+        encoded. As for transform.transform(), the variables of named
+        signals get the signal names, with the given prefix. The clauses
+        are added to cnf if given.'''
+
+        if roots is None:
+            roots = list(self.signals)
+        if cnf is None:
+            cnf = Cnf()
+        mark = self.cone(self.signals[x] for x in roots)
+
+        # Nodes are named after the first signal naming their positive
+        # literal, and numbered otherwise, with a '#' that signal names
+        # cannot contain
+        names = dict()
+        for x in self.inputs:
+            names[self.signals[x] >> 1] = prefix + x
+        for x in roots:
+            lit = self.signals[x]
+            if not lit & 1 and not lit >> 1 in names:
+                names[lit >> 1] = prefix + x
+        def var(lit):
+            n = lit >> 1
+            try:
+                v = SatVar(names[n])
+            except KeyError:
+                v = SatVar(prefix + '#aig%d' % n)
+            return ~v if lit & 1 else v
+
+        if mark[0]:
+            cnf &= Clause([var(TRUE)])
+        for n in range(1, len(self)):
+            if mark[n] and self.left[n] >= 0:
+                s, a, b = var(2 * n), var(self.left[n]), var(self.right[n])
+                cnf &= Clause([~s, a])
+                cnf &= Clause([~s, b])
+                cnf &= Clause([s, ~a, ~b])
+        for x in roots:
+            s, l = SatVar(prefix + x), var(self.signals[x])
+            if s != l:
+                cnf &= Clause([~s, l])
+                cnf &= Clause([s, ~l])
+        return cnf
+
+    def toCircuit(self):
+        '''Returns the AIG as a Circuit of & and ~ gates. AND gates that are
+        not named are inlined in the equations of the named signals
+        using them.'''
+
+        with nogc():
+            return self.build()
+
+    def build(self):
+        inputs = set(self.inputs)
+        defs = dict()
+        order = []
+        for x, lit in self.signals.items():
+            if not x in inputs:
+                order.append((lit >> 1, len(order), x))
+        order.sort()
+
+        nodes = [Literal(False)]
+        for n in range(1, len(self)):
+            nodes.append(None)
+        for x in self.inputs:
+            nodes[self.signals[x] >> 1] = Variable(x)
+        def edge(lit):
+            nd = nodes[lit >> 1]
+            if not lit & 1:
+                return nd
+            elif type(nd) is UnOp:
+                return nd.getChild(0)
+            return UnOp(operator.not_, '~', nd)
+
+        eqs = []
+        for n, _, x in order:
+            lit = self.signals[x]
+            if n in defs or not self.isAnd(n):
+                e = edge(lit)
+            else:
+                # Build the gates of the cone of node n not built yet
+                stack = [n]
+                while stack:
+                    m = stack[-1]
+                    a, b = self.left[m], self.right[m]
+                    missing = [k >> 1 for k in (a, b) if nodes[k >> 1] is None]
+                    if missing:
+                        stack.extend(missing)
+                        continue
+                    nodes[m] = BinOp(operator.and_, '&', edge(a), edge(b))
+                    stack.pop()
+                e = edge(lit)
+                defs[n] = x
+                nodes[n] = UnOp(operator.not_, '~', Variable(x)) if lit & 1 else Variable(x)
+            eqs.append((Variable(x), e))
+
+        return Circuit(self.name, [Variable(x) for x in self.inputs],
+                       [Variable(x) for x in self.outputs], eqs)
+
+def fromCircuit(c):
+    '''Returns the AIG of circuit c. Inputs are created in sorted order,
+    and all signals of c are named in the AIG.'''
+
+    with nogc():
+        return convert(c)
+
+def convert(c):
+    g = Aig(c.name)
+    for x in sorted(c.getInputs()):
+        g.addInput(x)
+    signals = g.signals
+    for x in c.order:
+        memo = dict()
+        stack = [c.getEquation(x)]
+        while stack:
+            nd = stack[-1]
+            if id(nd) in memo:
+                stack.pop()
+                continue
+            t = type(nd)
+            if t is Literal:
+                memo[id(nd)] = TRUE if nd.getValue() else FALSE
+            elif t is Variable:
+                memo[id(nd)] = signals[nd.getName()]
+            elif t is BinOp or t is UnOp:
+                missing = [k for k in nd.getChildren() if id(k) not in memo]
+                if missing:
+                    stack.extend(missing)
+                    continue
+                kids = [memo[id(k)] for k in nd.getChildren()]
+                op = nd.getOp()
+                if op == '~':
+                    memo[id(nd)] = kids[0] ^ 1
+                elif op == '&':
+                    memo[id(nd)] = g.mkAnd(kids[0], kids[1])
+                elif op == '|':
+                    memo[id(nd)] = g.mkOr(kids[0], kids[1])
+                elif op == '^':
+                    memo[id(nd)] = g.mkXor(kids[0], kids[1])
+                else:
+                    raise ValueError('Unrecognized operator ' + op)
+            else:
+                raise TypeError('invalid node')
+            stack.pop()
+        signals[x] = memo[id(c.getEquation(x))]
+    g.outputs = sorted(c.getOutputs())
+    return g
+
+def miter(g1, g2):
+    '''Returns the miter of AIGs g1 and g2 (which must have the same
+    inputs and outputs) as a new AIG sharing the inputs. Its signals are
+    the inputs, the signals of g1 and g2 prefixed with c1_ and c2_, and
+    the single output miter_output, which is True iff some output
+    differs. Gates common to both AIGs are shared by structural
+    hashing.'''
+
+    m = Aig('miter')
+    for x in sorted(g1.getInputs()):
+        m.addInput(x)
+    m.copy(g1, 'c1_')
+    m.copy(g2, 'c2_')
+    out = FALSE
+    for x in sorted(g1.getOutputs()):
+        out = m.mkOr(out, m.mkXor(m.signals['c1_' + x], m.signals['c2_' + x]))
+    m.addOutput('miter_output', out)
+    return m
+
+def check(c1, c2):
+    '''Checks the equivalence of c1 and c2, which are Circuits or AIGs, in
+    the same way as ec.check(): returns (True, None) if they are
+    equivalent and (False, counterexample) otherwise. The counterexample
+    maps the input names to Booleans; it is None if the inputs or
+    outputs of c1 and c2 do not match.'''
+
+    g1 = c1 if type(c1) is Aig else fromCircuit(c1)
+    g2 = c2 if type(c2) is Aig else fromCircuit(c2)
+    if not (set(g1.getInputs()) == set(g2.getInputs()) and
+            set(g1.getOutputs()) == set(g2.getOutputs())):
+        return (False, None)
+
+    m = miter(g1, g2)
+    out = m.getLiteral('miter_output')
+    if out == FALSE:
+        return (True, None)
+    if out == TRUE:
+        return (False, {x: False for x in m.getInputs()})
+    with VarPool():
+        cnf = m.tseitin(roots=['miter_output'])
+        cnf &= SatVar('miter_output')
+        solution = Solver().solve(cnf)
+    if not solution:
+        return (True, None)
+    # Inputs outside the cone of the miter output are not in the CNF
+    return (False, {x: solution.assignment.get(x, False) for x in m.getInputs()})
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+'''Bit-parallel batch simulation of circuits.
+
+Input vectors are packed 64 at a time into the bits of numpy uint64
+words: bit j of word w holds the value of vector 64*w + j. Every
+signal of the circuit is then a row of packed words, and each gate of
+the netlist is evaluated for all vectors at once with the bitwise
+operators &, |, ^ and ~. Gates are grouped by logic level and by
+operator, so that a whole level costs a handful of numpy operations,
+independent of the number of gates it contains. The levelized netlist
+is the circuit's compiled Program (see circuit.program).
+'''
+
+import numpy as np
+
+from circuit.program import AND, OR, XOR, NOT, ZERO, ONE
+
+WORD = 64
+
+def pack(bits):
+    '''Pack a Boolean array of shape (n, k) -- n vectors over k signals --
+    into a uint64 array of shape (k, ceil(n/64)). Vector j ends up in
+    bit j % 64 of word j // 64. Padding bits are zero.
+    '''
+
+    bits = np.asarray(bits, dtype=bool)
+    if bits.ndim == 1:
+        bits = bits[:, np.newaxis]
+    n, k = bits.shape
+    nwords = (n + WORD - 1) // WORD
+    padded = np.zeros((k, nwords * WORD), dtype=bool)
+    padded[:, :n] = bits.T
+    b = np.packbits(padded, axis=1, bitorder='little')
+    return np.ascontiguousarray(b).view('<u8').astype(np.uint64, copy=False)
+
+def unpack(words, n=None):
+    '''Inverse of pack(): turn a uint64 array of shape (k, nwords) (or a
+    single row of shape (nwords,)) into a Boolean array of shape (n, k)
+    (or (n,) respectively). If n is None, all 64*nwords vectors are
+    returned.
+    '''
+
+    words = np.asarray(words, dtype=np.uint64)
+    single = words.ndim == 1
+    if single:
+        words = words[np.newaxis, :]
+    b = np.ascontiguousarray(words.astype('<u8', copy=False)).view(np.uint8)
+    bits = np.unpackbits(b, axis=1, bitorder='little').astype(bool)
+    if n is not None:
+        bits = bits[:, :n]
+    return bits[0] if single else bits.T
+
+def simulate_batch(c, inputs):
+    '''Simulate circuit c on many input vectors at once. See
+    Circuit.simulate_batch() for the accepted input formats. Returns a
+    dictionary mapping input, output and internal signal names to rows
+    of packed uint64 words.
+    '''
+
+    names = sorted(c.getInputs())
+    if isinstance(inputs, dict):
+        rows = [np.asarray(inputs[x]) for x in names]
+        if rows and rows[0].dtype == bool:
+            words = pack(np.stack(rows, axis=1))
+        else:
+            words = np.stack(rows).astype(np.uint64, copy=False)
+    else:
+        inputs = np.asarray(inputs)
+        if inputs.dtype == bool:
+            words = pack(inputs.reshape(len(inputs), -1))
+        else:
+            words = inputs.astype(np.uint64, copy=False).reshape(len(names), -1)
+    if words.shape[0] != len(names):
+        raise ValueError('expected values for %d inputs, got %d' % (len(names), words.shape[0]))
+
+    program = c.compile()
+    nwords = words.shape[1]
+    w = np.empty((program.nslots, nwords), dtype=np.uint64)
+    w[ZERO] = 0
+    w[ONE] = ~np.uint64(0)
+    w[ONE + 1:ONE + 1 + len(names)] = words
+
+    for op, dst, a, b in groups(program):
+        if op == AND:
+            w[dst] = w[a] & w[b]
+        elif op == OR:
+            w[dst] = w[a] | w[b]
+        elif op == XOR:
+            w[dst] = w[a] ^ w[b]
+        else:
+            w[dst] = ~w[a]
+
+    return {x: w[s] for x, s in program.slots.items()}
+
+def groups(program):
+    '''Split each level of the program by opcode into index arrays
+    (op, dst, src1, src2), so that every group is a single vectorized
+    numpy operation over all its gates and all words. The result is
+    cached on the program.
+    '''
+
+    try:
+        return program.cache['batch']
+    except KeyError:
+        pass
+    ops = np.frombuffer(program.ops, dtype=np.intc)
+    dst = np.frombuffer(program.dst, dtype=np.intc)
+    src1 = np.frombuffer(program.src1, dtype=np.intc)
+    src2 = np.frombuffer(program.src2, dtype=np.intc)
+    result = []
+    for start, end in program.getLevels():
+        for op in (AND, OR, XOR, NOT):
+            sel = np.flatnonzero(ops[start:end] == op) + start
+            if len(sel):
+                result.append((op, dst[sel].astype(np.intp), src1[sel].astype(np.intp),
+                               src2[sel].astype(np.intp)))
+    program.cache['batch'] = result
+    return result
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+'''On-disk binary cache of parsed circuits (requires numpy).
+
+A circuit is stored as two files named after the SHA-1 hash of the
+source file's content:
+
+  <hash>.npy    a flat int32 array: a header, the node table, the
+                signal table and the input and output name indices
+  <hash>.names  the interned name table, one name per line; the first
+                line is the name of the circuit
+
+Nodes are stored in topological order as (kind, a, b) triples, where a
+and b are node indices for gates, a name index for variables and the
+value for literals. Variables and literals are interned, and shared
+subexpressions are stored once. Signals are stored in the topological
+order of the circuit, so that the loaded circuit is not checked again.
+The equations of a loaded circuit therefore come in topological order
+rather than in the order of the source file, which shows in
+getSignals() and in the printed circuit.
+The array is loaded with numpy.load in mmap mode, so no pickling is
+involved, and the tables are read through memoryviews of the mapping
+rather than copied. Entries are validated before they are decoded;
+entries of another version or with inconsistent tables are deleted.
+
+The cache directory is given by the environment variable
+CIRCUIT_CACHE_DIR and defaults to ~/.cache/circuit.
+'''
+
+import os
+import hashlib
+import operator
+
+import numpy as np
+
+from circuit.circuit import Literal, Variable, BinOp, UnOp, Circuit, nogc
+
+# Bump when the format changes, so that stale entries are never read
+VERSION = 2
+
+# Node kinds
+LIT = 0
+VAR = 1
+AND = 2
+OR = 3
+XOR = 4
+NOT = 5
+
+KINDS = {'&': AND, '|': OR, '^': XOR, '~': NOT}
+
+def directory():
+    '''Returns the cache directory.'''
+    d = os.environ.get('CIRCUIT_CACHE_DIR')
+    if not d:
+        d = os.path.join(os.path.expanduser('~'), '.cache', 'circuit')
+    return d
+
+def key(filename):
+    '''Returns the cache key of a source file, i.e. the hash of its
+    content and of the cache format version.'''
+
+    h = hashlib.sha1(b'circuit-cache-%d\n' % VERSION)
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def encode(c):
+    '''Encode circuit c as a pair (array, names).'''
+
+    names = [c.name]
+    index = dict()
+    def name(x):
+        try:
+            return index[x]
+        except KeyError:
+            index[x] = len(names)
+            names.append(x)
+            return index[x]
+
+    nodes = []
+    memo = dict()
+    interned = dict()
+    def add(entry):
+        nodes.append(entry)
+        return len(nodes) - 1
+
+    signals = []
+    for x in c.order:
+        stack = [c.getEquation(x)]
+        while stack:
+            nd = stack[-1]
+            if id(nd) in memo:
+                stack.pop()
+                continue
+            t = type(nd)
+            if t is Literal or t is Variable:
+                entry = (LIT, int(bool(nd.getValue())), 0) if t is Literal else (VAR, name(nd.getName()), 0)
+                try:
+                    memo[id(nd)] = interned[entry]
+                except KeyError:
+                    memo[id(nd)] = interned[entry] = add(entry)
+                stack.pop()
+            elif t is BinOp or t is UnOp:
+                missing = [k for k in nd.getChildren() if id(k) not in memo]
+                if missing:
+                    stack.extend(missing)
+                    continue
+                kids = [memo[id(k)] for k in nd.getChildren()]
+                memo[id(nd)] = add((KINDS[nd.getOp()], kids[0], kids[-1]))
+                stack.pop()
+            else:
+                raise TypeError('invalid node')
+        signals.append((name(x), memo[id(c.getEquation(x))]))
+
+    inputs = [name(x) for x in sorted(c.getInputs())]
+    outputs = [name(x) for x in sorted(c.getOutputs())]
+    header = [VERSION, len(nodes), len(signals), len(inputs), len(outputs)]
+    body = [v for entry in nodes for v in entry] + [v for s in signals for v in s]
+    return np.array(header + body + inputs + outputs, dtype=np.int32), names
+
+def valid(a, names):
+    '''Returns True if the pair (array, names) is an entry of the current
+    format version whose sizes and indices are consistent, so that it can
+    be decoded.'''
+
+    if a.dtype != np.int32 or a.ndim != 1 or len(a) < 5 or not names:
+        return False
+    version, nnodes, nsignals, ninputs, noutputs = (int(v) for v in a[:5])
+    if version != VERSION or min(nnodes, nsignals, ninputs, noutputs) < 0:
+        return False
+    if len(a) != 5 + 3*nnodes + 2*nsignals + ninputs + noutputs:
+        return False
+
+    table = a[5:5 + 3*nnodes].reshape(-1, 3)
+    kind, x, y = table[:, 0], table[:, 1], table[:, 2]
+    # Gates only refer to the nodes before them
+    before = np.arange(nnodes)
+    gate = (kind >= AND) & (kind <= NOT)
+    if not np.all(gate | (kind == LIT) | (kind == VAR)):
+        return False
+    if np.any(gate & ((x < 0) | (x >= before) | (y < 0) | (y >= before))):
+        return False
+    if np.any((kind == VAR) & ((x < 0) | (x >= len(names)))):
+        return False
+    if np.any((kind == LIT) & (x != 0) & (x != 1)):
+        return False
+
+    rest = a[5 + 3*nnodes:]
+    signals = rest[:2*nsignals]
+    nodes = signals[1::2]
+    if np.any((nodes < 0) | (nodes >= nnodes)):
+        return False
+    refs = np.concatenate((signals[::2], rest[2*nsignals:]))
+    return not np.any((refs < 0) | (refs >= len(names)))
+
+def decode(a, names):
+    '''Rebuild a Circuit from the pair (array, names) made by encode().
+    The pair must be valid().'''
+
+    m = memoryview(a)
+    version, nnodes, nsignals, ninputs, noutputs = m[:5]
+    pos = 5
+    table = m[pos:pos + 3*nnodes]
+    pos += 3*nnodes
+    signals = m[pos:pos + 2*nsignals]
+    pos += 2*nsignals
+    inputs = m[pos:pos + ninputs]
+    outputs = m[pos + ninputs:pos + ninputs + noutputs]
+
+    with nogc():
+        return build(names, table, signals, inputs, outputs)
+
+def build(names, table, signals, inputs, outputs):
+    nodes = []
+    for i in range(0, len(table), 3):
+        kind, x, y = table[i], table[i+1], table[i+2]
+        if kind == AND:
+            nd = BinOp(operator.and_, '&', nodes[x], nodes[y])
+        elif kind == OR:
+            nd = BinOp(operator.or_, '|', nodes[x], nodes[y])
+        elif kind == XOR:
+            nd = BinOp(operator.xor, '^', nodes[x], nodes[y])
+        elif kind == NOT:
+            nd = UnOp(operator.not_, '~', nodes[x])
+        elif kind == VAR:
+            nd = Variable(names[x])
+        elif kind == LIT:
+            nd = Literal(x == 1)
+        else:
+            raise ValueError('invalid node kind %d' % kind)
+        nodes.append(nd)
+
+    eqs = [(Variable(names[signals[i]]), nodes[signals[i+1]]) for i in range(0, len(signals), 2)]
+    order = [names[x] for x in signals[::2]]
+    return Circuit(names[0], [Variable(names[x]) for x in inputs],
+                   [Variable(names[x]) for x in outputs], eqs, order)
+
+def load(k):
+    '''Returns the cached circuit for key k, or None if there is none.'''
+
+    path = os.path.join(directory(), k)
+    try:
+        with open(path + '.names', 'r') as f:
+            names = f.read().split('\n')
+        a = np.load(path + '.npy', mmap_mode='r')
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        # Unreadable entry, e.g. a truncated file
+        a = None
+    if a is None or not valid(a, names):
+        remove(k)
+        return None
+    return decode(a, names)
+
+def remove(k):
+    '''Remove the entry for key k from the cache, if any.'''
+
+    path = os.path.join(directory(), k)
+    for ext in ('.npy', '.names'):
+        try:
+            os.remove(path + ext)
+        except OSError:
+            pass
+
+def store(k, c):
+    '''Store circuit c in the cache under key k. Failures to write the
+    cache are silently ignored.'''
+
+    with nogc():
+        a, names = encode(c)
+    path = os.path.join(directory(), k)
+    try:
+        os.makedirs(directory(), exist_ok=True)
+        # Write to temporary files first, so that concurrent readers
+        # never see partial entries
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp + '.npy', 'wb') as f:
+            np.save(f, a)
+        with open(tmp + '.names', 'w') as f:
+            f.write('\n'.join(names))
+        os.replace(tmp + '.names', path + '.names')
+        os.replace(tmp + '.npy', path + '.npy')
+    except OSError:
+        pass
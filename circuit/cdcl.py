@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+
+'''A small CDCL SAT solver in pure Python.
+
+The solver works on DIMACS literals (non-zero integers) at its
+interface, and internally on dense literals 2*v + s, where v is the
+variable number and s = 1 for negated literals, so that ~l is l ^ 1
+and per-literal data lives in flat lists. It implements:
+
+ * propagation with two watched literals: the watched literals of a
+   clause are its first two, and watches[l] lists the clauses watching
+   l, which are visited when l becomes false
+ * conflict analysis with 1-UIP learning and local minimization of the
+   learned clause
+ * VSIDS decisions (with a lazy heap) and phase saving
+ * Luby restarts
+ * learned clause deletion, keeping the clauses with low LBD (number of
+   distinct decision levels) and most recent activity
+ * incremental solving: clauses can be added between calls to solve(),
+   which keep the learned clauses, and solve() takes assumptions
+
+Use Cdcl directly (addClause(), solve(), getModel(), getFailed()) or through
+circuit.cnf.Solver with the 'cdcl' backend.
+'''
+
+import heapq
+
+def luby(i):
+    '''Returns the i-th element (from 0) of the Luby sequence 1 1 2 1 1 2 4 ...'''
+    size, seq = 1, 0
+    while size < i + 1:
+        seq += 1
+        size = 2 * size + 1
+    while size - 1 != i:
+        size = (size - 1) >> 1
+        seq -= 1
+        i = i % size
+    return 1 << seq
+
+class Cdcl(object):
+    '''CDCL SAT solver. Add clauses with addClause(), then call solve().'''
+
+    # Restart interval unit, in conflicts
+    RESTART = 100
+    # VSIDS decay factor
+    DECAY = 0.95
+
+    def __init__(self):
+        self.ids = dict()           # DIMACS variable -> variable
+        self.names = []             # variable -> DIMACS variable
+        self.values = []            # literal -> 1 (true), -1 (false), 0
+        self.levels = []            # variable -> decision level
+        self.reasons = []           # variable -> clause or None
+        self.activity = []          # variable -> VSIDS activity
+        self.phases = []            # variable -> saved phase (sign bit)
+        self.watches = []           # literal -> clauses watching it
+        self.seen = []
+        self.heap = []
+        self.clauses = []
+        self.learnts = []
+        self.trail = []
+        self.limits = []            # trail size at each decision level
+        self.head = 0               # next trail literal to propagate
+        self.increment = 1.0
+        self.ok = True
+        self.conflicts = 0
+        self.decisions = 0
+        self.propagations = 0
+        self.maxLearnts = None
+        self.model = None
+        self.failed = []
+
+    def variable(self, x):
+        # Returns the variable of DIMACS variable x, creating it if needed
+        try:
+            return self.ids[x]
+        except KeyError:
+            v = self.ids[x] = len(self.names)
+            self.names.append(x)
+            self.values += [0, 0]
+            self.levels.append(0)
+            self.reasons.append(None)
+            self.activity.append(0.0)
+            self.phases.append(1)
+            self.watches += [[], []]
+            self.seen.append(False)
+            heapq.heappush(self.heap, (0.0, v))
+            return v
+
+    def literal(self, l):
+        # Returns the literal of DIMACS literal l
+        return 2 * self.variable(abs(l)) + (l < 0)
+
+    def addClause(self, lits):
+        '''Adds a clause of DIMACS literals. Returns False if the clauses are
+        now trivially unsatisfiable.'''
+
+        if not self.ok:
+            return False
+        if self.limits:
+            self.cancel(0)
+        values = self.values
+        clause = []
+        for l in sorted(set(self.literal(l) for l in lits)):
+            if values[l] == 1 or (clause and clause[-1] == l ^ 1):
+                return True
+            if values[l] == 0:
+                clause.append(l)
+        if not clause:
+            self.ok = False
+        elif len(clause) == 1:
+            self.assign(clause[0], None)
+            self.ok = self.propagate() is None
+        else:
+            self.clauses.append(clause)
+            self.watches[clause[0]].append(clause)
+            self.watches[clause[1]].append(clause)
+        return self.ok
+
+    def assign(self, l, reason):
+        v = l >> 1
+        self.values[l] = 1
+        self.values[l ^ 1] = -1
+        self.levels[v] = len(self.limits)
+        self.reasons[v] = reason
+        self.trail.append(l)
+
+    def cancel(self, level):
+        # Backtracks to decision level level
+        if len(self.limits) <= level:
+            return
+        values, reasons, phases = self.values, self.reasons, self.phases
+        activity, heap = self.activity, self.heap
+        trail = self.trail
+        start = self.limits[level]
+        for i in range(len(trail) - 1, start - 1, -1):
+            l = trail[i]
+            v = l >> 1
+            values[l] = values[l ^ 1] = 0
+            reasons[v] = None
+            phases[v] = l & 1
+            heapq.heappush(heap, (-activity[v], v))
+        del trail[start:]
+        del self.limits[level:]
+        self.head = start
+
+    def propagate(self):
+        # Propagates the trail, returns a conflicting clause or None
+        values, levels, reasons = self.values, self.levels, self.reasons
+        watches, trail = self.watches, self.trail
+        level = len(self.limits)
+        head = self.head
+        conflict = None
+        while head < len(trail):
+            false = trail[head] ^ 1
+            head += 1
+            ws = watches[false]
+            i = j = 0
+            n = len(ws)
+            while i < n:
+                c = ws[i]
+                i += 1
+                # Make sure the false literal is c[1]
+                first = c[0]
+                if first == false:
+                    first = c[0] = c[1]
+                    c[1] = false
+                if values[first] == 1:
+                    ws[j] = c
+                    j += 1
+                    continue
+                # Look for a new literal to watch
+                for k in range(2, len(c)):
+                    l = c[k]
+                    if values[l] != -1:
+                        c[1] = l
+                        c[k] = false
+                        watches[l].append(c)
+                        break
+                else:
+                    ws[j] = c
+                    j += 1
+                    if values[first] == -1:
+                        conflict = c
+                        while i < n:
+                            ws[j] = ws[i]
+                            j += 1
+                            i += 1
+                    else:
+                        values[first] = 1
+                        values[first ^ 1] = -1
+                        levels[first >> 1] = level
+                        reasons[first >> 1] = c
+                        trail.append(first)
+            del ws[j:]
+            if conflict is not None:
+                break
+        self.propagations += head - self.head
+        self.head = head
+        return conflict
+
+    def bump(self, v):
+        a = self.activity[v] = self.activity[v] + self.increment
+        if a > 1e100:
+            # Rescale all activities, and rebuild the heap
+            self.activity = [x * 1e-100 for x in self.activity]
+            self.increment *= 1e-100
+            self.heap = [(-a, u) for u, a in enumerate(self.activity)]
+            heapq.heapify(self.heap)
+        elif self.values[2 * v] == 0:
+            heapq.heappush(self.heap, (-a, v))
+
+    def analyze(self, conflict):
+        # Returns the 1-UIP learned clause of conflict, with the asserting
+        # literal first and a literal of the backtrack level second
+        levels, reasons, seen, trail = self.levels, self.reasons, self.seen, self.trail
+        level = len(self.limits)
+        learnt = [0]
+        marked = []
+        pending = 0
+        p = None
+        i = len(trail) - 1
+        c = conflict
+        while True:
+            for q in (c if p is None else c[1:]):
+                v = q >> 1
+                if not seen[v] and levels[v] > 0:
+                    seen[v] = True
+                    marked.append(v)
+                    self.bump(v)
+                    if levels[v] >= level:
+                        pending += 1
+                    else:
+                        learnt.append(q)
+            while not seen[trail[i] >> 1]:
+                i -= 1
+            p = trail[i]
+            i -= 1
+            c = reasons[p >> 1]
+            seen[p >> 1] = False
+            pending -= 1
+            if pending == 0:
+                break
+        learnt[0] = p ^ 1
+
+        # Drop the literals implied by other literals of the clause
+        kept = [learnt[0]]
+        for q in learnt[1:]:
+            r = reasons[q >> 1]
+            if r is None or not all(seen[l >> 1] or levels[l >> 1] == 0 for l in r[1:]):
+                kept.append(q)
+        for v in marked:
+            seen[v] = False
+
+        if len(kept) > 1:
+            best = max(range(1, len(kept)), key=lambda k: levels[kept[k] >> 1])
+            kept[1], kept[best] = kept[best], kept[1]
+        return kept
+
+    def reduce(self):
+        # Deletes half of the learned clauses, keeping the ones which are
+        # the reason of an assignment and the ones with LBD 2
+        values, reasons = self.values, self.reasons
+        def locked(c):
+            return values[c[0]] == 1 and reasons[c[0] >> 1] is c
+        self.learnts.sort(key=lambda e: (e[0], -e[1]))
+        half = len(self.learnts) // 2
+        kept = []
+        for k, e in enumerate(self.learnts):
+            if k < half or e[0] <= 2 or locked(e[2]):
+                kept.append(e)
+        self.learnts = kept
+        self.watches = [[] for _ in self.watches]
+        for c in self.clauses:
+            self.watches[c[0]].append(c)
+            self.watches[c[1]].append(c)
+        for e in kept:
+            self.watches[e[2][0]].append(e[2])
+            self.watches[e[2][1]].append(e[2])
+
+    def decide(self):
+        # Returns the next decision literal, or None if all variables
+        # are assigned
+        values, activity, heap = self.values, self.activity, self.heap
+        while heap:
+            a, v = heapq.heappop(heap)
+            if values[2 * v] == 0 and -a == activity[v]:
+                return 2 * v + self.phases[v]
+        for v in range(len(self.names)):
+            if values[2 * v] == 0:
+                return 2 * v + self.phases[v]
+        return None
+
+    def solve(self, assumptions = ()):
+        '''Solves the clauses added so far, under the given assumptions
+        (DIMACS literals assumed true for this call only). Returns True
+        if they are satisfiable, in which case getModel() returns a
+        model. Otherwise, getFailed() returns the assumptions used to
+        prove unsatisfiability (empty if the clauses are unsatisfiable
+        on their own). Learned clauses are kept from one call to the
+        next.'''
+
+        self.model = None
+        self.failed = []
+        if not self.ok:
+            return False
+        self.cancel(0)
+        assumed = [self.literal(l) for l in assumptions]
+        restarts = 0
+        budget = self.RESTART * luby(restarts)
+        if self.maxLearnts is None:
+            self.maxLearnts = len(self.clauses) // 3 + 1000
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                budget -= 1
+                if not self.limits:
+                    self.ok = False
+                    return False
+                learnt = self.analyze(conflict)
+                if len(learnt) == 1:
+                    self.cancel(0)
+                    self.assign(learnt[0], None)
+                else:
+                    levels = self.levels
+                    lbd = len(set(levels[l >> 1] for l in learnt))
+                    self.cancel(levels[learnt[1] >> 1])
+                    self.learnts.append((lbd, self.conflicts, learnt))
+                    self.watches[learnt[0]].append(learnt)
+                    self.watches[learnt[1]].append(learnt)
+                    self.assign(learnt[0], learnt)
+                self.increment /= self.DECAY
+            else:
+                if budget <= 0:
+                    restarts += 1
+                    budget = self.RESTART * luby(restarts)
+                    self.cancel(0)
+                if len(self.learnts) - len(self.trail) >= self.maxLearnts:
+                    self.reduce()
+                    self.maxLearnts = int(self.maxLearnts * 1.1)
+                # The first decision levels are the assumptions
+                l = None
+                while len(self.limits) < len(assumed):
+                    a = assumed[len(self.limits)]
+                    if self.values[a] == 1:
+                        self.limits.append(len(self.trail))
+                    elif self.values[a] == -1:
+                        self.failed = self.analyzeFinal(a)
+                        return False
+                    else:
+                        l = a
+                        break
+                if l is None:
+                    l = self.decide()
+                if l is None:
+                    self.model = self.getModel()
+                    return True
+                self.decisions += 1
+                self.limits.append(len(self.trail))
+                self.assign(l, None)
+
+    def analyzeFinal(self, a):
+        # Returns the assumptions (as DIMACS literals) implying that
+        # assumption a is false, including a
+        levels, reasons, seen, trail = self.levels, self.reasons, self.seen, self.trail
+        failed = [a]
+        if levels[a >> 1] > 0:
+            seen[a >> 1] = True
+            for i in range(len(trail) - 1, self.limits[0] - 1, -1):
+                v = trail[i] >> 1
+                if seen[v]:
+                    seen[v] = False
+                    if reasons[v] is None:
+                        failed.append(trail[i])
+                    else:
+                        for q in reasons[v][1:]:
+                            if levels[q >> 1] > 0:
+                                seen[q >> 1] = True
+        names = self.names
+        return [names[l >> 1] * (-1 if l & 1 else 1) for l in failed]
+
+    def getModel(self):
+        '''Returns the model found by the last call to solve(), as a
+        dictionary mapping DIMACS variables to Booleans.'''
+        if self.model is not None:
+            return self.model
+        return {x: self.values[2 * v] == 1 for v, x in enumerate(self.names)}
+
+    def getFailed(self):
+        '''Returns the failed assumptions of the last call to solve().'''
+        return self.failed
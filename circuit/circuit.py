@@ -1,14 +1,55 @@
 #!/usr/bin/env python3
 
+import gc
+import enum
+import operator
+import contextlib
+
 class BrokenCircuitException(Exception):
     '''This exception is thrown by the constructor of the Cicruit class if
     it detects either undefined signals or combinational loops.
     '''
     pass
 
+@contextlib.contextmanager
+def nogc():
+    '''Context manager pausing the cyclic garbage collector. Building
+    or analyzing large circuits allocates millions of acyclic objects,
+    so the collector has nothing to find; pausing it avoids repeated
+    scans of the growing heap.
+    '''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+class Gate(enum.IntEnum):
+    '''Kind of a logic gate (OpNode).'''
+
+    AND = 0
+    OR = 1
+    XOR = 2
+    NOT = 3
+
+    @staticmethod
+    def fromOp(opstr):
+        '''Get the gate kind of an operator string (&, |, ^ or ~)'''
+        try:
+            return OPKINDS[opstr]
+        except KeyError:
+            raise ValueError('Unrecognized operator ' + opstr)
+
+OPKINDS = {'&': Gate.AND, '|': Gate.OR, '^': Gate.XOR, '~': Gate.NOT}
+OPSTRINGS = ('&', '|', '^', '~')
+FUNCTIONS = (operator.and_, operator.or_, operator.xor, operator.not_)
+
 class Node(object):
     '''Base class for circuit nodes'''
 
+    __slots__ = ('kids', 'id')
     __nextid__ = 0
     
     def __init__(self):
@@ -20,7 +61,7 @@ class Node(object):
         return self.id < other.id
 
     def __hash__(self):
-        return hash(7879 + self.id) * hash(type(self))
+        return self.id
         
     def getID(self):
         '''Get unique node id (as int)'''
@@ -39,12 +80,28 @@ class Node(object):
         self.kids[i] = nd
         
     def support(self):
-        return set()
+        '''Get the set of signal names used in the expression rooted at
+        this node. Shared subexpressions are visited once.'''
+        ys = set()
+        seen = set()
+        stack = [self]
+        while stack:
+            nd = stack.pop()
+            if id(nd) in seen:
+                continue
+            seen.add(id(nd))
+            if type(nd) is Variable:
+                ys.add(nd.name)
+            else:
+                stack.extend(nd.kids)
+        return ys
 
 class Literal(Node):
     '''A circuit node representing a constant Boolean value, which is
     either True or False.
     '''
+
+    __slots__ = ('value',)
     
     def __init__(self, b):
         Node.__init__(self)
@@ -66,6 +123,8 @@ class Literal(Node):
 class Variable(Node):
     '''A circuit node representing a named internal or input signal.'''
 
+    __slots__ = ('name',)
+
     def __init__(self, name):
         Node.__init__(self)
         self.name = name
@@ -81,71 +140,87 @@ class Variable(Node):
         return {self.name}
 
 class OpNode(Node):
-    '''Abstract base class for unary and binary logic gates.'''
+    '''Abstract base class for unary and binary logic gates. The gate
+    function is given by its kind (a Gate); the function object and the
+    operator string passed to the constructors are derived from it.'''
+
+    __slots__ = ('kind',)
+
+    def getKind(self):
+        '''Get the kind of the gate (a Gate)'''
+        return self.kind
 
     def getOp(self):
         '''Get a string representation of the node's function'''
-        return self.opstr
+        return OPSTRINGS[self.kind]
 
     def getFun(self):
         '''Get the gate function of the node'''
-        return self.f
+        return FUNCTIONS[self.kind]
 
 class BinOp(OpNode):
     '''A circuit node representing a binary logic gate.'''
+
+    __slots__ = ()
     
     def __init__(self, f, opstr, x, y):
         Node.__init__(self)
         self.kids = [x, y]
-        self.f = f
-        self.opstr = opstr
+        self.kind = Gate.fromOp(opstr)
 
     def __repr__(self):
-        return ('(%s %s %s)' % (self.kids[0], self.opstr, self.kids[1]))
+        return ('(%s %s %s)' % (self.kids[0], OPSTRINGS[self.kind], self.kids[1]))
 
     def eval(self, x, y):
         '''Evaluate the node's function with the given inputs'''
-        return self.f(x, y)
-
-    def support(self):
-        return self.getChild(0).support() | self.getChild(1).support()
+        return FUNCTIONS[self.kind](x, y)
 
 class UnOp(OpNode):
     '''A circuit node representing a unary logic gate.'''
 
+    __slots__ = ()
+
     def __init__(self, f, opstr, x):
         Node.__init__(self)
         self.kids = [x]
-        self.f = f
-        self.opstr = opstr
+        self.kind = Gate.fromOp(opstr)
 
     def __repr__(self):
-        return ('(%s %s)' % (self.opstr, self.kids[0]))
+        return ('(%s %s)' % (OPSTRINGS[self.kind], self.kids[0]))
 
     def eval(self, x):
         '''Evaluate the node's function with the given input'''
-        return self.f(x)
-
-    def support(self):
-        return self.getChild(0).support()
+        return FUNCTIONS[self.kind](x)
 
     
 class Circuit(object):
     '''Class representing a logic circuit.'''
     
-    def __init__(self, name, inputs, outputs, eqs):
+    def __init__(self, name, inputs, outputs, eqs, order=None):
+        '''If order is given, the circuit is trusted to be correct and
+        order to be its topological order (see check()), which is then
+        not recomputed. This is meant for circuits that were checked
+        before, such as the ones loaded from the cache.'''
         self.name = name
         self.inputs = {x.name for x in inputs}
         self.outputs = {x.name for x in outputs}
         self.equations = dict()
         for (x,e) in eqs:
             self.equations[x.name] = e
-        self.check()
+        if order is None:
+            self.invalidate()
+        else:
+            self.program = None
+            self.dependencyIndex = None
+            self.order = order
 
     def check(self):
         '''Perform sanity checks on the circuit: all outputs defined, all
         inputs unconstrained, no undefined signals, no combinational
-        loops. This function is called by the constructor. 
+        loops. This function is called by the constructor. Runs in
+        linear time and returns the signals with an equation in
+        topological order, i.e. every signal comes after all signals
+        it depends on. The constructor stores this order in self.order.
         '''
 
         # Check that all outputs are defined
@@ -158,93 +233,97 @@ class Circuit(object):
             if x in self.equations.keys():
                 raise BrokenCircuitException("Over-constrained input '%s' " % x)
 
+        # Collect the signals each equation depends on directly
+        deps = {x: e.support() for x, e in self.equations.items()}
+
         # Check that only defined signals are used
-        deps = {x: self.equations[x].support() for x in self.equations.keys()}
         signals = self.inputs | self.outputs | self.equations.keys()
         for x,ys in deps.items():
             for y in ys:
                 if not y in signals:
                     raise BrokenCircuitException("Undefined signal '%s'" % y)
-                    
-        # Check that there are no combinational loops in the circuit
-        for x in deps.keys():
-            stack = []
-            def visit(y):
-                if y in stack:
-                    raise BrokenCircuitException("Combinational loop detected: %s -> %s" % (' -> '.join(stack), y))
-                if not y in deps.keys():
-                    return
-                stack.append(y)
-                for z in deps[y]:
-                    visit(z)
-                stack.pop()
-            visit(x)
+
+        # Sort the signals topologically (Kahn's algorithm)
+        fanout = {x: [] for x in deps}
+        indegree = dict()
+        for x, ys in deps.items():
+            n = 0
+            for y in ys:
+                if y in fanout:
+                    fanout[y].append(x)
+                    n += 1
+            indegree[x] = n
+        order = [x for x, n in indegree.items() if n == 0]
+        for y in order:
+            for x in fanout[y]:
+                indegree[x] -= 1
+                if indegree[x] == 0:
+                    order.append(x)
+
+        # Signals left over are on or behind a combinational loop. Every
+        # one of them depends on another one, so following such
+        # dependencies must eventually run into a loop.
+        if len(order) < len(deps):
+            left = {x for x, n in indegree.items() if n > 0}
+            path = []
+            index = dict()
+            x = next(iter(left))
+            while not x in index:
+                index[x] = len(path)
+                path.append(x)
+                x = min(y for y in deps[x] if y in left)
+            loop = path[index[x]:] + [x]
+            raise BrokenCircuitException("Combinational loop detected: %s" % ' -> '.join(loop))
+
+        return order
 
     def clean(self):
-        '''Clean up the structure of the circuit: Collapse nodes with single
-        fanout, remove dead nodes.
+        '''Returns a cleaned up copy of the circuit: constants and
+        identities propagated, identical gates shared, nodes with single
+        fanout collapsed and dead nodes removed (see circuit.optimize).
+        The circuit itself is left unchanged. The returned circuit has an
+        attribute stats counting the applied simplifications.
         '''
 
-        # Collapse non-fanout nodes
-        signals = self.outputs | self.equations.keys() | self.inputs
-        fanout = {s: set() for s in signals}
-        deps = {x: self.equations[x].support() for x in self.equations.keys()}        
-        for x, ys in deps.items():
-            for y in ys:
-                fanout[y].add(x)
-        collapse = {x for x,ys in fanout.items() if len(ys) == 1}.difference(self.inputs)
-        print ("======================")
-        print ("COLLAPSE:")
-        print (collapse)
-        print ("======================")
-        def eval(nd, a, b):
-            f = nd.getFun()
-            return Literal(f(a.getValue(), b.getValue()))
-        for x in self.getSignals():
-            def subst(nd):
-                if type(nd) == Variable:
-                    y = nd.getName()
-                    if y in collapse:
-                        return subst(self.equations[y])
-                    else:
-                        return nd
-                elif type(nd) == UnOp:
-                    nd.setChild(0, subst(nd.getChild(0)))
-                    return nd
-                elif type(nd) == BinOp:
-                    c1 = subst(nd.getChild(0))
-                    c2 = subst(nd.getChild(1))
-                    if type(c1) is Literal and type(c2) is Literal:
-                        return eval(nd, c1, c2)
-                    else:
-                        nd.setChild(0, c1)
-                        nd.setChild(1, c2)
-                        return nd
-                else:
-                    return nd
-            e = self.equations[x]
-            self.equations[x] = subst(e)
-
-        # Remove dead nodes
-        deps = {x: self.equations[x].support() for x in self.equations.keys()}
-        def dependencies(x):
-            try:
-                return deps[x]
-            except KeyError:
-                return set()
-        reachable = {x for x in self.outputs}
-        while True:
-            imgs = [dependencies(x) for x in reachable]
-            nextReachable = {y for dep in imgs for y in dep}
-            if nextReachable.issubset(reachable):
-                break
-            reachable |= nextReachable
-        dead = signals.difference(reachable).difference(self.inputs)
-        print ("DEAD:")
-        print (dead)
-        print ("======================")
-        for s in dead:
-            del self.equations[s]
+        from circuit.optimize import clean
+        return clean(self)
+
+    def invalidate(self):
+        '''Drop all structures derived from the equations: the topological
+        order, the compiled program and the dependency index. This must be
+        called whenever the equations or their nodes are changed; it also
+        re-checks the circuit.
+        '''
+
+        self.program = None
+        self.dependencyIndex = None
+        with nogc():
+            self.order = self.check()
+
+    def index(self):
+        '''Returns the dependency Index of the circuit (see circuit.index):
+        signal numbering, direct dependencies, fanout, logic levels,
+        support sets, fan-in cones and the nodes of the equations with
+        their number of parents. The index is built on first use and
+        cached until the next call to invalidate().
+        '''
+
+        if self.dependencyIndex is None:
+            from circuit.index import Index
+            with nogc():
+                self.dependencyIndex = Index(self)
+        return self.dependencyIndex
+
+    def compile(self):
+        '''Returns the compiled, levelized Program of the circuit (see
+        circuit.program). The program is built on first use and cached
+        until the next call to invalidate().
+        '''
+
+        if self.program is None:
+            from circuit.program import Program
+            self.program = Program(self)
+        return self.program
                         
     def getInputs(self):
         '''Returns the set of input identifiers.
@@ -278,83 +357,78 @@ class Circuit(object):
         and internal signal names to Boolean values.
         '''
 
-        value = {i: x for (i,x) in inputs.items()}
-        
-        def sim(node):
-            if type(node) == Literal:
-                return node.value
-            elif type(node) == Variable:
-                x = node.name
-                try:
-                    return value[x]
-                except KeyError:
-                    y = sim(self.getEquation(x))
-                    value[x] = y
-                    return y
-            elif type(node) == UnOp:
-                y = sim(node.getChild(0))
-                return node.eval(y)
-            elif type(node) == BinOp:
-                y = sim(node.getChild(0))
-                z = sim(node.getChild(1))
-                return node.eval(y, z)
-            else:
-                raise "Invalid node type."
+        return self.compile().simulate(inputs)
+
+    def compiled_eval(self, inputs, mask=True, outputs=False):
+        '''Like simulate(), but runs a straight-line Python function
+        generated for this circuit (see circuit.codegen). The inputs may
+        also be Python ints used as bit-vectors, simulating many vectors
+        at once; mask must then have all used bits set, e.g. (1 << n) - 1.
+        If outputs is True, only the outputs are returned, which is
+        faster.
+        '''
+
+        from circuit.codegen import evaluator
+        return evaluator(self.compile(), outputs)(inputs, mask)
+
+    def simulate_batch(self, inputs):
+        '''Simulate the circuit on many input vectors at once, 64 vectors
+        per uint64 word (requires numpy). The inputs are given either as
+        a Boolean array of shape (n, k) with one row per vector and one
+        column per input, as a uint64 array of shape (k, nwords) of
+        already packed words, or as a dictionary mapping input names to
+        Boolean arrays of shape (n,) or packed words of shape (nwords,).
+        Columns/rows are ordered by sorted input name. Returns a
+        dictionary mapping input, output and internal signal names to
+        packed uint64 words; use circuit.batch.unpack() to get Booleans
+        back.
+        '''
 
-        signals = self.getSignals()
-        for x in signals:
-            value[x] = sim(self.getEquation(x))
-        return {s: x for (s,x) in value.items() if s in signals | self.inputs}
+        from circuit.batch import simulate_batch
+        return simulate_batch(self, inputs)
+
+    def toAig(self):
+        '''Returns the circuit as an And-Inverter Graph (see circuit.aig).'''
+
+        from circuit.aig import fromCircuit
+        return fromCircuit(self)
 
     def dot(self):
+        '''Returns the circuit as a graph in the dot format of Graphviz.
+        The signals and gates are listed in the order of the dependency
+        index (see index()), so the output does not change between runs.'''
+        index = self.index()
         s = 'digraph %s {\n' % self.name
         s += '  rankdir="LR";\n'
-        for x in self.getInputs():
-            s += '  %s [label=\"%s\", shape=circle];\n' % (x, x)        
-        for x in self.getOutputs():
-            s += '  %s [label=\"%s\", shape=diamond];\n' % (x, x)
-        signals = [x for x in self.getSignals() if not x in self.getOutputs()]
-        for x in signals:
-            s += '  %s [label=\"%s\", shape=hexagon];\n' % (x, x)        
+        for x in index.signals:
+            if x in self.inputs:
+                shape = 'circle'
+            elif x in self.outputs:
+                shape = 'diamond'
+            else:
+                shape = 'hexagon'
+            s += '  %s [label=\"%s\", shape=%s];\n' % (x, x, shape)
         drawn = dict()
-        def draw(nd):
-            if nd in drawn.keys():
-                return ''
-            elif type(nd) is Literal:
-                s = '\t%d [label="%d", shape=rect];\n' % (nd.getID(), nd.getValue())
-                drawn[nd] = str(nd.getID())
-                return s
-            elif type(nd) is Variable:
-                drawn[nd] = nd.getName()
-                return ''
-            elif type(nd) is UnOp:
-                s = draw(nd.getChild(0))
-                cid = drawn[nd.getChild(0)]
-                myid = str(nd.getID())
-                s += '  %s [label="%s", shape=square, style=filled, color=gray];\n' % (myid, nd.getOp())
-                s += '  %s -> %s;\n' % (cid, myid)
-                drawn[nd] = myid
-                return s
-            elif type(nd) is BinOp:
-                s = draw(nd.getChild(0))
-                s += draw(nd.getChild(1))
+        for nd in index.getNodes():
+            t = type(nd)
+            if t is Literal:
+                s += '  %d [label="%d", shape=rect];\n' % (nd.getID(), nd.getValue())
+                drawn[nd.id] = str(nd.getID())
+            elif t is Variable:
+                drawn[nd.id] = nd.getName()
+            elif t is UnOp or t is BinOp:
                 myid = str(nd.getID())
-                lid = drawn[nd.getChild(0)]
-                rid = drawn[nd.getChild(1)]
                 s += '  %s [label="%s", shape=square, style=filled, color=gray];\n' % (myid, nd.getOp())
-                s += '  %s -> %s;\n' % (lid, myid)
-                s += '  %s -> %s;\n' % (rid, myid)
-                drawn[nd] = myid
-                return s
+                for k in nd.getChildren():
+                    s += '  %s -> %s;\n' % (drawn[k.id], myid)
+                drawn[nd.id] = myid
             else:
                 raise TypeError('invalid node')
-        for x in self.getSignals():
-            e = self.getEquation(x)
-            s += draw(e)
-            s += '  %s -> %s' % (drawn[e], x)
+        for x in self.order:
+            s += '  %s -> %s;\n' % (drawn[self.getEquation(x).id], x)
         s += '}'
         return s
-    
+
     def __repr__(self):
         s = 'circ %s {\n' % self.name
         s += '\tinputs: %s\n' % ', '.join(sorted(self.inputs))
@@ -366,183 +440,222 @@ class Circuit(object):
 
 # ========================================================================= Parser
 
-from funcparserlib.parser import *
-from funcparserlib.parser import with_forward_decls
-from tokenize import generate_tokens, TokenInfo
-from io import StringIO
-from functools import reduce
-
-import token
-
-# FIXME: There seems to be an inconsistency between the token.type and
-# the type constants defined in token!
-MY_NEWLINE = 58
-
-def tokenize(s):
-    return [t for t in  generate_tokens(StringIO(s).readline)
-            if t.type not in [token.ENDMARKER, token.NEWLINE, MY_NEWLINE]]
-
-def tokval(tok):
-    return tok.string
-
-def make_bool(s):
-    return s == '1'
-
-# @RULE:
-# boolean ::= '1' | '0'
-boolean = (
-    some(lambda tok: tok.type == token.NUMBER and tok.string in ['1','0'])
-    >> tokval
-    >> make_bool
-    >> Literal
-)
-
-# @RULE
-# variable ::= NAME (as Variable)
-variable = (
-    some(lambda tok: tok.type == token.NAME)
-    >> tokval
-    >> Variable
-)
-
-# @RULE
-# variable ::= NAME (as string)
-name = (
-    some(lambda tok: tok.type == token.NAME)
-    >> tokval
-)
-
-# Operator functor
-op = (
-    lambda s: some(lambda tok: tok.type == token.OP and tok.string == s)
-    >> tokval
-)
-
-comma = op(',')
-
-# Keyword functor
-keyword = (
-    lambda s: some(lambda tok: tok.type == token.NAME and tok.string == s)
-    >> tokval
-    )
-
-# @KEYWORD 'inputs'
-inp = keyword('inputs')
-
-# @KEYWORD 'outputs'
-outp = keyword('outputs')
-
-# @KEYWORD 'circ'
-circ = keyword('circ')
-
-const = lambda x: lambda _: x
-
-# Functor for operator construction. Returns a parser functor that
-# results in the second argument f, the function associated with the
-# operator.
-makeop = lambda s, f: op(s) >> const(f)
-
-# Functor constructing a binary node
-def make_node(f, opstr):
-    return lambda x, y: BinOp(f, opstr, x, y)
-
-# Functor constructing a unary node
-def make_unode(f, opstr):
-    return lambda x: UnOp(f, opstr, x)
-
-# Functor constructing an output, which is just a pair of a variable
-# and an expression
-def make_output(x, e):
-    return (x, e)
-
-# Binary operators
-import operator
-and_ = makeop('&', make_node(operator.and_, '&'))
-or_  = makeop('|', make_node(operator.or_,'|'))
-xor  = makeop('^', make_node(operator.xor,'^'))
-not_ = makeop('~', make_unode(operator.not_,'~'))
-asgn = makeop('=', make_output)
-
-# Evaluate a tree-ish expression by folding (reducing) it
-def eval_expr(z, l):
-    return reduce(lambda s, y: y[0](s, y[1]), l, z)
-
-# Evaluate a unary expression
-def eval_uexpr(f, x):
-    return f(x)
-
-# Evaluate a binary expression
-def eval_binexpr(x, f, y):
-    return f(x, y)
-
-# Assemble nested list
-def assemble(x, y):
-    if type(y) is list:
-        return [x] + y
-    else:
-        return [x, y]
-
-# Currying 
-unarg = lambda f: lambda x: f(*x)
-
-# Curried functors for evaluation functions and constructors
-f = unarg(eval_expr)
-g = unarg(eval_uexpr)
-h = unarg(eval_binexpr)
-collect = unarg(assemble)
-make_circ = unarg(Circuit)
-
-# @RULE:
-# primary ::= boolean | variable | '(' expr ')'
-@with_forward_decls
-def primary():
-    return boolean | variable | ((op('(') + expr + op(')')) >> (lambda x: x[1]))
-
-# @RULE
-# literal ::= not primary | primary
-literal = not_ + primary >> g | primary
-
-# @RULE
-# minterm ::= literal (and literal)*
-minterm = literal + many(and_ + literal) >> f
-
-# @RULE
-# esop ::= minterm (xor minterm)*
-esop = minterm + many(xor + minterm) >> f
-
-# @RULE
-# expr ""= esop (or esop)*
-expr = esop + many(or_ + esop) >> f
-
-# @RULE
-# assign = variable '=' expr
-assign = variable + asgn + expr >> h
-
-# @RULE
-# varlist ::= variable (',' variable)*
-varlist = variable + many(skip(comma) + variable) >> collect
-
-# @RULE
-# inputs ::= 'inputs' ':' varlist
-inputs = skip(inp) + skip(op(':')) + varlist
-
-# @RULE
-# outputs ::= 'outputs' ':' varlist
-outputs = skip(outp) + skip(op(':')) + varlist
-
-# @RULE
-# body ::= (assign)*
-body = many(assign)
-
-# @RULE
-# circuit ::= 'circ' name '{' inputs outputs body '}' EOF
-circuit =  (skip(circ) + name
-            + skip(op('{'))
-            + inputs
-            + outputs
-            + body
-            + skip(op('}'))
-            + skip(finished)) >> make_circ
+# The grammar of .crc files:
+#
+#   circuit ::= 'circ' NAME '{' inputs outputs body '}' EOF
+#   inputs  ::= 'inputs' ':' varlist
+#   outputs ::= 'outputs' ':' varlist
+#   varlist ::= NAME (',' NAME)*
+#   body    ::= (NAME '=' expr)*
+#   expr    ::= esop ('|' esop)*
+#   esop    ::= minterm ('^' minterm)*
+#   minterm ::= literal ('&' literal)*
+#   literal ::= '~' primary | primary
+#   primary ::= '1' | '0' | NAME | '(' expr ')'
+#
+# Binary operators are left-associative. The parser below is a plain
+# recursive descent parser over a lazy regular-expression scanner, so
+# it runs in a single linear pass and never materializes a token list.
+
+import re
+import mmap
+
+class ParseException(Exception):
+    '''This exception is thrown by the parser on syntax errors. It
+    records the line number, the text of the offending line and the
+    column range of the offending token.
+    '''
+
+    def __init__(self, message, lineNo, line, start, end):
+        Exception.__init__(self, message)
+        self.lineNo = lineNo
+        self.line = line
+        self.start = start
+        self.end = end
+
+# Token kinds, i.e. the group numbers of the scanner
+NAME = 1
+NUMBER = 2
+OP = 3
+BAD = 4
+
+scanner = re.compile(r'\s*(?:([^\W\d]\w*)|(\d\w*)|([{}():,=&|^~])|(\S))')
+bscanner = re.compile(rb'\s*(?:([^\W\d]\w*)|(\d\w*)|([{}():,=&|^~])|(\S))')
+
+# Chunk size for scanning memory-mapped text in error reports
+CHUNK = 1 << 20
+
+class Parser(object):
+    '''Recursive descent parser for the .crc format. The text is either a
+    string or a bytes-like object, such as a memory-mapped file. Signal
+    names in bytes-like text are restricted to ASCII.
+    '''
+
+    def __init__(self, text):
+        self.text = text
+        self.binary = not isinstance(text, str)
+        self.strings = dict()
+        if self.binary:
+            self.tokens = bscanner.finditer(text)
+        else:
+            self.tokens = scanner.finditer(text)
+        self.advance()
+
+    def advance(self):
+        m = next(self.tokens, None)
+        self.tok = m
+        if m is None:
+            self.kind = None
+            self.val = None
+        else:
+            self.kind = m.lastindex
+            val = m.group(self.kind)
+            if self.binary:
+                # Decode each distinct token once; this also shares the
+                # name strings between all nodes using them.
+                try:
+                    val = self.strings[val]
+                except KeyError:
+                    val = self.strings[val] = val.decode('ascii', 'replace')
+            self.val = val
+
+    def error(self):
+        text = self.text
+        nl = b'\n' if self.binary else '\n'
+        if self.tok is None:
+            pos = len(text)
+            while pos > 0 and text[pos-1:pos].isspace():
+                pos -= 1
+            end = pos
+            what = 'end of file'
+        else:
+            pos = self.tok.start(self.kind)
+            end = self.tok.end(self.kind)
+            what = "token '%s'" % self.val
+        first = text.rfind(nl, 0, pos) + 1
+        last = text.find(nl, pos)
+        if last < 0:
+            last = len(text)
+        lineNo = 1
+        for i in range(0, pos, CHUNK):
+            lineNo += text[i:min(i + CHUNK, pos)].count(nl)
+        line = text[first:last]
+        if self.binary:
+            line = line.decode('ascii', 'replace')
+        raise ParseException('Syntax error in line %d: unexpected %s' % (lineNo, what),
+                             lineNo, line.rstrip('\r'), pos - first, end - first)
+
+    def expect(self, val):
+        if self.val != val:
+            self.error()
+        self.advance()
+
+    def keyword(self, val):
+        if self.kind != NAME or self.val != val:
+            self.error()
+        self.advance()
+
+    def name(self):
+        if self.kind != NAME:
+            self.error()
+        x = self.val
+        self.advance()
+        return x
+
+    def varlist(self):
+        xs = [Variable(self.name())]
+        while self.val == ',':
+            self.advance()
+            xs.append(Variable(self.name()))
+        return xs
+
+    def primary(self):
+        kind, val = self.kind, self.val
+        if kind == NAME:
+            self.advance()
+            return Variable(val)
+        elif kind == NUMBER and (val == '1' or val == '0'):
+            self.advance()
+            return Literal(val == '1')
+        elif val == '(':
+            self.advance()
+            x = self.expr()
+            self.expect(')')
+            return x
+        self.error()
+
+    def literal(self):
+        if self.val == '~':
+            self.advance()
+            return UnOp(operator.not_, '~', self.primary())
+        return self.primary()
+
+    def minterm(self):
+        x = self.literal()
+        while self.val == '&':
+            self.advance()
+            x = BinOp(operator.and_, '&', x, self.literal())
+        return x
+
+    def esop(self):
+        x = self.minterm()
+        while self.val == '^':
+            self.advance()
+            x = BinOp(operator.xor, '^', x, self.minterm())
+        return x
+
+    def expr(self):
+        x = self.esop()
+        while self.val == '|':
+            self.advance()
+            x = BinOp(operator.or_, '|', x, self.esop())
+        return x
+
+    def header(self):
+        '''Parse the circuit header. Returns the tuple (name, inputs,
+        outputs).'''
+
+        self.keyword('circ')
+        name = self.name()
+        self.expect('{')
+        self.keyword('inputs')
+        self.expect(':')
+        inputs = self.varlist()
+        self.keyword('outputs')
+        self.expect(':')
+        outputs = self.varlist()
+        return (name, inputs, outputs)
+
+    def equations(self):
+        '''Generator parsing the circuit body, up to the end of the file.
+        Yields the equations as (variable, expression) pairs as soon as
+        they are recognized.'''
+
+        while self.kind == NAME:
+            x = Variable(self.val)
+            self.advance()
+            self.expect('=')
+            yield (x, self.expr())
+        self.expect('}')
+        if self.tok is not None:
+            self.error()
+
+    def parse(self):
+        '''Parse a whole circuit. Returns the tuple (name, inputs, outputs,
+        equations) of arguments for the Circuit constructor.'''
+
+        with nogc():
+            name, inputs, outputs = self.header()
+            return (name, inputs, outputs, list(self.equations()))
+
+    def circuit(self):
+        '''Parse a whole circuit and return it as a Circuit object. The
+        equations are streamed into the Circuit constructor while they are
+        parsed.'''
+
+        with nogc():
+            name, inputs, outputs = self.header()
+            return Circuit(name, inputs, outputs, self.equations())
 
 
 red = '\033[31m'
@@ -558,32 +671,63 @@ def print_error(message):
     print (red + "[ERROR] " + normal + message)
 
 
+def read(filename, stream=False):
+    '''Parse a circuit from a given file, without error reporting or
+    caching. See parse().'''
+
+    if stream:
+        with open(filename, 'rb') as f:
+            try:
+                text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                text = b''
+        # The mapping is released with the parser
+        return Parser(text).circuit()
+    else:
+        with open(filename, 'r') as f:
+            return Parser(f.read()).circuit()
+
 # main parse function
-def parse(filename):
-    '''Parse a circuit from a given file'''
+def parse(filename, stream=False, cache=True):
+    '''Parse a circuit from a given file. If stream is True, the file is
+    memory-mapped and tokenized incrementally instead of being read
+    into memory, which keeps the peak memory close to the size of the
+    resulting circuit for very large files. Unless cache is False, and
+    if numpy is available, parsed circuits are kept in a binary on-disk cache
+    (see circuit.cache) and loaded from there as long as the content of
+    the file does not change. In stream mode, circuits are loaded from
+    the cache but not stored, as encoding them would need about as much
+    memory again as the circuit itself.
+    Circuits loaded from the cache list their equations in topological
+    order rather than in source order.
+    '''
 
     print_info("Parsing file '%s'" % filename)
     try:
-        with open(filename, 'r') as f:
-            s = f.read()
-            tok = tokenize(s)
-            return circuit.parse(tok)
+        store = None
+        if cache:
+            try:
+                import circuit.cache as store
+            except ImportError:
+                pass
+        if store is None:
+            return read(filename, stream)
+        key = store.key(filename)
+        c = store.load(key)
+        if c is None:
+            c = read(filename, stream)
+            if not stream:
+                store.store(key, c)
+        return c
     except FileNotFoundError as e:
         print_error("Could not open file '%s'" % filename)
         raise e
     except BrokenCircuitException as e:
         print_error("%s" % e)
         raise e
-    except NoParseError as e:
-        epos = e.state.pos
-        etok = tok[epos]
-        line = etok.line
-        start = etok.start[1]
-        end = etok.end[1]
-        lineNo = etok.start[0]
-        print_error("Syntax error in line %d:" % lineNo)
-        print_error("%s" % line.replace('\n',''))
-        print_error((' '*start) + ('~'*(end-start+1)))
+    except ParseException as e:
+        print_error("Syntax error in line %d:" % e.lineNo)
+        print_error("%s" % e.line)
+        print_error((' '*e.start) + ('~'*(e.end-e.start+1)))
         raise e
-            
-        
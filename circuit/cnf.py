@@ -3,110 +3,347 @@
 import satispy
 from satispy.solver import Minisat
 from functools import reduce
+from array import array
+import os
+import shutil
+import subprocess
+import tempfile
+import itertools
+import io
+import abc
+import weakref
 
 def maxvar(clauses):
     m = 0
     for c in clauses:
-        for l in c.literals:
+        for l in c:
             m = max(m, l.id)
     return m
 
-class Cnf(object):
+class ClauseSink(abc.ABC):
+    '''Interface of the consumers of clauses. Producers such as the Tseitin
+    transformation call addClause() once per clause, so that clauses go
+    straight to their destination: a Cnf (in-memory store), a
+    DimacsSink (file) or a Solver. Subclasses implement addClause().
+    '''
+
+    @abc.abstractmethod
+    def addClause(self, lits):
+        '''Adds a clause given as a list of DIMACS literals (non-zero
+        integers, negative for negated variables).'''
+
+    def add(self, x):
+        '''Adds the clauses of x, which is a Cnf, a Clause or a SatVar.'''
+        if type(x) is Cnf:
+            for c in x.iterClauses():
+                self.addClause(c)
+        elif type(x) is Clause:
+            self.addClause([int(l) for l in x])
+        elif type(x) is SatVar:
+            self.addClause([int(x)])
+        else:
+            raise TypeError('incompatible types')
+
+class DimacsSink(ClauseSink):
+    '''Writes clauses to a file in DIMACS format as they come. The header
+    is written first with room for the counts, which are filled in by
+    close(). Clauses are buffered and written in chunks (see
+    circuit.dimacs). Use as a context manager to close the file
+    automatically.
+    '''
+
+    HEADER = b'p cnf %-10d %-10d\n'
+
+    def __init__(self, filename):
+        self.file = open(filename, 'wb')
+        self.size = 0
+        self.maxVar = 0
+        self.buffer = ClauseStore()
+        self.file.write(DimacsSink.HEADER % (0, 0))
+
+    def addClause(self, lits):
+        buffer = self.buffer
+        buffer.lits.extend(lits)
+        buffer.offsets.append(len(buffer.lits))
+        self.size += 1
+        for l in lits:
+            if l > self.maxVar or -l > self.maxVar:
+                self.maxVar = abs(l)
+        if len(buffer.lits) >= (1 << 20):
+            self.flush()
+
+    def flush(self):
+        '''Writes the buffered clauses.'''
+        from circuit.dimacs import encode
+        import numpy as np
+
+        buffer = self.buffer
+        if len(buffer.offsets) > 1:
+            self.file.write(encode(np.frombuffer(buffer.lits, np.int32),
+                                   np.frombuffer(buffer.offsets, np.int32)).tobytes())
+        self.buffer = ClauseStore()
+
+    def close(self):
+        '''Writes the header and closes the file.'''
+        self.flush()
+        self.file.seek(0)
+        self.file.write(DimacsSink.HEADER % (self.maxVar, self.size))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ClauseStore(object):
+    '''Flat clause database: the literals of all clauses, as DIMACS
+    integers, concatenated in one array, and the offset of each clause
+    in another one (clause i is lits[offsets[i]:offsets[i+1]]). Stores
+    are append-only, so several Cnf objects can share a store, each one
+    seeing a prefix of its clauses.
+    '''
+
+    def __init__(self):
+        self.lits = array('i')
+        self.offsets = array('i', [0])
+
+class Cnf(ClauseSink):
     '''Represents a Boolean formula in conjunctive normal form (CNF) or
     product of sum form (POS).
+
+    The clauses are stored in a ClauseStore. The result of cnf & x
+    shares the store of cnf if cnf is the last CNF appended to it, so
+    that building a CNF with repeated & takes amortized constant time
+    per clause, and cnf itself is left unchanged. The Clause and SatVar
+    objects given to the operators are not kept; the clauses property
+    rebuilds them on demand.
+
+    A CNF is tied to a VarPool, the current one when it is created. An
+    empty CNF takes the pool of the first clauses added to it.
     '''
-    
-    def __init__(self, clauses = []):
+
+    def __init__(self, clauses = [], pool = None):
         '''Constructor. If defined, the CNF is initialized with the given set of clauses.'''
 
-        self.clauses = [cl for cl in clauses]
-        self.variables = set()
+        self.store = ClauseStore()
+        self.size = 0
+        self.maxVar = 0
+        self.pool = pool if pool is not None else VarPool.current()
         for c in clauses:
-            self.variables |= {l.name for l in c.literals}
-        self.maxVar = maxvar(clauses)
+            self.extend(c)
 
     def className(self):
         return 'Cnf'
 
-    def __and__(self, other):
+    def __len__(self):
+        return self.size
+
+    def isTip(self):
+        '''Returns True if the clauses of this CNF are the last ones of its
+        store, i.e. if clauses can be added without copying.'''
+        return self.size == len(self.store.offsets) - 1
+
+    def detach(self):
+        '''Copies the clauses of this CNF into a store of its own.'''
+        store = ClauseStore()
+        store.lits = self.store.lits[:self.store.offsets[self.size]]
+        store.offsets = self.store.offsets[:self.size + 1]
+        self.store = store
+
+    def view(self):
+        '''Returns a CNF with the same clauses, to which clauses can be
+        added without changing this one.'''
+        cnf = Cnf(pool = self.pool)
+        cnf.store, cnf.size, cnf.maxVar = self.store, self.size, self.maxVar
+        if not self.isTip():
+            cnf.detach()
+        return cnf
+
+    def addClause(self, lits):
+        '''Adds a clause given as a list of DIMACS literals (non-zero
+        integers, negative for negated variables).'''
+        if not self.isTip():
+            self.detach()
+        store = self.store
+        store.lits.extend(lits)
+        store.offsets.append(len(store.lits))
+        self.size += 1
+        for l in lits:
+            if l > self.maxVar or -l > self.maxVar:
+                self.maxVar = abs(l)
+
+    def getClause(self, i):
+        '''Returns clause i as an array of DIMACS literals.'''
+        offsets = self.store.offsets
+        return self.store.lits[offsets[i]:offsets[i + 1]]
+
+    def iterClauses(self):
+        '''Iterates over the clauses as arrays of DIMACS literals.'''
+        lits, offsets = self.store.lits, self.store.offsets
+        for i in range(self.size):
+            yield lits[offsets[i]:offsets[i + 1]]
+
+    def adopt(self, pool):
+        # Checks that variables of pool can be added
+        if pool is not self.pool:
+            if self.size > 0:
+                raise ValueError('variables of another VarPool')
+            self.pool = pool
+
+    def extend(self, other):
+        '''Adds the clauses of other, which is a Cnf, a Clause or a SatVar.'''
         if type(other) is Cnf:
-            return Cnf([l for l in self.clauses + other.clauses])
-        elif other.className() == 'Clause':
-            return Cnf([l for l in self.clauses + [other]])
-        elif other.className() == 'SatVar':
-            return Cnf(self.clauses + [Clause([other])])
+            self.adopt(other.pool)
+            if not self.isTip():
+                self.detach()
+            store = self.store
+            end = other.store.offsets[other.size]
+            lits = other.store.lits[:end]
+            offsets = other.store.offsets[1:other.size + 1]
+            base = len(store.lits)
+            store.lits.extend(lits)
+            store.offsets.extend(array('i', [o + base for o in offsets]))
+            self.size += other.size
+            self.maxVar = max(self.maxVar, other.maxVar)
+        elif type(other) is Clause:
+            for l in other:
+                self.adopt(l.pool)
+            self.addClause([int(l) for l in other])
+        elif type(other) is SatVar:
+            self.adopt(other.pool)
+            self.addClause([int(other)])
         else:
             raise TypeError('incompatible types')
 
+    @property
+    def clauses(self):
+        '''The list of clauses, as Clause objects.'''
+        return [Clause([self.pool.literal(l) for l in c]) for c in self.iterClauses()]
+
+    @property
+    def variables(self):
+        '''The set of the names of the variables used in the clauses.'''
+        names = self.pool.names
+        return {names[i] for i in self.getIds()}
+
+    def getIds(self):
+        '''Returns the set of the ids of the variables used in the clauses.'''
+        return set(map(abs, self.store.lits[:self.store.offsets[self.size]]))
+
+    def add(self, x):
+        self.extend(x)
+
+    def __and__(self, other):
+        cnf = self.view()
+        cnf.extend(other)
+        return cnf
+
     def __iand__(self, other):
-        if type(other) is Cnf:
-            self.clauses += [l for l in other.clauses]
-            self.variables |= other.variables
-            self.maxVar = max(self.maxVar, other.maxVar)
-            return self
-        elif other.className() == 'Clause':
-            self.clauses.append(other)
-            self.variables |= {l.name for l in other.literals}
-            self.maxVar = max(self.maxVar, maxvar([other]))
-            return self
-        elif other.className() == 'SatVar':
-            self.clauses.append(Clause([other]))
-            self.variables.add(other.name)
-            self.maxVar = max(self.maxVar, other.id)
-            return self
-        else:
-            raise TypeError('incompatible types')
+        self.extend(other)
         return self
 
     def dimacs(self):
         '''Dump CNF in DIMACS format'''
 
-        s = 'p cnf %d %d\n' % (self.maxVar, len(self.clauses))
-        cls = [c.dimacs() for c in self.clauses]
-        s += '\n'.join(cls)
-        return s        
+        f = io.BytesIO()
+        self.writeDimacs(f)
+        s = f.getvalue().decode()
+        # No line break after the last clause
+        return s[:-1] if self.size else s
+
+    def writeDimacs(self, f, names = False):
+        '''Writes the CNF in DIMACS format to the binary file object f. If
+        names is True, the names of the variables are written as well,
+        in comment lines "c <id> <name>" that readDimacs() understands.'''
+        from circuit.dimacs import write
+        write(self, f, names)
             
     def __repr__(self):
         cls = [str(c) for c in self.clauses]
         s = ' & '.join(cls)
         return s        
         
+
+def readDimacs(f, pool = None):
+    '''Reads a CNF in DIMACS format from f, a file name or a binary file
+    object, into a Cnf over pool (by default the current VarPool). The
+    comment lines "c <id> <name>" written by Cnf.writeDimacs() give the
+    names of the variables; the other variables are named x<id>.'''
+    from circuit.dimacs import read
+    return read(f, pool)
+
     
 class Clause(object):
-    '''Represents a clause, which is a disjunction of literals.'''
+    '''Represents a clause, which is a disjunction of literals.
+
+    A clause built with | shares its list of literals with the clause
+    it extends, if that clause is the last one built from the list: in
+    a | b | c | ..., each step appends one literal instead of copying
+    all of them. The literals are the first size items of the list.
+    '''
+
+    __slots__ = ('lits', 'size')
     
     def __init__(self, literals = []):
-        self.literals = [l for l in literals]
+        self.lits = list(literals)
+        self.size = len(self.lits)
 
     def className(self):
         return 'Clause'
 
+    @property
+    def literals(self):
+        '''The list of literals (a copy).'''
+        return self.lits[:self.size]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return itertools.islice(self.lits, self.size)
+
     def __and__(self, other):
         if type(other) == Clause:
             return Cnf([self, other])
         else:
             return Cnf([self]) & Cnf([Clause([other])])
+
+    def extended(self, lits):
+        # New clause with the literals of self and lits, appending to
+        # the shared list if nothing was appended to it since self
+        if self.size == len(self.lits):
+            c = Clause.__new__(Clause)
+            c.lits = self.lits
+        else:
+            c = Clause(self)
+        c.lits.extend(lits)
+        c.size = len(c.lits)
+        return c
         
     def __or__(self, other):
         if type(other) is Clause:
-            return Clause([l for l in self.literals + other.literals])
+            return self.extended(other)
         elif other.className() == 'SatVar':
-            return Clause([l for l in self.literals + [other]])
+            return self.extended((other,))
         else:
             raise TypeError('incompatible types')
 
     def __ior__(self, other):
         if type(other) is Clause:
-            self.literals += [l for l in other.literals]
-            return self
+            lits = list(other)
         elif other.className() == 'SatVar':
-            self.literals.append(other)
-            return self
+            lits = [other]
         else:
             raise TypeError('incompatible types')
+        if self.size != len(self.lits):
+            self.lits = self.lits[:self.size]
+        self.lits.extend(lits)
+        self.size = len(self.lits)
+        return self
 
     def __repr__(self):
-        lits = [str(l) for l in self.literals]
+        lits = [str(l) for l in self]
         return '(' + ' | '.join(lits) + ')'        
 
     # def __eq__(self, other):
@@ -122,18 +359,112 @@ class Clause(object):
     def dimacs(self):
         '''Dump the clause in DIMACS format'''
         
-        lits = [l.dimacs() for l in self.literals]
+        lits = [l.dimacs() for l in self]
         return ' '.join(lits) + ' 0'
     
 
+class VarPool(object):
+    '''Owns the mapping between variable names and integer ids. Ids are
+    dense and start at 1 in each pool.
+
+    SatVar and Cnf objects use the current pool, which is the innermost
+    pool entered with a with statement, or a global default pool
+    outside of any:
+
+        with VarPool():
+            cnf = transform(c)
+            solution = Solver().solve(cnf)
+
+    A pool and its names can be reclaimed as soon as the variables and
+    CNFs using it are gone, and solvers see ids 1..len(pool) only. The
+    pool only holds weak references to its literals, so that there is
+    no reference cycle and it is freed by reference counting. Each
+    Cnf is tied to the pool current when it was created, and variables
+    of other pools cannot be added to it.
+    '''
+
+    def __init__(self):
+        self.ids = dict()
+        self.names = ['']
+        # Weak references to the positive and negative literals
+        self.vars = [None]
+        self.negs = [None]
+
+    def __len__(self):
+        return len(self.names) - 1
+
+    def id(self, name):
+        '''Returns the id of variable name, creating it if needed.'''
+        try:
+            return self.ids[name]
+        except KeyError:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.vars.append(None)
+            self.negs.append(None)
+            return i
+
+    def register(self, names):
+        '''Returns the list of the ids of the given names, creating the
+        missing ones in the order of names. Same as calling id() for each
+        name, but faster on long lists.'''
+        ids = self.ids
+        new = [x for x in dict.fromkeys(names) if not x in ids]
+        base = len(self.names)
+        ids.update(zip(new, range(base, base + len(new))))
+        self.names.extend(new)
+        self.vars.extend([None] * len(new))
+        self.negs.extend([None] * len(new))
+        return [ids[x] for x in names]
+
+    def name(self, i):
+        '''Returns the name of variable id i.'''
+        return self.names[i]
+
+    def var(self, i):
+        '''Returns the positive SatVar literal of variable id i.'''
+        return self.literal(i)
+
+    def literal(self, l):
+        '''Returns the SatVar literal of DIMACS literal l. There is at
+        most one live object per literal: it is created on first use,
+        and again once the previous one has been freed.'''
+        i = abs(l)
+        table = self.vars if l > 0 else self.negs
+        r = table[i]
+        v = r() if r is not None else None
+        if v is None:
+            v = object.__new__(SatVar)
+            v.name = self.names[i]
+            v.phase = l > 0
+            v.pool = self
+            v.id = i
+            table[i] = weakref.ref(v)
+        return v
+
+    def __enter__(self):
+        VarPool.stack.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        VarPool.stack.remove(self)
+
+    @staticmethod
+    def current():
+        '''Returns the current pool.'''
+        return VarPool.stack[-1]
+
+# The default pool stays at the bottom of the stack
+VarPool.stack = [VarPool()]
+
+
 class SatVar(object):
     '''Represents a variable used to construct a CNF. The declared
     variables are given a unique integer identifier, starting with
-    1. The identifier is global, so multiple CNF instances will share
-    the same identifier. There is (currently?) no way to reset the
-    next identifier to 1. As long as the internal Solver interface is
-    used, this does not pose any problem, since the integer ids are
-    only used for DIMACS dumping.
+    1, by their VarPool. Unless another pool is given or entered
+    with a with statement, the global default pool is used, so multiple
+    CNF instances will share the same identifier. The integer ids are
+    used for DIMACS dumping and by the solvers.
 
     There is no difference between "variables" and "literals". The
     phase is actually stored in this class, so a positive literal is
@@ -141,31 +472,39 @@ class SatVar(object):
     variable. Use the overloaded ~ operator to negate a literal.
 
     Use the constructor SatVar() to get a fresh variable.
+
+    Literals are immutable and unique: the pool keeps track of the
+    positive and the negative literal of each variable, which the
+    constructor and ~ return.
     '''
-    
-    __nextid__ = 1
-    __vartable__ = dict()
 
-    def __init__(self, name=None, phase=True):
-        '''Constructs a SAT variable. If phase is False, constructs a negative
+    __slots__ = ('name', 'phase', 'pool', 'id', '__weakref__')
+    
+    def __new__(cls, name=None, phase=True, pool=None):
+        '''Returns a SAT variable. If phase is False, returns a negative
         literal, otherwise a positive one.'''
 
+        if pool is None:
+            pool = VarPool.current()
         if name is None:
-            name = 'SatVar__{}'.format(SatVar.__nextid__)
-            
-        self.name = str(name)
-        self.phase = phase
-        try:
-            self.id = SatVar.__vartable__[self.name]
-        except KeyError:
-            self.id = SatVar.__nextid__
-            SatVar.__nextid__ += 1
-            SatVar.__vartable__[self.name] = self.id
-            # print ('{} -> {}'.format(name, self.id))
+            name = 'SatVar__{}'.format(len(pool.names))
+
+        v = pool.var(pool.id(str(name)))
+        return v if phase else ~v
+
+    @staticmethod
+    def literal(l, pool=None):
+        '''Returns the literal of DIMACS literal l in pool (by default the
+        current one).'''
+        return (pool if pool is not None else VarPool.current()).literal(l)
 
     def className(self):
         return 'SatVar'
 
+    def __int__(self):
+        '''Returns the literal as a DIMACS integer.'''
+        return self.id if self.phase else -self.id
+
     def dimacs(self):
         '''Dump variable/literal in DIMACS format.'''
         
@@ -193,7 +532,7 @@ class SatVar(object):
         return x < y
 
     def __invert__(self):
-        return SatVar(self.name, not self.phase)
+        return self.pool.literal(-self.id if self.phase else self.id)
 
     def __or__(self, other):
         if type(other) is SatVar:
@@ -224,11 +563,15 @@ class Solution:
     '''Represents the solution of a SAT problem, which is either UNSAT or
     SAT. In the latter case, an assignment is stored an can be
     accessed by standard item access [] or with an item() iterator.
+    In the former case, failed is the list of the assumptions (SatVar
+    literals) used to prove unsatisfiability, if there were any.
     '''
 
-    def __init__(self, sat, assignment = None):
+    def __init__(self, sat, assignment = None, failed = None, pool = None):
         self.assignment = assignment
         self.sat = sat
+        self.failed = failed
+        self.pool = pool
 
     def __repr__(self):
         if not self.sat:
@@ -257,7 +600,7 @@ class Solution:
             return None
         bc = None
         for x, b in self.assignment.items():
-            l = ~SatVar(x) if b else SatVar(x)
+            l = SatVar(x, not b, self.pool)
             if bc is None:
                 bc = l
             else:
@@ -265,46 +608,326 @@ class Solution:
         return bc
 
     
-class Solver:
-    '''SAT solver interface. Call solve() on a CNF object to solve it.'''
-    
+class SatispyBackend:
+    '''Solves CNFs through satispy, which builds an expression for the
+    whole CNF and hands it to Minisat.'''
+
     def __init__(self):
         self.solver = Minisat()
 
-    def solve(self, cnf):
-        '''Solve a SAT problem in CNF form. Internally calls Minisat. Returns
-        a Solution object.'''
-        
-        if type(cnf) is Clause:            
-            return self.solve(Cnf({cnf}))
-        elif type(cnf) is SatVar:
-            return self.solve(Clause({cnf}))                              
+    def solve(self, cnfs, assumptions = ()):
+        cnf = combine(cnfs, assumptions)
+        names = cnf.pool.names
         def literal(lit):
-            v = satispy.Variable(lit.name)
-            if lit:
+            v = satispy.Variable(names[abs(lit)])
+            if lit > 0:
                 return v
             else:
                 return -v
         def clause(cls):
-            lits = [literal(l) for l in cls.literals]
+            lits = [literal(l) for l in cls]
             c = lits.pop()
             for l in lits:
                 c = c | l
             return c
-        clauses = [clause(c) for c in cnf.clauses]
+        clauses = [clause(c) for c in cnf.iterClauses()]
         expr = clauses.pop()
         for c in clauses:
             expr = expr & c
         solution = self.solver.solve(expr)
         if solution.success:
             assignment = {x: solution[satispy.Variable(x)] for x in cnf.variables}
-            return Solution(True, assignment)
+            return Solution(True, assignment, pool = cnf.pool)
+        else:
+            return Solution(False, failed = [cnf.pool.literal(l) for l in assumptions])
+
+
+class DimacsBackend:
+    '''Solves CNFs with a SAT solver executable: the CNF is written to a
+    temporary DIMACS file, and the model is read back by variable id.
+    Minisat-like solvers (minisat, glucose) write the model to a result
+    file; other solvers (kissat, cadical, ...) are expected to print it
+    in the SAT competition format ("s SATISFIABLE", "v ..." lines).'''
+
+    def __init__(self, command):
+        self.command = command
+        name = os.path.basename(command)
+        self.minisat = name.startswith('minisat') or name.startswith('glucose')
+
+    def solve(self, cnfs, assumptions = ()):
+        cnf = combine(cnfs, assumptions)
+        with tempfile.TemporaryDirectory() as d:
+            problem = os.path.join(d, 'problem.cnf')
+            result = os.path.join(d, 'result')
+            with open(problem, 'wb') as f:
+                cnf.writeDimacs(f)
+            if self.minisat:
+                args = [self.command, '-verb=0', problem, result]
+            else:
+                args = [self.command, problem]
+            p = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            if self.minisat:
+                try:
+                    with open(result) as f:
+                        lines = f.read().split('\n')
+                except OSError:
+                    lines = []
+                status = lines[0] if lines else ''
+                model = lines[1:]
+            else:
+                lines = p.stdout.decode().split('\n')
+                status = ' '.join(l[2:].strip() for l in lines if l.startswith('s '))
+                model = [l[2:] for l in lines if l.startswith('v ')]
+
+        if status in ('UNSAT', 'UNSATISFIABLE'):
+            return Solution(False, failed = [cnf.pool.literal(l) for l in assumptions])
+        if status not in ('SAT', 'SATISFIABLE'):
+            raise RuntimeError('%s failed (exit code %d)' % (self.command, p.returncode))
+
+        values = dict()
+        for l in ' '.join(model).split():
+            l = int(l)
+            if l != 0:
+                values[abs(l)] = l > 0
+        # Variables the solver did not assign can take any value
+        names = cnf.pool.names
+        assignment = {names[i]: values.get(i, False) for i in cnf.getIds()}
+        return Solution(True, assignment, pool = cnf.pool)
+
+
+class CdclBackend:
+    '''Solves CNFs with the built-in CDCL solver of circuit.cdcl, which
+    needs no external program. The solver is kept from one call to the
+    next: if the CNFs only gained clauses since the last call (as with
+    cnf &= clause), only the new clauses are added to it, and it keeps
+    what it learned so far. Failed assumptions are exact.'''
+
+    def __init__(self):
+        self.solver = None
+        self.fed = []
+        self.ids = set()
+
+    def solve(self, cnfs, assumptions = ()):
+        from circuit.cdcl import Cdcl
+
+        if any(c.pool is not cnfs[-1].pool for c in cnfs):
+            raise ValueError('variables of another VarPool')
+        # Stores are append-only: a CNF on the same store with at least
+        # as many clauses starts with the clauses already fed
+        if (self.solver is None or len(cnfs) != len(self.fed) or
+            any(c.store is not store or len(c) < size
+                for c, (store, size) in zip(cnfs, self.fed))):
+            self.solver = Cdcl()
+            self.fed = [(c.store, 0) for c in cnfs]
+            self.ids = set()
+        for k, c in enumerate(cnfs):
+            for i in range(self.fed[k][1], len(c)):
+                lits = c.getClause(i)
+                self.ids.update(map(abs, lits))
+                self.solver.addClause(lits)
+            self.fed[k] = (c.store, len(c))
+        for l in assumptions:
+            self.ids.add(abs(l))
+
+        pool = cnfs[-1].pool
+        if not self.solver.solve(assumptions):
+            return Solution(False, failed = [pool.literal(l) for l in self.solver.getFailed()])
+        names = pool.names
+        model = self.solver.getModel()
+        return Solution(True, {names[i]: model[i] for i in self.ids}, pool = pool)
+
+
+def combine(cnfs, assumptions):
+    '''Returns one Cnf with the clauses of all cnfs, and the assumptions as
+    unit clauses. Used by the backends which solve from scratch.'''
+    if len(cnfs) == 1 and not assumptions:
+        return cnfs[0]
+    cnf = Cnf(pool = cnfs[-1].pool)
+    for c in cnfs:
+        cnf.extend(c)
+    for l in assumptions:
+        cnf.addClause([l])
+    return cnf
+
+# Backends by name, for Solver()
+BACKENDS = {'cdcl': CdclBackend, 'satispy': SatispyBackend}
+
+# Executables tried by findSolver(), in this order
+SOLVERS = ['minisat', 'kissat', 'cadical', 'glucose']
+
+def findSolver():
+    '''Returns the path of the SAT solver executable to use, or None. The
+    environment variable CIRCUIT_SAT_SOLVER overrides the search.'''
+
+    command = os.environ.get('CIRCUIT_SAT_SOLVER')
+    if command:
+        return shutil.which(command) or command
+    for name in SOLVERS:
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+class Solver(ClauseSink):
+    '''SAT solver interface. Call solve() on a CNF object to solve it.
+    Clauses can also be added to the solver with add_clause() or
+    addClause() (it is a ClauseSink); they are part of every subsequent
+    solve(). solve() also takes assumptions, literals which are assumed
+    true for that call only.
+
+    By default, the CNF is passed in DIMACS form to the SAT solver
+    executable found by findSolver(). If there is none, the built-in
+    CDCL solver is used. Another backend can be selected by name
+    ('dimacs', 'cdcl' or 'satispy'), or given as an object with a
+    solve(cnfs, assumptions) method returning a Solution. The 'cdcl'
+    backend solves incrementally and reports exact failed assumptions;
+    the others solve from scratch each time and report all assumptions
+    as failed.
+
+    If preprocess is True, the clauses are simplified before each call
+    to the backend (see circuit.preprocess), and the model is extended
+    back to all variables. The counts of the simplifications of the last
+    call are in the attribute stats. The CNF is then solved from scratch
+    each time, so this suits single calls on large CNFs such as miters.'''
+    
+    def __init__(self, backend = None, preprocess = False):
+        if backend is None:
+            command = findSolver()
+            backend = DimacsBackend(command) if command else CdclBackend()
+        elif backend == 'dimacs':
+            command = findSolver()
+            if command is None:
+                raise RuntimeError('no SAT solver executable found')
+            backend = DimacsBackend(command)
+        elif type(backend) is str:
+            backend = BACKENDS[backend]()
+        self.backend = backend
+        self.preprocess = preprocess
+        self.stats = None
+        self.cnf = Cnf()
+
+    @property
+    def pool(self):
+        '''The pool of the variables of the clauses added to the solver.'''
+        return self.cnf.pool
+
+    def addClause(self, lits):
+        self.cnf.addClause(lits)
+
+    def add_clause(self, clause):
+        '''Adds a clause, given as a Clause, a SatVar or a list of DIMACS
+        literals, or all clauses of a Cnf.'''
+        if type(clause) in (Cnf, Clause, SatVar):
+            self.cnf.extend(clause)
         else:
-            return Solution(False)
+            self.cnf.addClause([int(l) for l in clause])
+
+    def solve(self, cnf = None, assumptions = ()):
+        '''Solve a SAT problem in CNF form, together with the clauses added
+        with add_clause(), under the given assumptions (SatVar literals or
+        DIMACS literals). Returns a Solution object.'''
+        
+        if type(cnf) is Clause:            
+            return self.solve(Cnf({cnf}), assumptions)
+        elif type(cnf) is SatVar:
+            return self.solve(Clause({cnf}), assumptions)
+        if cnf is not None and cnf.pool is not self.cnf.pool and len(self.cnf) == 0:
+            self.cnf = Cnf(pool = cnf.pool)
+        cnfs = [self.cnf] if cnf is None else [self.cnf, cnf]
+        assumptions = [int(l) for l in assumptions]
+        if self.preprocess:
+            return self.simplifyAndSolve(combine(cnfs, ()), assumptions)
+        return self.backend.solve(cnfs, assumptions)
+
+    def simplifyAndSolve(self, cnf, assumptions):
+        from circuit.preprocess import Preprocessor
+
+        pool = cnf.pool
+        p = Preprocessor(cnf, frozen = assumptions)
+        simplified = p.simplify()
+        self.stats = p.stats
+        if simplified is None:
+            return Solution(False, failed = [], pool = pool)
+        if len(simplified) == 0 and not assumptions:
+            solution = Solution(True, dict(), pool = pool)
+        else:
+            solution = self.backend.solve([simplified], assumptions)
+        if solution:
+            ids = pool.ids
+            model = p.extend({ids[x]: b for x, b in solution.assignment.items()})
+            names = pool.names
+            solution.assignment = {names[i]: b for i, b in model.items()}
+        return solution
+
+def allSAT(cnf, variables = None, limit = None, backend = 'cdcl', shrink = True):
+    '''Enumerates the solutions of cnf projected on the given variables
+    (names or SatVars; all variables of cnf by default), lazily and at
+    most limit of them. Yields a Solution for each one, with a full
+    assignment and an attribute cube: a partial assignment of the
+    projected variables, such that all assignments extending it are
+    projections of solutions. A clause blocking the cube is added to an
+    incremental solver before looking for the next solution, so every
+    solution is outside the cubes of the previous ones (cubes may still
+    overlap). cnf itself is not changed.
+
+    If shrink is True, a projected variable is left out of the cube if
+    every clause of cnf its literal satisfies is also satisfied by
+    another literal, either one of a variable that is not projected
+    (whose value stays as in the solution) or one kept in the cube.
+    '''
+
+    names = cnf.pool.names
+    ids = cnf.pool.ids
+    if variables is None:
+        projected = sorted(cnf.getIds())
+    else:
+        projected = sorted(ids[str(x)] if type(x) is not SatVar else x.id for x in variables
+                           if type(x) is SatVar or str(x) in ids)
+
+    # Occurrences of the projected literals in the clauses of cnf
+    isProjected = set(projected)
+    occurs = dict()
+    if shrink:
+        for i, c in enumerate(cnf.iterClauses()):
+            for l in set(c):
+                if abs(l) in isProjected:
+                    occurs.setdefault(l, []).append(i)
+
+    solver = Solver(backend)
+    count = 0
+    while limit is None or count < limit:
+        solution = solver.solve(cnf)
+        if not solution:
+            return
+        assignment = solution.assignment
+
+        cube = [x if assignment[names[x]] else -x for x in projected if names[x] in assignment]
+        if shrink:
+            value = {ids[x]: b for x, b in assignment.items()}
+            # Number of true literals of the clauses, computed on demand
+            satisfied = dict()
+            kept = []
+            for l in cube:
+                cls = occurs.get(l, ())
+                for i in cls:
+                    if not i in satisfied:
+                        satisfied[i] = sum(1 for q in set(cnf.getClause(i)) if value[abs(q)] == (q > 0))
+                if all(satisfied[i] >= 2 for i in cls):
+                    for i in cls:
+                        satisfied[i] -= 1
+                else:
+                    kept.append(l)
+            cube = kept
+
+        solution.cube = {names[abs(l)]: l > 0 for l in cube}
+        yield solution
+        count += 1
+        solver.addClause([-l for l in cube])
 
 # ================================================================= TEST CODE
 
-if __name__ == '__main__':
+def demo():
+    '''Shows the basic use of the CNF API.'''
 
     # Declare SAT variables
     a = SatVar('a')
@@ -343,3 +966,12 @@ if __name__ == '__main__':
         # Iterate over all solutions (v is a string, x a Boolean)
         for v, x in solution.items():
             print ('%s = %s' % (v, str(x)))
+
+if __name__ == '__main__':
+    import sys
+
+    # Run as a script, this file is not loaded as part of the circuit
+    # package, which the DIMACS output needs: run the package's demo
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import circuit.cnf
+    circuit.cnf.demo()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+'''Code generation of native Python evaluators for circuits.
+
+A compiled Program is turned into the source of a straight-line Python
+function with one local variable per slot, which is then compiled once
+with compile()/exec. The generated functions are cached by their
+source, so structurally identical circuits share one evaluator; the
+cache keeps the EVALUATORS most recently used ones.
+
+The evaluators only use the operators &, |, ^ on their values, so they
+work on Booleans as well as on Python ints used as bit-vectors of
+arbitrary width (pass a mask with all used bits set). An evaluator
+returns either all signals or only the outputs; building the result
+dictionary is a large share of the run time on small circuits.
+'''
+
+import hashlib
+import functools
+
+from circuit.program import AND, OR, XOR, ZERO, ONE
+
+# Number of compiled evaluators shared between programs
+EVALUATORS = 256
+
+def source(program, outputs=False):
+    '''Returns the Python source of the evaluator for program, which
+    returns only the outputs if outputs is True.'''
+
+    lines = ['def evaluate(inputs, m=True):',
+             '    v%d = m ^ m' % ZERO,
+             '    v%d = m' % ONE]
+    for x in program.inputs:
+        lines.append('    v%d = inputs[%r]' % (program.slots[x], x))
+    for op, d, a, b in program.instructions():
+        if op == AND:
+            lines.append('    v%d = v%d & v%d' % (d, a, b))
+        elif op == OR:
+            lines.append('    v%d = v%d | v%d' % (d, a, b))
+        elif op == XOR:
+            lines.append('    v%d = v%d ^ v%d' % (d, a, b))
+        else:
+            lines.append('    v%d = v%d ^ m' % (d, a))
+    names = program.outputs if outputs else program.slots
+    items = ['%r: v%d' % (x, program.slots[x]) for x in names]
+    lines.append('    return {%s}' % ', '.join(items))
+    return '\n'.join(lines) + '\n'
+
+def evaluator(program, outputs=False):
+    '''Returns the compiled evaluator function for program. The function
+    takes a dictionary mapping input names to values and an optional
+    mask (True for Booleans, (1 << n) - 1 for n-bit ints), and returns
+    a dictionary mapping input, output and internal signal names to
+    values, or only output names if outputs is True.
+    '''
+
+    name = 'codegen-outputs' if outputs else 'codegen'
+    try:
+        return program.cache[name]
+    except KeyError:
+        pass
+    f = program.cache[name] = compiled(source(program, outputs))
+    return f
+
+@functools.lru_cache(maxsize=EVALUATORS)
+def compiled(src):
+    '''Returns the function defined by the source src of an evaluator.'''
+    key = hashlib.sha1(src.encode()).hexdigest()
+    env = dict()
+    exec(compile(src, '<circuit %s>' % key[:12], 'exec'), env)
+    return env['evaluate']
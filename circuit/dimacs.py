@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+'''Fast DIMACS input and output for CNFs.
+
+Both directions work on whole arrays of literals with NumPy, so that
+multi-million clause CNFs never go through one Python string per
+literal:
+
+ * write() formats the clause store of a Cnf chunk by chunk and writes
+   the bytes to a binary file object
+ * read() maps a DIMACS file into memory, parses it chunk by chunk
+   (each chunk ends at a line break) and builds the clause store of a
+   new Cnf directly
+
+Variable names can be saved along with the clauses as comment lines
+"c <id> <name>", which write() emits before the header if asked to and
+read() uses to map the ids of the file back to names in the VarPool of
+the new Cnf. The variables read without a name are named x<id>.
+'''
+
+import os
+import mmap
+from array import array
+
+import numpy as np
+
+# Literals per chunk
+CHUNK = 1 << 20
+
+# Characters
+NEWLINE = ord('\n')
+SPACE = ord(' ')
+MINUS = ord('-')
+ZERO = ord('0')
+NINE = ord('9')
+COMMENTS = b'cp%'
+
+def encode(lits, offsets):
+    '''Returns the DIMACS text, as a NumPy byte array, of the clauses
+    of a clause store given by the NumPy arrays lits and offsets (clause
+    i is lits[offsets[i]:offsets[i+1]], offsets may start anywhere in
+    lits).'''
+
+    body = np.insert(lits[offsets[0]:offsets[-1]], offsets[1:] - offsets[0], 0)
+    if not len(body):
+        return np.zeros(0, np.uint8)
+    a = np.abs(body).astype(np.uint32)
+    neg = body < 0
+    width = len(str(int(a.max())))
+    ndigits = np.ones(len(body), np.int64)
+    for k in range(1, width):
+        ndigits += a >= 10 ** k
+    # Each literal is followed by a space, and each 0 by a line break
+    ends = np.cumsum(ndigits + neg + 1)
+    out = np.empty(ends[-1], np.uint8)
+    digits = []
+    for k in range(width):
+        a, d = np.divmod(a, np.uint32(10))
+        digits.append(d.astype(np.uint8) + np.uint8(ZERO))
+    # Digit k of every literal, from the most significant one down: the
+    # literals shorter than k + 1 digits write garbage before their
+    # start, which the digits of the previous literals, the separators
+    # and the minus signs overwrite afterwards
+    last = ends - 2
+    for k in range(width - 1, -1, -1):
+        pos = np.maximum(last - k, 0)
+        out[pos] = digits[k]
+    out[ends - 1] = np.where(body == 0, NEWLINE, SPACE)
+    out[(ends - ndigits - 2)[neg]] = MINUS
+    return out
+
+def write(cnf, f, names=False):
+    '''Writes cnf in DIMACS format to the binary file object f. If names
+    is True, the names of the variables are written in comment lines
+    "c <id> <name>" before the header.'''
+
+    if names:
+        pool = cnf.pool
+        f.write(''.join('c %d %s\n' % (i, pool.name(i))
+                        for i in sorted(cnf.getIds())).encode())
+    f.write(b'p cnf %d %d\n' % (cnf.maxVar, len(cnf)))
+    lits = np.frombuffer(cnf.store.lits, np.int32)
+    offsets = np.frombuffer(cnf.store.offsets, np.int32)[:len(cnf) + 1]
+    i = 0
+    while i < len(cnf):
+        # Clauses i..j-1 hold about CHUNK literals (at least one clause)
+        j = int(np.searchsorted(offsets, offsets[i] + CHUNK, 'right')) - 1
+        j = min(max(j, i + 1), len(cnf))
+        f.write(encode(lits, offsets[i:j + 1]).tobytes())
+        i = j
+
+def comments(buf, names, header):
+    # Blanks out the comment lines of byte array buf (in place), which
+    # are recorded in names and header. Returns the length of buf to
+    # parse, which is shorter than buf if it contains the end marker %.
+    starts = np.concatenate(([0], np.flatnonzero(buf[:-1] == NEWLINE) + 1))
+    starts = starts[np.isin(buf[starts], np.frombuffer(COMMENTS, np.uint8))]
+    newlines = np.flatnonzero(buf == NEWLINE)
+    for s in starts.tolist():
+        k = np.searchsorted(newlines, s)
+        e = int(newlines[k]) if k < len(newlines) else len(buf)
+        line = buf[s:e].tobytes().decode(errors='replace').strip()
+        if line[0] == '%':
+            # SATLIB files end with %
+            return s
+        if line[0] == 'p':
+            fields = line.split()
+            if len(fields) != 4 or fields[1] != 'cnf':
+                raise ValueError('invalid DIMACS header: %s' % line)
+            header.append(line)
+        else:
+            fields = line[1:].split(None, 1)
+            if len(fields) == 2 and fields[0].isdigit():
+                names[int(fields[0])] = fields[1]
+        buf[s:e] = SPACE
+    return len(buf)
+
+def decode(buf):
+    # Returns the integers in byte array buf, which has no comments
+    digit = (buf >= ZERO) & (buf <= NINE)
+    minus = buf == MINUS
+    space = (buf == SPACE) | (buf == NEWLINE) | (buf == ord('\t')) | (buf == ord('\r'))
+    if not (digit | minus | space).all():
+        k = int(np.argmin(digit | minus | space))
+        raise ValueError('invalid DIMACS: unexpected character %r' % chr(buf[k]))
+    # Runs of digits (buf starts and ends with a line break)
+    d = digit.view(np.int8)
+    starts = np.flatnonzero(d[1:] > d[:-1]) + 1
+    lengths = np.flatnonzero(d[1:] < d[:-1]) + 1 - starts
+    if len(starts) and lengths.max() > 10:
+        raise ValueError('invalid DIMACS: literal out of range')
+    neg = np.zeros(len(starts), bool)
+    neg[starts > 0] = minus[starts[starts > 0] - 1]
+    # Each minus sign starts a literal, after a space
+    signs = starts[neg] - 1
+    if neg.sum() != minus.sum() or not space[signs[signs > 0] - 1].all():
+        raise ValueError('invalid DIMACS: misplaced minus sign')
+    values = np.zeros(len(starts), np.int64)
+    top = len(buf) - 1
+    for k in range(int(lengths.max()) if len(starts) else 0):
+        d = buf[np.minimum(starts + k, top)].astype(np.int64) - ZERO
+        values = np.where(lengths > k, values * 10 + d, values)
+    if len(values) and values.max() > 2**31 - 1:
+        raise ValueError('invalid DIMACS: literal out of range')
+    values[neg] = -values[neg]
+    return values.astype(np.int32)
+
+def read(f, pool=None):
+    '''Reads a CNF in DIMACS format from f, which is a file name or a
+    binary file object, and returns it as a Cnf over pool (by default
+    the current VarPool). Raises ValueError on invalid input.'''
+
+    from circuit.cnf import Cnf
+
+    if isinstance(f, (str, os.PathLike)):
+        with open(f, 'rb') as g:
+            return read(g, pool)
+    try:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        # Not a regular file, or an empty one
+        data = f.read()
+    # The mapping is released with the array
+    data = np.frombuffer(data, np.uint8)
+    names = dict()
+    header = []
+    tokens = []
+    i = 0
+    while i < len(data):
+        # Chunks end at a line break, so that no line is split
+        j = min(i + 4 * CHUNK, len(data))
+        if j < len(data):
+            k = np.flatnonzero(data[j:j + 4 * CHUNK] == NEWLINE)
+            j = j + int(k[0]) + 1 if len(k) else len(data)
+        buf = np.empty(j - i + 2, np.uint8)
+        buf[0] = buf[-1] = NEWLINE
+        buf[1:-1] = data[i:j]
+        end = comments(buf, names, header)
+        tokens.append(decode(buf[:end]))
+        if end < len(buf):
+            break
+        i = j
+    if len(header) > 1:
+        raise ValueError('invalid DIMACS: several headers')
+
+    tokens = np.concatenate(tokens) if tokens else np.zeros(0, np.int32)
+    if len(tokens) and tokens[-1] != 0:
+        # Tolerate a missing 0 after the last clause
+        tokens = np.append(tokens, np.int32(0))
+    zeros = np.flatnonzero(tokens == 0)
+    lits = tokens[tokens != 0]
+
+    # Map the ids of the file to the ids of the pool
+    cnf = Cnf(pool = pool)
+    pool = cnf.pool
+    used, inverse = np.unique(np.abs(lits), return_inverse=True)
+    pool.register([names[i] for i in sorted(names)])
+    ids = np.array(pool.register([names[i] if i in names else 'x%d' % i
+                             for i in used.tolist()]), np.int32)
+    lits = np.where(lits > 0, ids[inverse], -ids[inverse]).astype(np.int32)
+
+    cnf.store.lits = array('i', lits.tobytes())
+    cnf.store.offsets = array('i', [0])
+    cnf.store.offsets.frombytes((zeros - np.arange(len(zeros))).astype(np.int32).tobytes())
+    cnf.size = len(zeros)
+    cnf.maxVar = int(np.abs(lits).max()) if len(lits) else 0
+    return cnf
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+'''SAT sweeping of And-Inverter Graphs (fraiging).
+
+A Sweeper rebuilds an AIG node by node, in topological order, into a
+new AIG in which no two nodes are functionally equivalent (up to
+complement), a "functionally reduced" AIG or FRAIG:
+
+ * every node of the AIG gets a simulation signature, its values on
+   SIM_BITS random input vectors packed in an int; the nodes with the
+   same signature, or with complementary ones, are candidates to be
+   equivalent, and the first node of each class is its representative
+ * each node is rebuilt over the rebuilt fanins, and compared with the
+   representative of its class with two small SAT calls, on a single
+   incremental solver which holds the clauses of the new AIG: if both
+   are unsatisfiable, the node is merged into the representative
+ * otherwise, the model is an input vector telling the two nodes apart;
+   it is simulated and appended to all signatures, which splits their
+   class, and the node is compared with its new representative, if any
+
+Merging nodes as soon as they are proven makes the cones above them
+structurally equal, so that most of the later candidates are merged by
+structural hashing, without any SAT call. On a miter of two equivalent
+circuits, the output ends up as the constant False.
+
+Use check() to check the equivalence of two circuits by sweeping their
+miter.
+'''
+
+import random
+from collections import Counter
+
+from circuit.aig import Aig, FALSE, fromCircuit, miter
+from circuit.cnf import Solver, VarPool
+
+# Random input vectors simulated to get the initial signatures
+SIM_BITS = 256
+
+class Sweeper(object):
+    '''Sweeps AIG g into a FRAIG. See the module docstring. The counts of
+    the sweep are kept in the collections.Counter stats.'''
+
+    def __init__(self, g, bits = SIM_BITS, seed = 0):
+        self.g = g
+        self.f = Aig(g.name)
+        self.solver = Solver('cdcl')
+        self.var = self.solver.pool.id
+        self.vars = [self.var('#fraig_false')]
+        self.solver.addClause([-self.vars[0]])
+        self.stats = Counter()
+
+        rng = random.Random(seed)
+        self.mask = (1 << bits) - 1
+        self.patterns = {x: rng.getrandbits(bits) for x in g.getInputs()}
+        self.sigs = g.values(self.patterns, self.mask)
+
+    def literal(self, lit):
+        # The DIMACS literal of a literal of the new AIG
+        v = self.vars[lit >> 1]
+        return -v if lit & 1 else v
+
+    def mkAnd(self, a, b):
+        # AND gate of the new AIG, with its clauses in the solver
+        n = len(self.f)
+        lit = self.f.mkAnd(a, b)
+        if len(self.f) > n:
+            # Signal names cannot contain '#'
+            self.vars.append(self.var('#fraig%d' % n))
+            s, a, b = self.literal(lit), self.literal(a), self.literal(b)
+            self.solver.addClause([-s, a])
+            self.solver.addClause([-s, b])
+            self.solver.addClause([s, -a, -b])
+        return lit
+
+    def prove(self, a, b):
+        '''Returns None if the literals a and b of the new AIG are
+        equivalent, and otherwise the input values of a vector on which
+        they differ.'''
+
+        a, b = self.literal(a), self.literal(b)
+        for assumptions in ([a, -b], [-a, b]):
+            self.stats['sat calls'] += 1
+            solution = self.solver.solve(assumptions = assumptions)
+            if solution:
+                return {x: solution.assignment.get(x, False) for x in self.f.getInputs()}
+        return None
+
+    def refine(self, inputs):
+        '''Appends the values of all nodes for the given input values to
+        their signatures.'''
+
+        values = self.g.values(inputs)
+        self.sigs = [sig << 1 | v for sig, v in zip(self.sigs, values)]
+        self.mask = self.mask << 1 | 1
+        for x in self.patterns:
+            self.patterns[x] = self.patterns[x] << 1 | inputs[x]
+
+    def key(self, n):
+        # The signature of node n, complemented if its last bit is set,
+        # and whether it was complemented
+        sig = self.sigs[n]
+        return (sig ^ self.mask, 1) if sig & 1 else (sig, 0)
+
+    def sweep(self, cone = None):
+        '''Returns the FRAIG, whose named signals are those of g. Only the
+        nodes flagged in cone (see Aig.cone()) are swept, all of them by
+        default, and only the signals in the cone are named in the FRAIG.
+        Also returns the list mapping the nodes of g to literals of the
+        FRAIG.'''
+
+        g, f = self.g, self.f
+        lits = [FALSE] * len(g)
+        for x in g.getInputs():
+            lits[g.getLiteral(x) >> 1] = f.addInput(x)
+            self.vars.append(self.var(x))
+        # Representatives by signature, with their phase
+        reps = [0]
+        classes = {0: 0}
+        for n in range(1, len(g)):
+            if cone is not None and not cone[n]:
+                continue
+            if g.isAnd(n):
+                a, b = g.getFanins(n)
+                lits[n] = self.mkAnd(lits[a >> 1] ^ (a & 1), lits[b >> 1] ^ (b & 1))
+            while True:
+                k, phase = self.key(n)
+                rep = classes.get(k)
+                if rep is None:
+                    classes[k] = n
+                    reps.append(n)
+                    break
+                lit = lits[rep] ^ self.key(rep)[1] ^ phase
+                if lits[n] == lit:
+                    self.stats['structural'] += 1
+                    break
+                cex = self.prove(lits[n], lit)
+                if cex is None:
+                    self.stats['proved'] += 1
+                    lits[n] = lit
+                    break
+                self.stats['refuted'] += 1
+                self.refine(cex)
+                classes = dict()
+                for m in reps:
+                    classes.setdefault(self.key(m)[0], m)
+
+        for x in g.getSignals():
+            lit = g.getLiteral(x)
+            if not x in f.signals and (cone is None or cone[lit >> 1]):
+                f.setSignal(x, lits[lit >> 1] ^ (lit & 1))
+        f.outputs = list(g.getOutputs())
+        self.stats['nodes'] = g.getAndCount()
+        self.stats['fraig nodes'] = f.getAndCount()
+        return f, lits
+
+def check(c1, c2):
+    '''Checks the equivalence of c1 and c2, which are Circuits or AIGs, by
+    sweeping their miter. Returns (True, None) if they are equivalent
+    and (False, counterexample) otherwise, like circuit.aig.check(); the
+    counterexample maps the input names to Booleans.'''
+
+    g1 = c1 if type(c1) is Aig else fromCircuit(c1)
+    g2 = c2 if type(c2) is Aig else fromCircuit(c2)
+    if not (set(g1.getInputs()) == set(g2.getInputs()) and
+            set(g1.getOutputs()) == set(g2.getOutputs())):
+        return (False, None)
+
+    m = miter(g1, g2)
+    out = m.getLiteral('miter_output')
+    with VarPool():
+        s = Sweeper(m)
+        # A simulation vector may already set the output
+        sig = s.sigs[out >> 1] ^ (s.mask if out & 1 else 0)
+        if sig:
+            i = (sig & -sig).bit_length() - 1
+            return (False, {x: bool(p >> i & 1) for x, p in s.patterns.items()})
+        f, lits = s.sweep(m.cone([out]))
+        out = f.getLiteral('miter_output')
+        if out == FALSE:
+            return (True, None)
+        solution = s.solver.solve(assumptions = [s.literal(out)])
+    if not solution:
+        return (True, None)
+    return (False, {x: solution.assignment.get(x, False) for x in m.getInputs()})
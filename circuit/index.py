@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+'''Dependency index of a circuit.
+
+The index numbers all signals of a circuit (inputs first, in sorted
+order, then the signals with an equation in topological order) and
+records for each signal its direct dependencies, its fanout and its
+logic level. Support sets (the inputs a signal depends on) and fan-in
+cones (all signals a signal depends on) are stored as integer bitsets
+over the signal numbers; they are computed on first use, in a single
+pass over all signals. The index also lists the nodes of all equations
+in a single post-order, and counts the parents of every node; this is
+computed on first use as well, in a single pass over all nodes.
+
+Indexes are built by Circuit.index(), which caches the result on the
+circuit until its structure changes.
+'''
+
+from circuit.circuit import Variable, BinOp, UnOp
+
+class Index(object):
+    '''Dependency index of a circuit.'''
+
+    def __init__(self, c):
+        self.signals = sorted(c.getInputs()) + list(c.order)
+        self.ids = {x: i for i, x in enumerate(self.signals)}
+        self.ninputs = len(c.getInputs())
+        self.deps = [()] * len(self.signals)
+        self.fanout = [[] for _ in self.signals]
+        self.levels = [0] * len(self.signals)
+        self.supports = None
+        self.cones = None
+        self.nodes = None
+        self.parents = None
+        self.roots = [c.getEquation(x) for x in c.order]
+
+        for x in c.order:
+            i = self.ids[x]
+            ds = sorted(self.ids[y] for y in c.getEquation(x).support())
+            self.deps[i] = tuple(ds)
+            for d in ds:
+                self.fanout[d].append(i)
+            self.levels[i] = self.depth(c.getEquation(x))
+
+    def depth(self, e):
+        # Gate depth of expression e, on top of the levels of the
+        # signals it refers to (which are already known)
+        depth = dict()
+        stack = [e]
+        while stack:
+            nd = stack[-1]
+            if id(nd) in depth:
+                stack.pop()
+                continue
+            t = type(nd)
+            if t is Variable:
+                depth[id(nd)] = self.levels[self.ids[nd.getName()]]
+            elif t is BinOp or t is UnOp:
+                missing = [k for k in nd.getChildren() if id(k) not in depth]
+                if missing:
+                    stack.extend(missing)
+                    continue
+                depth[id(nd)] = 1 + max(depth[id(k)] for k in nd.getChildren())
+            else:
+                depth[id(nd)] = 0
+            stack.pop()
+        return depth[id(e)]
+
+    def names(self, bits):
+        '''Returns the set of signal names in bitset bits.'''
+        result = set()
+        while bits:
+            low = bits & -bits
+            result.add(self.signals[low.bit_length() - 1])
+            bits ^= low
+        return result
+
+    def bits(self, names):
+        '''Returns the bitset of the given signal names.'''
+        b = 0
+        for x in names:
+            b |= 1 << self.ids[x]
+        return b
+
+    def getDependencies(self, x):
+        '''Returns the set of signals signal x refers to directly.'''
+        return {self.signals[d] for d in self.deps[self.ids[x]]}
+
+    def getFanout(self, x):
+        '''Returns the set of signals referring directly to signal x.'''
+        return {self.signals[d] for d in self.fanout[self.ids[x]]}
+
+    def getLevel(self, x):
+        '''Returns the logic level of signal x, i.e. the number of gates on
+        the longest path from an input to x. Inputs have level 0.'''
+        return self.levels[self.ids[x]]
+
+    def getSupportBits(self, x):
+        '''Returns the support of signal x as a bitset over signal ids.'''
+        if self.supports is None:
+            self.supports = [0] * len(self.signals)
+            for i in range(self.ninputs):
+                self.supports[i] = 1 << i
+            for i in range(self.ninputs, len(self.signals)):
+                b = 0
+                for d in self.deps[i]:
+                    b |= self.supports[d]
+                self.supports[i] = b
+        return self.supports[self.ids[x]]
+
+    def getConeBits(self, x):
+        '''Returns the fan-in cone of signal x (all signals x depends on,
+        directly or not, excluding x itself) as a bitset over signal ids.'''
+        if self.cones is None:
+            self.cones = [0] * len(self.signals)
+            for i in range(self.ninputs, len(self.signals)):
+                b = 0
+                for d in self.deps[i]:
+                    b |= self.cones[d] | (1 << d)
+                self.cones[i] = b
+        return self.cones[self.ids[x]]
+
+    def getSupport(self, x):
+        '''Returns the set of inputs signal x depends on.'''
+        return self.names(self.getSupportBits(x))
+
+    def getCone(self, x):
+        '''Returns the set of signals signal x depends on, directly or not.'''
+        return self.names(self.getConeBits(x))
+
+    def reachable(self, roots):
+        '''Returns the set of signals in the fan-in cones of the given
+        signals, including the signals themselves.'''
+        seen = [False] * len(self.signals)
+        stack = [self.ids[x] for x in roots]
+        while stack:
+            i = stack.pop()
+            if not seen[i]:
+                seen[i] = True
+                stack.extend(self.deps[i])
+        return {x for x, b in zip(self.signals, seen) if b}
+
+    def graph(self):
+        # List the nodes in post-order and count their parents
+        self.nodes = []
+        self.parents = dict()
+        seen = set()
+        for root in self.roots:
+            self.parents[root.id] = self.parents.get(root.id, 0) + 1
+            stack = [(root, False)]
+            while stack:
+                nd, expanded = stack.pop()
+                if expanded:
+                    self.nodes.append(nd)
+                elif not nd.id in seen:
+                    seen.add(nd.id)
+                    stack.append((nd, True))
+                    for k in reversed(nd.kids):
+                        self.parents[k.id] = self.parents.get(k.id, 0) + 1
+                        stack.append((k, False))
+
+    def getNodes(self):
+        '''Returns the list of all nodes of the equations, each one once,
+        in post-order over the signals in topological order: every node
+        comes after its children.'''
+        if self.nodes is None:
+            self.graph()
+        return self.nodes
+
+    def getParents(self):
+        '''Returns a dict mapping the ids of all nodes of the equations to
+        their number of parents, where being the root of the equation of
+        a signal counts as a parent.'''
+        if self.parents is None:
+            self.graph()
+        return self.parents
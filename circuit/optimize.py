@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+'''Structural optimization of circuits.
+
+clean() rebuilds a circuit in a single sweep over its signals in
+topological order, without touching the nodes of the original circuit:
+
+ * constants are propagated through all gates, including partially
+   constant ones (x & 0, x | 1, x ^ 1, ~0, ...)
+ * identities are simplified: x & x, x | ~x, x ^ x, ~~x, ...
+ * structurally identical gates are built once (structural hashing,
+   with the operands of &, | and ^ in a canonical order)
+ * internal signals with a single fanout are collapsed into the signal
+   using them, and signals that are mere aliases of a constant or of
+   another signal are substituted everywhere
+ * signals that do not contribute to an output are dropped
+
+Each step is counted in a collections.Counter, which is stored as the
+attribute stats of the resulting circuit.
+'''
+
+import operator
+from collections import Counter
+
+from circuit.circuit import Literal, Variable, BinOp, UnOp, Circuit, nogc
+
+FUNCTIONS = {'&': operator.and_, '|': operator.or_, '^': operator.xor}
+
+class Builder(object):
+    '''Builds simplified, structurally hashed nodes.'''
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.constants = [Literal(False), Literal(True)]
+        self.variables = dict()
+        self.table = dict()
+
+    def key(self, nd):
+        # Structural identity of a node built by this builder
+        t = type(nd)
+        if t is Variable:
+            return nd.name
+        elif t is Literal:
+            return bool(nd.value)
+        return id(nd)
+
+    def literal(self, b):
+        return self.constants[bool(b)]
+
+    def variable(self, x):
+        try:
+            return self.variables[x]
+        except KeyError:
+            nd = self.variables[x] = Variable(x)
+            return nd
+
+    def invert(self, a):
+        t = type(a)
+        if t is Literal:
+            self.stats['constants'] += 1
+            return self.literal(not a.value)
+        if t is UnOp:
+            self.stats['identities'] += 1
+            return a.kids[0]
+        k = ('~', self.key(a))
+        try:
+            nd = self.table[k]
+            self.stats['shared'] += 1
+            return nd
+        except KeyError:
+            nd = self.table[k] = UnOp(operator.not_, '~', a)
+            return nd
+
+    def complementary(self, a, b):
+        # True if a == ~b is known structurally
+        return ((type(a) is UnOp and self.key(a.kids[0]) == self.key(b)) or
+                (type(b) is UnOp and self.key(b.kids[0]) == self.key(a)))
+
+    def binop(self, op, a, b):
+        ta, tb = type(a), type(b)
+        if tb is Literal and ta is not Literal:
+            a, b, ta, tb = b, a, tb, ta
+        if ta is Literal:
+            self.stats['constants'] += 1
+            if tb is Literal:
+                return self.literal(FUNCTIONS[op](bool(a.value), bool(b.value)))
+            if op == '&':
+                return b if a.value else a
+            elif op == '|':
+                return a if a.value else b
+            else:
+                return self.invert(b) if a.value else b
+        if self.key(a) == self.key(b):
+            self.stats['identities'] += 1
+            if op == '^':
+                return self.literal(False)
+            return a
+        if self.complementary(a, b):
+            self.stats['identities'] += 1
+            return self.literal(op != '&')
+        ka, kb = self.key(a), self.key(b)
+        if (type(ka) is str, ka) > (type(kb) is str, kb):
+            a, b, ka, kb = b, a, kb, ka
+        k = (op, ka, kb)
+        try:
+            nd = self.table[k]
+            self.stats['shared'] += 1
+            return nd
+        except KeyError:
+            nd = self.table[k] = BinOp(FUNCTIONS[op], op, a, b)
+            return nd
+
+def clean(c):
+    '''Returns an optimized copy of circuit c. See the module docstring.'''
+
+    with nogc():
+        return sweep(c)
+
+def sweep(c):
+    stats = Counter()
+    build = Builder(stats)
+    index = c.index()
+    outputs = c.getOutputs()
+    live = index.reachable(outputs)
+    stats['dead'] += len(c.getSignals()) - len(live & c.getSignals())
+
+    # Rebuild the live signals in topological order. A reference to a
+    # signal is replaced by its new expression if the signal is a
+    # constant or an alias, or if it is an internal signal with a
+    # single fanout; otherwise it stays a reference.
+    exprs = dict()
+    inline = dict()
+    for x in c.order:
+        if not x in live:
+            continue
+        memo = dict()
+        stack = [c.getEquation(x)]
+        while stack:
+            nd = stack[-1]
+            if id(nd) in memo:
+                stack.pop()
+                continue
+            t = type(nd)
+            if t is Literal:
+                memo[id(nd)] = build.literal(nd.value)
+            elif t is Variable:
+                y = nd.name
+                try:
+                    memo[id(nd)] = inline[y]
+                except KeyError:
+                    memo[id(nd)] = build.variable(y)
+            elif t is BinOp or t is UnOp:
+                missing = [k for k in nd.kids if id(k) not in memo]
+                if missing:
+                    stack.extend(missing)
+                    continue
+                kids = [memo[id(k)] for k in nd.kids]
+                if t is UnOp:
+                    memo[id(nd)] = build.invert(kids[0])
+                else:
+                    memo[id(nd)] = build.binop(nd.getOp(), kids[0], kids[1])
+            else:
+                raise TypeError('invalid node')
+            stack.pop()
+        e = exprs[x] = memo[id(c.getEquation(x))]
+        if type(e) is Literal or type(e) is Variable:
+            stats['aliases'] += 1
+            inline[x] = e
+        elif not x in outputs and len(index.fanout[index.ids[x]]) == 1:
+            stats['collapsed'] += 1
+            inline[x] = e
+
+    # Keep the signals still referenced from the outputs
+    keep = []
+    seen = set()
+    pending = list(outputs)
+    for x in pending:
+        if x in seen or not x in exprs:
+            continue
+        seen.add(x)
+        keep.append(x)
+        for y in exprs[x].support():
+            if not y in seen:
+                pending.append(y)
+    stats['removed'] += len(live & exprs.keys()) - len(keep)
+
+    eqs = [(Variable(x), exprs[x]) for x in c.order if x in seen]
+    result = Circuit(c.name, [Variable(x) for x in c.getInputs()],
+                     [Variable(x) for x in outputs], eqs)
+    result.stats = stats
+    return result
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+
+'''CNF preprocessing.
+
+A Preprocessor simplifies a Cnf into an equisatisfiable one over the
+same VarPool, and turns a model of the simplified CNF back into a model
+of the original one. It runs, until nothing changes:
+
+ * unit propagation: fixed variables are removed from the clauses
+ * equivalent literal substitution: the strongly connected components
+   of the binary implication graph are equivalence classes of literals,
+   and each class is replaced by one representative
+ * subsumption and self-subsuming resolution: clauses containing
+   another clause are removed, and a literal l of a clause D is removed
+   if there is a clause C with ~l such that C - {~l} is contained in D
+ * bounded variable elimination: a variable is eliminated by replacing
+   the clauses containing it by all their resolvents on it, if there
+   are no more resolvents than clauses
+
+Each removed clause that is needed to rebuild a model is pushed on a
+stack, together with a witness literal: the model is extended by
+walking the stack backwards and making the witness true whenever its
+clause is false. Units and substituted variables are recorded in the
+same way.
+
+Frozen variables (such as the variables of assumptions) are never
+substituted or eliminated, and keep their unit clause if they are
+fixed, so that they can still be assumed in the simplified CNF.
+
+Each step is counted in a collections.Counter, stored in the attribute
+stats of the preprocessor.
+'''
+
+from collections import Counter, defaultdict
+
+# Variables with more occurrences are not eliminated
+MAX_OCCURRENCES = 16
+
+# Resolvents longer than this prevent the elimination of a variable
+MAX_RESOLVENT = 24
+
+# Candidates looked at for each clause by subsumption
+MAX_CANDIDATES = 1000
+
+class Preprocessor(object):
+    '''Simplifies a CNF. See the module docstring.'''
+
+    def __init__(self, cnf, frozen = ()):
+        self.cnf = cnf
+        self.ids = cnf.getIds()
+        self.frozen = set(map(abs, frozen))
+        self.clauses = []
+        self.occs = defaultdict(set)
+        self.values = dict()
+        self.units = []
+        self.touched = set()
+        self.stack = []
+        self.ok = True
+        self.stats = Counter()
+        for c in cnf.iterClauses():
+            self.add(c)
+        self.propagate()
+
+    # Clause database
+
+    def add(self, lits):
+        # Adds a clause, unless it is satisfied or a tautology. Unit
+        # clauses are queued for propagation instead.
+        c = set()
+        for l in lits:
+            v = self.values.get(abs(l))
+            if v is None:
+                c.add(l)
+            elif v == (l > 0):
+                return
+        if any(-l in c for l in c):
+            return
+        if len(c) == 0:
+            self.ok = False
+        elif len(c) == 1:
+            self.units.extend(c)
+        else:
+            i = len(self.clauses)
+            self.clauses.append(c)
+            for l in c:
+                self.occs[l].add(i)
+            self.touched.add(i)
+
+    def remove(self, i):
+        for l in self.clauses[i]:
+            self.occs[l].discard(i)
+        self.clauses[i] = None
+
+    def strengthen(self, i, l):
+        # Removes literal l from clause i
+        c = self.clauses[i]
+        c.discard(l)
+        self.occs[l].discard(i)
+        if len(c) == 1:
+            self.units.extend(c)
+            self.remove(i)
+        else:
+            self.touched.add(i)
+
+    def propagate(self):
+        while self.units and self.ok:
+            l = self.units.pop()
+            v = self.values.get(abs(l))
+            if v is not None:
+                if v != (l > 0):
+                    self.ok = False
+                continue
+            self.values[abs(l)] = l > 0
+            self.stack.append((l, ()))
+            self.stats['units'] += 1
+            for i in list(self.occs[l]):
+                self.remove(i)
+            for i in list(self.occs[-l]):
+                self.strengthen(i, -l)
+        return self.ok
+
+    # Equivalent literals
+
+    def components(self):
+        # Strongly connected components of the binary implication graph
+        # with more than one literal (iterative Tarjan)
+        graph = defaultdict(list)
+        for c in self.clauses:
+            if c is not None and len(c) == 2:
+                a, b = c
+                graph[-a].append(b)
+                graph[-b].append(a)
+        index = dict()
+        low = dict()
+        stack = []
+        onStack = set()
+        result = []
+        for root in list(graph):
+            if root in index:
+                continue
+            work = [(root, iter(graph[root]))]
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            onStack.add(root)
+            while work:
+                l, it = work[-1]
+                for m in it:
+                    if not m in index:
+                        index[m] = low[m] = len(index)
+                        stack.append(m)
+                        onStack.add(m)
+                        work.append((m, iter(graph[m])))
+                        break
+                    elif m in onStack:
+                        low[l] = min(low[l], index[m])
+                else:
+                    work.pop()
+                    if work:
+                        low[work[-1][0]] = min(low[work[-1][0]], low[l])
+                    if low[l] == index[l]:
+                        comp = []
+                        while True:
+                            m = stack.pop()
+                            onStack.discard(m)
+                            comp.append(m)
+                            if m == l:
+                                break
+                        if len(comp) > 1:
+                            result.append(comp)
+        return result
+
+    def substitute(self, x, r):
+        # Replaces variable x by literal r in all clauses
+        for i in list(self.occs[x]) + list(self.occs[-x]):
+            c = self.clauses[i]
+            self.remove(i)
+            self.add([r if l == x else -r if l == -x else l for l in c])
+        self.stack.append((x, (x, -r)))
+        self.stack.append((-x, (-x, r)))
+        self.stats['equivalences'] += 1
+
+    def equivalences(self):
+        for comp in self.components():
+            vs = {abs(l) for l in comp}
+            if len(vs) < len(comp):
+                # l and ~l in the same component
+                self.ok = False
+                return False
+            # Both components of a class and its negation choose the
+            # same representative variable
+            rep = min(comp, key = lambda l: (not abs(l) in self.frozen, abs(l)))
+            for l in comp:
+                if l > 0 and l != rep and not l in self.frozen and not l in self.values:
+                    self.substitute(l, rep)
+                    if not self.propagate():
+                        return False
+        return self.ok
+
+    # Subsumption
+
+    def subsume(self):
+        clauses, occs = self.clauses, self.occs
+        while self.touched and self.ok:
+            queue = sorted((i for i in self.touched if clauses[i] is not None),
+                           key = lambda i: len(clauses[i]))
+            self.touched = set()
+            for i in queue:
+                c = clauses[i]
+                if c is None:
+                    continue
+                p = min(c, key = lambda l: len(occs[l]) + len(occs[-l]))
+                if len(occs[p]) + len(occs[-p]) > MAX_CANDIDATES:
+                    continue
+                for j in list(occs[p]) + list(occs[-p]):
+                    d = clauses[j]
+                    if j == i or d is None or len(d) < len(c):
+                        continue
+                    diff = c - d
+                    if not diff:
+                        self.remove(j)
+                        self.stats['subsumed'] += 1
+                    elif len(diff) == 1:
+                        l, = diff
+                        if -l in d:
+                            self.strengthen(j, -l)
+                            self.stats['strengthened'] += 1
+                    if clauses[i] is not c:
+                        break
+                if not self.propagate():
+                    return False
+        return self.ok
+
+    # Variable elimination
+
+    def resolvents(self, v):
+        # Returns the resolvents of the clauses on v, or None if there
+        # are too many or too long ones
+        pos = [self.clauses[i] for i in self.occs[v]]
+        neg = [self.clauses[i] for i in self.occs[-v]]
+        result = []
+        for a in pos:
+            for b in neg:
+                r = (a | b) - {v, -v}
+                if any(-l in r for l in r):
+                    continue
+                if len(r) > MAX_RESOLVENT or len(result) == len(pos) + len(neg):
+                    return None
+                result.append(r)
+        return result
+
+    def eliminate(self):
+        occs = self.occs
+        candidates = {abs(l) for l, s in occs.items() if s}
+        candidates -= self.frozen
+        for v in sorted(candidates, key = lambda v: len(occs[v]) + len(occs[-v])):
+            if v in self.values or len(occs[v]) + len(occs[-v]) == 0:
+                continue
+            if len(occs[v]) > MAX_OCCURRENCES and len(occs[-v]) > MAX_OCCURRENCES:
+                continue
+            resolvents = self.resolvents(v)
+            if resolvents is None:
+                continue
+            for l in (v, -v):
+                for i in list(occs[l]):
+                    self.stack.append((l, tuple(self.clauses[i])))
+                    self.remove(i)
+            for r in resolvents:
+                self.add(r)
+            self.stats['eliminated'] += 1
+            if not (self.propagate() and self.subsume()):
+                break
+        return self.ok
+
+    def simplify(self):
+        '''Runs all simplifications. Returns the simplified Cnf, or None if
+        the CNF was found unsatisfiable.'''
+        from circuit.cnf import Cnf
+
+        self.stats['clauses'] = len(self.cnf)
+        self.stats['variables'] = len(self.ids)
+        while True:
+            steps = sum(self.stats.values())
+            if not (self.equivalences() and self.subsume()):
+                break
+            self.eliminate()
+            if not self.ok or sum(self.stats.values()) == steps:
+                break
+        if not self.ok:
+            return None
+
+        cnf = Cnf(pool = self.cnf.pool)
+        for v in sorted(self.frozen):
+            if v in self.values:
+                cnf.addClause([v if self.values[v] else -v])
+        for c in self.clauses:
+            if c is not None:
+                cnf.addClause(sorted(c, key = abs))
+        return cnf
+
+    def extend(self, model):
+        '''Returns a model (dict from variable ids to Booleans) of the
+        original CNF, extending model, a model of the simplified CNF.
+        Variables neither in model nor fixed by the simplifications are
+        False.'''
+        model = dict(model)
+        for l, c in reversed(self.stack):
+            if not any(model.get(abs(q), False) == (q > 0) for q in c):
+                model[abs(l)] = l > 0
+        return {i: model.get(i, False) for i in self.ids | model.keys()}
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+'''Compiled, levelized form of a circuit.
+
+A Program is a flat list of instructions (op, dst, src1, src2) over
+integer slots. Slot 0 holds the constant 0, slot 1 the constant 1, the
+next slots hold the inputs (in sorted order), and every gate of the
+circuit writes to a slot of its own. Named signals are aliases for the
+slot computing their equation, so shared subexpressions are evaluated
+exactly once. Instructions are sorted by logic level: all sources of an
+instruction are written by earlier levels.
+
+Programs are built by Circuit.compile(), which caches the result on the
+circuit.
+'''
+
+from array import array
+
+from circuit.circuit import Literal, Variable, BinOp, UnOp, Gate, OPKINDS
+
+# Opcodes, which are the gate kinds of the nodes
+AND = Gate.AND
+OR = Gate.OR
+XOR = Gate.XOR
+NOT = Gate.NOT
+
+OPCODES = OPKINDS
+OPSTRINGS = {v: k for k, v in OPCODES.items()}
+
+# Reserved slots for the constants
+ZERO = 0
+ONE = 1
+
+class Program(object):
+    '''Flat instruction array for a circuit.'''
+
+    def __init__(self, c):
+        self.inputs = sorted(c.getInputs())
+        self.outputs = sorted(c.getOutputs())
+        self.slots = {x: ONE + 1 + i for i, x in enumerate(self.inputs)}
+        self.nslots = ONE + 1 + len(self.inputs)
+        self.ops = array('i')
+        self.dst = array('i')
+        self.src1 = array('i')
+        self.src2 = array('i')
+        self.order = []
+        self.cache = dict()
+        self.build(c)
+
+    def build(self, c):
+        slots = self.slots
+        depth = [0] * self.nslots
+        nodes = dict()
+        gates = []
+
+        # Iterative post-order traversal of all equations, in the
+        # topological order computed by Circuit.check(). Items on the
+        # stack are either nodes or signal names; a signal is assigned
+        # the slot of its equation's root once that root is compiled.
+        for x in c.order:
+            stack = [x]
+            while stack:
+                item = stack[-1]
+                if type(item) is str:
+                    if item in slots:
+                        stack.pop()
+                        continue
+                    root = c.getEquation(item)
+                    try:
+                        slots[item] = nodes[id(root)]
+                        self.order.append(item)
+                        stack.pop()
+                    except KeyError:
+                        stack.append(root)
+                    continue
+                if id(item) in nodes:
+                    stack.pop()
+                    continue
+                t = type(item)
+                if t is Literal:
+                    nodes[id(item)] = ONE if item.getValue() else ZERO
+                    stack.pop()
+                elif t is Variable:
+                    y = item.getName()
+                    try:
+                        nodes[id(item)] = slots[y]
+                        stack.pop()
+                    except KeyError:
+                        stack.append(y)
+                elif t is BinOp or t is UnOp:
+                    missing = [k for k in item.getChildren() if id(k) not in nodes]
+                    if missing:
+                        stack.extend(missing)
+                        continue
+                    srcs = [nodes[id(k)] for k in item.getChildren()]
+                    dst = self.nslots
+                    self.nslots += 1
+                    depth.append(1 + max(depth[s] for s in srcs))
+                    op = item.kind
+                    gates.append((op, dst, srcs[0], srcs[-1]))
+                    nodes[id(item)] = dst
+                    stack.pop()
+                else:
+                    raise TypeError('invalid node')
+
+        # Levelize: stable sort of the instructions by logic level
+        gates.sort(key=lambda g: depth[g[1]])
+        self.levels = []
+        for i, (op, dst, a, b) in enumerate(gates):
+            self.ops.append(op)
+            self.dst.append(dst)
+            self.src1.append(a)
+            self.src2.append(b)
+            if not self.levels or depth[dst] != depth[gates[i-1][1]]:
+                self.levels.append(i)
+        self.levels.append(len(gates))
+
+    def __len__(self):
+        return len(self.ops)
+
+    def getLevels(self):
+        '''Returns a list of (start, end) instruction index ranges, one per
+        logic level.'''
+        return list(zip(self.levels[:-1], self.levels[1:]))
+
+    def instructions(self):
+        '''Iterate over the instructions as (op, dst, src1, src2) tuples.'''
+        return zip(self.ops, self.dst, self.src1, self.src2)
+
+    def run(self, inputs, mask=True):
+        '''Interpret the program. Takes a dictionary mapping input names to
+        values and returns the list of slot values. Values are either
+        Booleans (the default) or Python ints used as bit-vectors, in
+        which case mask must have all used bits set, e.g. (1 << n) - 1.
+        '''
+
+        v = [mask ^ mask] * self.nslots
+        v[ONE] = mask
+        for x in self.inputs:
+            v[self.slots[x]] = inputs[x]
+        for op, d, a, b in zip(self.ops, self.dst, self.src1, self.src2):
+            if op == AND:
+                v[d] = v[a] & v[b]
+            elif op == OR:
+                v[d] = v[a] | v[b]
+            elif op == XOR:
+                v[d] = v[a] ^ v[b]
+            else:
+                v[d] = v[a] ^ mask
+        return v
+
+    def simulate(self, inputs, mask=True):
+        '''Like run(), but returns a dictionary mapping input, output and
+        internal signal names to values.'''
+
+        v = self.run(inputs, mask)
+        return {x: v[s] for x, s in self.slots.items()}
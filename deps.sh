@@ -1,6 +1,6 @@
 #!/bin/sh
 
-PACKAGES='satispy funcparserlib'
+PACKAGES='satispy funcparserlib numpy'
 
 for PACK in $PACKAGES; do
     echo $PACK
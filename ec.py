@@ -1,12 +1,8 @@
 #!/usr/bin/env python3
 
-import sys
-
-import circuit.circuit as circ
-from circuit.cnf import SatVar, Solver, Solution, Cnf
+from circuit.cnf import SatVar, Solver, Solution, VarPool
 from circuit.circuit import Circuit
-from transform import transform
-from adder import *
+from transform import transform, emit_eq, emit_or, emit_xor
 
 # Implementation hints:
 #
@@ -23,7 +19,60 @@ from adder import *
 #
 # 3) Run the test script to see if your code works!
 
-def check(c1: Circuit, c2: Circuit) -> (bool, Solution):
+# Input vectors simulated before the miter goes to the SAT solver
+SIM_VECTORS = 4096
+
+def vectors(n, count, seed=0):
+    '''Returns packed words (see circuit.batch.pack) of at least count
+    input vectors over n inputs: the corner cases (all zeros, all ones,
+    a single one and a single zero) followed by random vectors.'''
+    import numpy as np
+    from circuit.batch import pack, WORD
+
+    corners = np.zeros((2 * n + 2, n), dtype=bool)
+    corners[1] = True
+    corners[2:n + 2] = np.eye(n, dtype=bool)
+    corners[n + 2:] = ~np.eye(n, dtype=bool)
+    # The padding bits of the corner words repeat the all-zeros vector
+    words = pack(corners)
+    nwords = max(-(-count // WORD) - words.shape[1], 0)
+    rng = np.random.default_rng(seed)
+    rest = rng.integers(0, 2**64, size=(n, nwords), dtype=np.uint64)
+    return np.concatenate((words, rest), axis=1)
+
+def simulate(c1: Circuit, c2: Circuit, count: int=SIM_VECTORS):
+    '''Looks for input values on which the outputs of c1 and c2 differ, by
+    bit-parallel simulation of count corner-case and random input
+    vectors (requires numpy). Returns None if there are none, and
+    otherwise a counterexample (see counterexample()).'''
+    import numpy as np
+    from circuit.batch import unpack
+
+    inputs = sorted(c1.getInputs())
+    words = vectors(len(inputs), count)
+    r1 = c1.simulate_batch(words)
+    r2 = c2.simulate_batch(words)
+    diff = np.zeros(words.shape[1], dtype=np.uint64)
+    for x in c1.getOutputs():
+        diff |= r1[x] ^ r2[x]
+    hits = np.flatnonzero(unpack(diff))
+    if not len(hits):
+        return None
+
+    bits = unpack(words, hits[0] + 1)[hits[0]]
+    return counterexample(c1, c2, {x: bool(b) for x, b in zip(inputs, bits)})
+
+def counterexample(c1: Circuit, c2: Circuit, values):
+    '''Returns the counterexample for the input values given as a dict,
+    shaped like the assignment of the SAT solution: the inputs, and all
+    signals of c1 and c2 prefixed by c1_ and c2_.'''
+    cex = dict(values)
+    for prefix, c in (("c1_", c1), ("c2_", c2)):
+        for x, b in c.simulate(values).items():
+            cex[prefix + x] = b
+    return cex
+
+def check(c1: Circuit, c2: Circuit, simulation: bool=True, sweep: bool=False) -> (bool, Solution):
     '''The function check() takes two Circuits as input and performs an equivalence
     check using a SAT solver. it returns a tuple, where the first entry is a
     Boolean value (True for equivalent, False for different) and the second
@@ -31,67 +80,92 @@ def check(c1: Circuit, c2: Circuit) -> (bool, Solution):
     SAT problem, representing a counterexample. If the circuits are indeed
     equivalent, the second entry will be None.
 
+    Unless simulation is False, the circuits are first simulated on
+    random input vectors (see simulate()), and a difference found this
+    way is returned as the counterexample without calling the solver.
+
+    If sweep is True, the miter is solved by SAT sweeping instead (see
+    circuit.fraig), which proves the internal equivalences between the
+    two circuits one by one with small SAT calls.
     '''
 
     if not (c1.getInputs() == c2.getInputs() and c1.getOutputs() == c2.getOutputs()):
         return (False, None)
 
-    cnf1 = transform(c1, "c1_")
-    cnf2 = transform(c2, "c2_")
-
-    cnf = cnf1 & cnf2
-
-    # Inputs should be the same.
-    # Mitter_input isn't necessary. (Only here to preserve the name of the entree. Easier to get along with)
-    for input in c1.getInputs():
-        mitter_input = SatVar(input)
-        c1_input = SatVar("c1_" + input)
-        c2_input = SatVar("c2_" + input)
-        cnf = cnf & mk_eq(mitter_input, c1_input) & mk_eq(mitter_input, c2_input)
-
-    outputs = list(c1.getOutputs())
-    n = len(outputs)
-    s = SatVar("mitter_output")
-
-    # Computation of the mitter output :
-    # Xor of the outputs of the Circuits
-    # Then an or of all these xor (as we only have made a binary_or function, we do as many or as needed)
-    #
-    # The code would be simplier if a 1 Litteral were added to always make a binary or, even when there only is one xor
-    # But it would be less efficient.
-    if n == 1:
-        c1_output = SatVar("c1_" + outputs[0])
-        c2_output = SatVar("c2_" + outputs[0])
-        cnf = cnf & mk_xor(s, c1_output, c2_output)
-    else:
-        for i, output in enumerate(outputs):
-            c1_output = SatVar("c1_" + output)
-            c2_output = SatVar("c2_" + output)
-            xor_output = SatVar("mitter_xor_" + output)
-            cnf = cnf & mk_xor(xor_output, c1_output, c2_output)
-
-            if i == 1:
-                ith_or = SatVar("mitter_or_1")
-                if i + 1 == n:
-                    ith_or = s
-
-                xor_prev = SatVar("mitter_xor_" + outputs[0]) # = [i-1]
-
-                cnf = cnf & mk_or(ith_or, xor_prev, xor_output)
-            if i>1:
-                ith_or = SatVar("mitter_or_" + str(i))
-                if i + 1 == n:
-                    ith_or = s
-
-                or_prev = SatVar("mitter_or_" + str(i-1))
-                cnf = cnf & mk_or(ith_or, or_prev, xor_output)
-
-
-    cnf = cnf & s
-
-    solution = Solver().solve(cnf)
-
-    if not solution:
-        return (True, None)
-    else:
-        return (False, solution.assignment)
+    if simulation:
+        try:
+            cex = simulate(c1, c2)
+        except ImportError:
+            cex = None
+        if cex is not None:
+            return (False, cex)
+
+    if sweep:
+        import circuit.fraig as fraig
+        r, values = fraig.check(c1, c2)
+        return (True, None) if r else (False, counterexample(c1, c2, values))
+
+    # Each check numbers its variables from 1, and the names are
+    # released afterwards
+    with VarPool():
+        # All clauses go straight into the solver, which simplifies
+        # them before solving
+        solver = Solver(preprocess = True)
+        transform(c1, "c1_", solver)
+        transform(c2, "c2_", solver)
+
+        # Inputs should be the same.
+        # Mitter_input isn't necessary. (Only here to preserve the name of the entree. Easier to get along with)
+        for input in c1.getInputs():
+            mitter_input = int(SatVar(input))
+            c1_input = int(SatVar("c1_" + input))
+            c2_input = int(SatVar("c2_" + input))
+            emit_eq(solver, mitter_input, c1_input)
+            emit_eq(solver, mitter_input, c2_input)
+
+        outputs = list(c1.getOutputs())
+        n = len(outputs)
+        s = int(SatVar("mitter_output"))
+
+        # Computation of the mitter output :
+        # Xor of the outputs of the Circuits
+        # Then an or of all these xor (as we only have made a binary_or function, we do as many or as needed)
+        #
+        # The code would be simplier if a 1 Litteral were added to always make a binary or, even when there only is one xor
+        # But it would be less efficient.
+        if n == 1:
+            c1_output = int(SatVar("c1_" + outputs[0]))
+            c2_output = int(SatVar("c2_" + outputs[0]))
+            emit_xor(solver, s, c1_output, c2_output)
+        else:
+            for i, output in enumerate(outputs):
+                c1_output = int(SatVar("c1_" + output))
+                c2_output = int(SatVar("c2_" + output))
+                xor_output = int(SatVar("mitter_xor_" + output))
+                emit_xor(solver, xor_output, c1_output, c2_output)
+
+                if i == 1:
+                    ith_or = int(SatVar("mitter_or_1"))
+                    if i + 1 == n:
+                        ith_or = s
+
+                    xor_prev = int(SatVar("mitter_xor_" + outputs[0])) # = [i-1]
+
+                    emit_or(solver, ith_or, xor_prev, xor_output)
+                if i>1:
+                    ith_or = int(SatVar("mitter_or_" + str(i)))
+                    if i + 1 == n:
+                        ith_or = s
+
+                    or_prev = int(SatVar("mitter_or_" + str(i-1)))
+                    emit_or(solver, ith_or, or_prev, xor_output)
+
+
+        solver.addClause([s])
+
+        solution = solver.solve()
+
+        if not solution:
+            return (True, None)
+        else:
+            return (False, solution.assignment)
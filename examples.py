@@ -135,3 +135,14 @@ solution = solver.solve(cnf)
 print (solution)
 assert (not solution)
 
+
+# Clauses can also be added to the solver itself, and assumptions are
+# literals assumed true for one call to solve() only
+solver = Solver()
+solver.add_clause(x | y)
+solver.add_clause(~x | z)
+solution = solver.solve(assumptions=[~y, ~z])
+print (solution)
+print ("Failed assumptions: {}".format(solution.failed))
+solution = solver.solve(assumptions=[~y])
+print (solution)
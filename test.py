@@ -1,16 +1,24 @@
 #!/usr/bin/env python3
 
+import io
 import os
+import tempfile
 import traceback
 
 import circuit.circuit as circ
-from circuit.cnf import SatVar, Solver
+from circuit.cnf import SatVar, Solver, readDimacs
+from circuit.cnf import allSAT as cnf_allSAT
 import transform
 import ec
 
 # This file contains test code for your implementations. You can run
 # it in order to debug your code.
 
+# Parsed circuits are cached in a temporary directory, removed at exit,
+# rather than in the user's cache directory
+cache_dir = tempfile.TemporaryDirectory()
+os.environ['CIRCUIT_CACHE_DIR'] = cache_dir.name
+
 red = '\033[31m'
 blue = '\033[34;1m'
 green = '\033[32m'
@@ -105,17 +113,13 @@ def test_adder():
 # Test code for transform()
 # =============================================================================
 
-# Generator function to enumerate solutions
+# Generator function to enumerate solutions, projected on blockVars (all
+# variables if None), yielding None forever once they are exhausted
 def allSAT(cnf, blockVars = None):
-    solver = Solver()
-    while True:
-        solution = solver.solve(cnf)
-        if not solution:
-            while True:
-                yield None
+    for solution in cnf_allSAT(cnf, blockVars):
         yield solution
-        block = ~solution
-        cnf &= block
+    while True:
+        yield None
 
 # Test if solutions of CNF are consistent with circuit simulations
 def check(filename, max_tests):
@@ -161,6 +165,47 @@ def check(filename, max_tests):
         tests += 1
     return (True, good, tests)
 
+# Test the encodings of transform() with options on random input vectors.
+# The outputs are constrained to the values they are used with: true for
+# POSITIVE, false for NEGATIVE and their simulated value otherwise; the
+# CNF must be satisfiable exactly when the simulation agrees, and then
+# give the simulated values to the outputs used with both polarities and
+# to the signals in keep.
+def check_encoding(c, max_tests, polarity = None, keep = (), **options):
+    import random
+    from circuit.cnf import VarPool
+
+    if polarity is None:
+        polarity = dict()
+
+    with VarPool():
+        cnf = transform.transform(c, polarity = polarity, keep = keep, **options)
+        inputs = sorted(c.getInputs())
+        solver = Solver('cdcl')
+        for _ in range(max_tests):
+            values = {x: random.choice([False, True]) for x in inputs}
+            result = c.simulate(values)
+            assumptions = [SatVar(x) if values[x] else ~SatVar(x) for x in inputs]
+            expected = True
+            for o in c.getOutputs():
+                p = polarity.get(o, transform.BOTH)
+                b = result[o] if p == transform.BOTH else p == transform.POSITIVE
+                expected &= b == result[o]
+                assumptions.append(SatVar(o) if b else ~SatVar(o))
+            solution = solver.solve(cnf, assumptions)
+            if bool(solution) != expected:
+                print_error("Wrong satisfiability of circuit '%s' with %s" % (c.name, options))
+                return False
+            if not solution:
+                continue
+            read = list(keep) + [o for o in c.getOutputs() if not o in polarity]
+            for x in read:
+                if solution[x] != result[x]:
+                    print_error("Wrong value for signal '%s' of circuit '%s' with %s"
+                                % (x, c.name, options))
+                    return False
+    return True
+
 def test_transform(max_tests = 10):
     import transform
 
@@ -171,14 +216,131 @@ def test_transform(max_tests = 10):
         print_info("Testing transformation of circuit '%s'" % bench)
         b,i,j = check(bench, max_tests)
         all_passed = b and (i == j) and all_passed
+
+    # Plaisted-Greenbaum encoding: one output constrained true, one
+    # constrained false, and one internal signal read back
+    print_info("Testing the Plaisted-Greenbaum encoding")
+    for bench in benchmarks:
+        c = circ.parse(bench)
+        outputs = sorted(c.getOutputs())
+        polarity = {outputs[0]: transform.POSITIVE}
+        if len(outputs) > 1:
+            polarity[outputs[-1]] = transform.NEGATIVE
+        keep = sorted(set(c.getSignals()) - c.getOutputs())[:1]
+        all_passed = check_encoding(c, max_tests, encoding = 'pg') and all_passed
+        all_passed = check_encoding(c, max_tests, polarity, keep, encoding = 'pg') and all_passed
+
+    # Chains of gates merged into n-ary gates, with ^ chains longer than
+    # XOR_WIDTH, and nodes shared between chains and with other gates
+    print_info("Testing the encoding of gate chains")
+    width = transform.XOR_WIDTH
+    xs = ['x%d' % i for i in range(2 * width + 3)]
+    text = """circ chains {
+        inputs: %s
+        outputs: p, q, r, s, t, u
+        p = %s
+        q = (%s) & ~(%s) & x0
+        r = (%s) | (x1 & x2 & x3)
+        s = q ^ r ^ x2 ^ x4 ^ x5
+        t = ~(x0 | x1 | x2) ^ (x3 & x4 & x5) ^ (x1 ^ x2 ^ x3 ^ x4)
+        u = (x1 ^ x2 ^ x3 ^ x4) & (x0 | x1 | x2)
+    }""" % (', '.join(xs), ' ^ '.join(xs), ' & '.join(xs[:width + 2]),
+            ' | '.join(xs[1:]), ' ^ '.join(reversed(xs)))
+    # Cleaning shares the identical gates between the equations
+    chains = [circ.Parser(text).circuit()]
+    chains.append(chains[0].clean())
+    chains += [circ.parse(bench) for bench in benchmarks]
+    for c in chains:
+        outputs = sorted(c.getOutputs())
+        polarity = {outputs[0]: transform.POSITIVE}
+        if len(outputs) > 1:
+            polarity[outputs[-1]] = transform.NEGATIVE
+        for encoding in ('tseitin', 'pg'):
+            all_passed = check_encoding(c, 4 * max_tests, encoding = encoding,
+                                        flatten = True) and all_passed
+            all_passed = check_encoding(c, 4 * max_tests, polarity, encoding = encoding,
+                                        flatten = True) and all_passed
+
+    # Signals that no output needs are left out
+    c = circ.Parser('circ dead { inputs: a, b outputs: o d = a & b o = a | b }').circuit()
+    cnf = transform.transform(c, encoding = 'pg', polarity = {'o': transform.POSITIVE})
+    names = {cnf.pool.name(i) for i in cnf.getIds()}
+    if 'd' in names or not 'o' in names:
+        print_error("Wrong signals in the Plaisted-Greenbaum encoding: %s" % sorted(names))
+        all_passed = False
+
+    # Auxiliary variables never stand for a signal
+    print_info("Testing signals named like auxiliary variables")
+    c = auxiliary_names()[0]
+    cnf = transform.transform(c)
+    solution = Solver('cdcl').solve(cnf, [SatVar('a'), SatVar('b')])
+    if not solution or not solution['o'] or solution['s%d' % (c.getEquation('o').kids[0].id)]:
+        print_error("A signal and an auxiliary variable of circuit '%s' share a name" % c.name)
+        all_passed = False
+    for c in auxiliary_names():
+        for encoding in ('tseitin', 'pg'):
+            all_passed = check_encoding(c, 4 * max_tests, encoding = encoding,
+                                        flatten = True) and all_passed
+
+    # Clauses streamed into a DIMACS file
+    print_info("Testing the DIMACS clause sink")
+    for bench in benchmarks:
+        all_passed = check_sink(circ.parse(bench)) and all_passed
     return all_passed
 
+# Circuits with signals named like the auxiliary variables of the
+# encodings used to be: s<node id> for a gate of transform(), and
+# s<node id>_<k> for the parity constraints of a flattened ^ chain
+def auxiliary_names():
+    from circuit.circuit import Circuit, Variable, BinOp, UnOp
+
+    a, b = Variable('a'), Variable('b')
+    g = BinOp(None, '&', a, b)
+    x = 's%d' % g.getID()
+    o = BinOp(None, '|', g, Variable(x))
+    c1 = Circuit('aux', [Variable('a'), Variable('b')], [Variable('o')],
+                 [(Variable('o'), o), (Variable(x), UnOp(None, '~', Variable('a')))])
+
+    xs = ['x%d' % i for i in range(2 * transform.XOR_WIDTH + 1)]
+    e = Variable(xs[0])
+    for y in xs[1:]:
+        e = BinOp(None, '^', e, Variable(y))
+    ys = ['s%d_%d' % (e.getID(), k) for k in (1, 2)]
+    eqs = [(Variable('o'), e)]
+    eqs += [(Variable(y), UnOp(None, '~', Variable(xs[k]))) for k, y in enumerate(ys)]
+    c2 = Circuit('xaux', [Variable(y) for y in xs], [Variable(y) for y in ['o'] + ys], eqs)
+    return [c1, c2]
+
+# Test that transform() writes the same clauses to a DimacsSink as to a
+# Cnf, under a header with the right counts
+def check_sink(c):
+    import tempfile
+    from circuit.cnf import VarPool, DimacsSink
+
+    with VarPool(), tempfile.TemporaryDirectory() as d:
+        cnf = transform.transform(c)
+        filename = os.path.join(d, 'sink.cnf')
+        with DimacsSink(filename) as sink:
+            if transform.transform(c, sink = sink) is not sink:
+                print_error("transform() did not return the sink")
+                return False
+        with open(filename) as f:
+            header = f.readline().split()
+            clauses = [[int(l) for l in line.split()] for line in f]
+    if header != ['p', 'cnf', str(cnf.maxVar), str(len(cnf))]:
+        print_error("Wrong DIMACS header for circuit '%s': %s" % (c.name, ' '.join(header)))
+        return False
+    if clauses != [list(cls) + [0] for cls in cnf.iterClauses()]:
+        print_error("Wrong DIMACS clauses for circuit '%s'" % c.name)
+        return False
+    return True
+
 # =============================================================================
 # Test code for equivalence checker
 # =============================================================================
 
-def check_ec(c1, c2, result):
-    r, cex  = ec.check(c1, c2)
+def check_ec(c1, c2, result, sweep=False):
+    r, cex  = ec.check(c1, c2, sweep = sweep)
     if r:
         print_result("Circuits are EQUIVALENT")
     else:
@@ -188,6 +350,14 @@ def check_ec(c1, c2, result):
             print_error('Circuits are equivalent, but reported different.')
         else:
             print_error('Circuits are different, but reported equivalent.')
+    elif cex is not None:
+        # The counterexample must tell the circuits apart
+        inputs = {x: cex[x] for x in c1.getInputs()}
+        s1 = c1.simulate(inputs)
+        s2 = c2.simulate(inputs)
+        if all(s1[o] == s2[o] for o in c1.getOutputs()):
+            print_error('The counterexample does not distinguish the circuits.')
+            return False
     return r == result
 
 def test_ec():
@@ -235,8 +405,485 @@ def test_ec():
     succ &= check_ec(flt32, cla32, False)
     succ &= check_ec(cra32, flt32, False)
 
+    # The same with SAT sweeping
+    succ &= check_ec(adder1, adder4, False, True)
+    succ &= check_ec(cra16, cla16, True, True)
+    succ &= check_ec(flt16, cla16, False, True)
+    succ &= check_ec(cra32, cla32, True, True)
+    succ &= check_ec(cra32, flt32, False, True)
+
+    # Inputs named like the auxiliary variables the SAT sweeping and the
+    # AIG encoding used to use
+    import re
+    import circuit.aig as aig
+    for prefix in ('aig_', 'fraig_'):
+        def renamed(filename):
+            with open(filename) as f:
+                text = f.read()
+            return circ.Parser(re.sub(r'\b([ab])_(\d+)\b', lambda m: '%s%d' %
+                (prefix, (20 if m.group(1) == 'a' else 30) + int(m.group(2))), text)).circuit()
+        cra8 = renamed('benchmarks/cra8.crc')
+        cla8 = renamed('benchmarks/cla8.crc')
+        flt8 = renamed('benchmarks/faulty8.crc')
+        for c1, c2, result in ((cra8, cla8, True), (flt8, cla8, False)):
+            for name, check in (('ec.check(sweep = True)',
+                                 lambda: ec.check(c1, c2, simulation = False, sweep = True)),
+                                ('aig.check()', lambda: aig.check(c1, c2))):
+                r, cex = check()
+                if r != result:
+                    print_error("Wrong result of %s with inputs named %s*" % (name, prefix))
+                    succ = False
+
     return succ
 
+# =============================================================================
+# Test code for the fast simulation engines
+# =============================================================================
+
+def check_simulation(filename, n):
+    import random
+    from circuit.batch import unpack
+
+    c = circ.parse(filename)
+    inputs = sorted(c.getInputs())
+    vectors = [{i: random.choice([False, True]) for i in inputs} for _ in range(n)]
+    batch = c.simulate_batch([[v[i] for i in inputs] for v in vectors])
+    cleaned = c.clean()
+    aig = c.toAig()
+    good = True
+    for j, v in enumerate(vectors):
+        expected = c.simulate(v)
+        compiled = c.compiled_eval(v)
+        outputs = cleaned.simulate(v)
+        if c.compiled_eval(v, outputs = True) != {x: expected[x] for x in c.getOutputs()}:
+            print_error("compiled_eval: wrong outputs")
+            good = False
+        for x, b in aig.simulate(v).items():
+            if expected[x] != b:
+                print_error("aig: wrong value for signal '%s'" % x)
+                good = False
+        for x in c.getOutputs():
+            if outputs[x] != expected[x]:
+                print_error("clean: wrong value for output '%s'" % x)
+                good = False
+        for x, b in expected.items():
+            if unpack(batch[x], n)[j] != b:
+                print_error("simulate_batch: wrong value for signal '%s'" % x)
+                good = False
+            if compiled[x] != b:
+                print_error("compiled_eval: wrong value for signal '%s'" % x)
+                good = False
+    return good
+
+def test_simulation(n = 100):
+    files = filter(lambda f: f.endswith('.crc'), os.listdir('./benchmarks'))
+    all_passed = True
+    for f in files:
+        print_info("Testing simulation of circuit './benchmarks/%s'" % f)
+        all_passed = check_simulation('./benchmarks/' + f, n) and all_passed
+    return all_passed
+
+# =============================================================================
+# Test code for the parser
+# =============================================================================
+
+# Malformed circuits, with the line number and the column range of the
+# syntax error they must report
+syntax_errors = [
+    ("circ t {\n  inputs: a\n  outputs: o\n  o = a &\n}\n", 5, 0, 1),
+    ("circ t {\n  inputs: a\n  outputs: o\n  o = a", 4, 7, 7),
+    ("circ t { inputs: a outputs: o\n  o = a $ a }", 2, 8, 9),
+    ("circ t { inputs: a outputs: o\n  o = 2 }", 2, 6, 7),
+    ("circ t { inputs: a outputs: o o = a }\n\nx", 3, 0, 1),
+    ("circuit t { inputs: a outputs: o o = a }", 1, 0, 7),
+    ("", 1, 0, 0),
+]
+
+def test_parser():
+    import tempfile
+
+    all_passed = True
+    files = filter(lambda f: f.endswith('.crc'), os.listdir('./benchmarks'))
+    for f in files:
+        print_info("Testing stream parsing of circuit './benchmarks/%s'" % f)
+        c1 = circ.read('./benchmarks/' + f)
+        c2 = circ.read('./benchmarks/' + f, stream = True)
+        if repr(c1) != repr(c2):
+            print_error("Stream and string modes parse different circuits")
+            all_passed = False
+
+    print_info("Testing syntax errors")
+    with tempfile.TemporaryDirectory() as d:
+        filename = os.path.join(d, 'error.crc')
+        for text, lineNo, start, end in syntax_errors:
+            with open(filename, 'w') as f:
+                f.write(text)
+            for stream in (False, True):
+                try:
+                    circ.read(filename, stream)
+                    print_error("No syntax error reported in %r" % text)
+                    all_passed = False
+                except circ.ParseException as e:
+                    if (e.lineNo, e.start, e.end) != (lineNo, start, end):
+                        print_error("Syntax error in %r reported at line %d, columns %d-%d"
+                                    % (text, e.lineNo, e.start, e.end))
+                        all_passed = False
+                    if e.line != text.split('\n')[lineNo - 1]:
+                        print_error("Wrong line text '%s' reported for %r" % (e.line, text))
+                        all_passed = False
+    return all_passed
+
+def test_cache():
+    import tempfile
+    import circuit.cache as store
+
+    all_passed = True
+    saved = os.environ.get('CIRCUIT_CACHE_DIR')
+    with tempfile.TemporaryDirectory() as d:
+        os.environ['CIRCUIT_CACHE_DIR'] = os.path.join(d, 'cache')
+        try:
+            files = filter(lambda f: f.endswith('.crc'), os.listdir('./benchmarks'))
+            for f in files:
+                print_info("Testing the cache with circuit './benchmarks/%s'" % f)
+                filename = './benchmarks/' + f
+                c = circ.parse(filename, cache = True)
+                cached = store.load(store.key(filename))
+                if cached is None:
+                    print_error("Circuit was not stored in the cache")
+                    all_passed = False
+                    continue
+                # Loaded circuits list their equations in topological order
+                if list(cached.getSignals()) != cached.order or cached.order != c.order:
+                    print_error("Cached equations are not in topological order")
+                    all_passed = False
+                if (cached.name, cached.getInputs(), cached.getOutputs()) != \
+                   (c.name, c.getInputs(), c.getOutputs()):
+                    print_error("Cached circuit has a wrong interface")
+                    all_passed = False
+                for x in c.getSignals():
+                    if repr(cached.getEquation(x)) != repr(c.getEquation(x)):
+                        print_error("Wrong cached equation for signal '%s'" % x)
+                        all_passed = False
+
+            # Changing the source invalidates the entry
+            print_info("Testing the invalidation of cache entries")
+            filename = os.path.join(d, 'changed.crc')
+            for op in ('&', '|'):
+                with open(filename, 'w') as out:
+                    out.write('circ t { inputs: a, b outputs: o o = a %s b }' % op)
+                circ.parse(filename, cache = True)
+                c = circ.parse(filename, cache = True)
+                if repr(c.getEquation('o')) != '(a %s b)' % op:
+                    print_error("Stale circuit loaded after a change of the source")
+                    all_passed = False
+
+            # Bad entries are never decoded, and are removed
+            print_info("Testing the rejection of bad cache entries")
+            k = store.key(filename)
+            path = os.path.join(store.directory(), k)
+            def version(a):
+                a[0] = store.VERSION + 1
+            def node(a):
+                a[-1] = 1000
+            def truncate(a):
+                with open(path + '.npy', 'r+b') as f:
+                    f.truncate(f.seek(0, os.SEEK_END) - 4)
+            for corrupt in (version, node, truncate):
+                a = store.np.load(path + '.npy')
+                corrupt(a)
+                if corrupt is not truncate:
+                    store.np.save(path + '.npy', a)
+                if store.load(k) is not None:
+                    print_error("Bad cache entry loaded (%s)" % corrupt.__name__)
+                    all_passed = False
+                if os.path.exists(path + '.npy') or os.path.exists(path + '.names'):
+                    print_error("Bad cache entry not removed (%s)" % corrupt.__name__)
+                    all_passed = False
+                c = circ.parse(filename, cache = True)
+                if repr(c.getEquation('o')) != '(a | b)':
+                    print_error("Wrong circuit parsed after a bad cache entry")
+                    all_passed = False
+        finally:
+            if saved is None:
+                del os.environ['CIRCUIT_CACHE_DIR']
+            else:
+                os.environ['CIRCUIT_CACHE_DIR'] = saved
+    return all_passed
+
+# Circuits with combinational loops, and the signals on the loop
+loops = [
+    ('circ l { inputs: a, b outputs: o, r  o = p & a  p = q | b  q = ~o  r = o ^ a }',
+     {'o', 'p', 'q'}),
+    ('circ l { inputs: a outputs: o  o = s  s = s & a }', {'s'}),
+    ('circ l { inputs: a outputs: o  o = (p & a) | (s ^ a)  p = ~s  s = p | t  t = a }',
+     {'p', 's'}),
+]
+
+def test_check():
+    all_passed = True
+    files = filter(lambda f: f.endswith('.crc'), os.listdir('./benchmarks'))
+    for f in files:
+        print_info("Testing the topological order of circuit './benchmarks/%s'" % f)
+        c = circ.read('./benchmarks/' + f)
+        position = {x: i for i, x in enumerate(c.order)}
+        if sorted(c.order) != sorted(c.getSignals()):
+            print_error("The order does not list the signals of the circuit")
+            all_passed = False
+            continue
+        for x in c.order:
+            for y in c.getEquation(x).support():
+                if y in position and position[y] >= position[x]:
+                    print_error("Signal '%s' comes before its dependency '%s'" % (x, y))
+                    all_passed = False
+
+    print_info("Testing the detection of combinational loops")
+    prefix = 'Combinational loop detected: '
+    for text, signals in loops:
+        try:
+            circ.Parser(text).circuit()
+            print_error("No loop detected in %r" % text)
+            all_passed = False
+            continue
+        except circ.BrokenCircuitException as e:
+            message = str(e)
+        # The reported path must be a loop through the given signals,
+        # each one depending directly on the next one
+        path = message[len(prefix):].split(' -> ')
+        c = circ.Parser(text).parse()
+        eqs = {x.getName(): e for x, e in c[3]}
+        good = message.startswith(prefix) and path[0] == path[-1] \
+            and len(path) == len(signals) + 1 and set(path) == signals \
+            and all(y in eqs[x].support() for x, y in zip(path, path[1:]))
+        if not good:
+            print_error("Wrong loop reported for %r: %s" % (text, message))
+            all_passed = False
+    return all_passed
+
+# =============================================================================
+# Test code for the dependency index
+# =============================================================================
+
+# Compare the index of circuit c with the recursive definitions
+def check_index(c):
+    index = c.index()
+    deps = {x: c.getEquation(x).support() for x in c.getSignals()}
+    memo = dict()
+    def support(x):
+        if x in c.getInputs():
+            return {x}
+        if not ('support', x) in memo:
+            memo[('support', x)] = set().union(*[support(y) for y in deps[x]])
+        return memo[('support', x)]
+    def cone(x):
+        if x in c.getInputs():
+            return set()
+        if not ('cone', x) in memo:
+            memo[('cone', x)] = set(deps[x]).union(*[cone(y) for y in deps[x]])
+        return memo[('cone', x)]
+    def level(nd):
+        if type(nd) is circ.Variable:
+            x = nd.getName()
+            return 0 if x in c.getInputs() else level(c.getEquation(x))
+        if type(nd) is circ.Literal:
+            return 0
+        return 1 + max(level(k) for k in nd.getChildren())
+
+    good = True
+    for x in c.getInputs() | c.getSignals():
+        d = deps.get(x, set())
+        fanout = {y for y in c.getSignals() if x in deps[y]}
+        expected = (d, fanout, support(x), cone(x),
+                    level(circ.Variable(x)), cone(x) | {x})
+        result = (index.getDependencies(x), index.getFanout(x), index.getSupport(x),
+                  index.getCone(x), index.getLevel(x), index.reachable([x]))
+        for what, e, r in zip(('dependencies', 'fanout', 'support', 'cone', 'level',
+                               'reachable signals'), expected, result):
+            if e != r:
+                print_error("Wrong %s of signal '%s': %s instead of %s" % (what, x, r, e))
+                good = False
+
+    # Every node once, after its children, with its number of parents
+    nodes = dict()
+    parents = dict()
+    def visit(nd):
+        if not nd.id in nodes:
+            nodes[nd.id] = nd
+            for k in nd.getChildren():
+                parents[k.id] = parents.get(k.id, 0) + 1
+                visit(k)
+    for x in c.getSignals():
+        e = c.getEquation(x)
+        parents[e.id] = parents.get(e.id, 0) + 1
+        visit(e)
+    order = index.getNodes()
+    position = {nd.id: i for i, nd in enumerate(order)}
+    if len(order) != len(nodes) or position.keys() != nodes.keys():
+        print_error("The index does not list every node once")
+        good = False
+    elif any(position[k.id] > position[nd.id] for nd in order for k in nd.getChildren()):
+        print_error("The index lists a node before its children")
+        good = False
+    if index.getParents() != parents:
+        print_error("Wrong numbers of parents in the index")
+        good = False
+    return good
+
+def test_index():
+    files = filter(lambda f: f.endswith('.crc'), os.listdir('./benchmarks'))
+    circuits = [circ.read('./benchmarks/' + f) for f in files]
+    # Constants, aliases, and gates shared once the circuit is cleaned
+    text = """circ shared {
+        inputs: a, b, c
+        outputs: o, p
+        t = a & b
+        u = (a & b) | c
+        v = ~(a & b) ^ u
+        w = a
+        o = (u & v) | (t & 1)
+        p = w ^ c ^ (a & b)
+    }"""
+    circuits.append(circ.Parser(text).circuit())
+    circuits.append(circuits[-1].clean())
+    all_passed = True
+    for c in circuits:
+        print_info("Testing the dependency index of circuit '%s'" % c.name)
+        all_passed = check_index(c) and all_passed
+    return all_passed
+
+# =============================================================================
+# Test code for the CNF API and the solvers
+# =============================================================================
+
+# Test that the failed assumptions of unsatisfiable calls are a subset of
+# the assumptions, which is unsatisfiable by itself
+def check_failed(c, backend, max_tests):
+    import random
+    from circuit.cnf import VarPool
+
+    with VarPool():
+        cnf = transform.transform(c)
+        solver = Solver(backend)
+        inputs = sorted(c.getInputs())
+        outputs = sorted(c.getOutputs())
+        for _ in range(max_tests):
+            values = {x: random.choice([False, True]) for x in inputs}
+            result = c.simulate(values)
+            # One output gets the wrong value
+            wrong = random.choice(outputs)
+            assumptions = [SatVar(x) if values[x] else ~SatVar(x) for x in inputs]
+            assumptions += [SatVar(o) if result[o] != (o == wrong) else ~SatVar(o)
+                            for o in outputs]
+            random.shuffle(assumptions)
+            solution = solver.solve(cnf, assumptions)
+            if solution:
+                print_error("Wrong output value found satisfiable with backend %s" % backend)
+                return False
+            if solution.failed is None or not set(solution.failed) <= set(assumptions):
+                print_error("Failed assumptions %s are not assumptions" % solution.failed)
+                return False
+            if solver.solve(cnf, solution.failed):
+                print_error("Failed assumptions %s are satisfiable" % solution.failed)
+                return False
+            # The solver is still usable with other assumptions
+            if not solver.solve(cnf, [l for l in assumptions if l.name in values]):
+                print_error("Satisfiable assumptions found unsatisfiable")
+                return False
+    return True
+
+# Test that CNFs and literals use the pool they are given, even an empty
+# one, and not the current pool
+def check_pools():
+    from circuit.cnf import Cnf, VarPool
+
+    good = True
+    pool = VarPool()
+    cnf = Cnf(pool = pool)
+    if cnf.pool is not pool:
+        print_error("Cnf() did not use the given empty pool")
+        good = False
+    a = SatVar('a', pool = pool)
+    cnf &= a | ~SatVar('b', pool = pool)
+    if cnf.pool is not pool or len(pool) != 2 or pool.name(1) != 'a':
+        print_error("Variables did not go to the given pool")
+        good = False
+    with VarPool():
+        l = SatVar.literal(-1, pool)
+    if l.pool is not pool or l != ~a:
+        print_error("SatVar.literal() did not use the given pool")
+        good = False
+    if l is not ~a or ~l is not a:
+        print_error("Literals of the pool are not unique")
+        good = False
+
+    # transform() takes the variables from the pool of the sink, even
+    # outside of a with statement
+    c = circ.parse('./benchmarks/cra8.crc')
+    other = transform.transform(c, sink = Cnf(pool = VarPool()))
+    if len(other.pool) != len(other.getIds()):
+        print_error("transform() did not use the pool of the sink")
+        good = False
+    elif not Solver('cdcl').solve(other):
+        print_error("CNF of '%s' in a given pool is not satisfiable" % c.name)
+        good = False
+
+    # The pool is freed by reference counting alone once its variables
+    # and CNFs are gone
+    import gc
+    import weakref
+    ref = weakref.ref(pool)
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        del pool, cnf, a, l
+        if ref() is not None:
+            print_error("VarPool was not freed by reference counting")
+            good = False
+    finally:
+        if enabled:
+            gc.enable()
+    return good
+
+# Test that a CNF written in DIMACS format reads back into a given fresh
+# pool, with and without the names of the variables
+def check_dimacs(c):
+    from circuit.cnf import VarPool
+
+    good = True
+    cnf = transform.transform(c)
+    for names in (True, False):
+        f = io.BytesIO()
+        cnf.writeDimacs(f, names = names)
+        f.seek(0)
+        pool = VarPool()
+        copy = readDimacs(f, pool)
+        if copy.pool is not pool or len(pool) != len(cnf.getIds()):
+            print_error("Variables of '%s' were not read into the given pool" % c.name)
+            good = False
+            continue
+        def name(l):
+            x = cnf.pool.name(abs(l)) if names else 'x%d' % abs(l)
+            return x if l > 0 else '~' + x
+        expected = [[name(l) for l in cls] for cls in cnf.iterClauses()]
+        clauses = [[str(pool.literal(l)) for l in cls] for cls in copy.iterClauses()]
+        if clauses != expected:
+            print_error("Wrong clauses read back for circuit '%s'" % c.name)
+            good = False
+    return good
+
+def test_cnf(max_tests = 10):
+    all_passed = True
+    print_info("Testing variable pools")
+    all_passed = check_pools() and all_passed
+    files = filter(lambda f: f.endswith('.crc'), os.listdir('./benchmarks'))
+    benchmarks = ['./benchmarks/' + f for f in files]
+    for bench in benchmarks:
+        print_info("Testing failed assumptions with circuit '%s'" % bench)
+        c = circ.parse(bench)
+        all_passed = check_failed(c, 'cdcl', max_tests) and all_passed
+        print_info("Testing DIMACS output and input with circuit '%s'" % bench)
+        all_passed = check_dimacs(c) and all_passed
+    return all_passed
+
 # =============================================================================
 # Main code
 # =============================================================================
@@ -281,3 +928,80 @@ if __name__ == '__main__':
         print (e)
         print(traceback.format_exc())
 
+    print_info("===========================================")
+    print_info("Testing simulation engines")
+    print_info("===========================================")
+    try:
+        if test_simulation():
+            print_passed("Simulation engines agree with Circuit.simulate().")
+        else:
+            print_error("Some test cases failed, go debug your code.")
+    except Exception as e:
+        print_error("Something went seriously wrong.")
+        print (e)
+        print(traceback.format_exc())
+
+    print_info("===========================================")
+    print_info("Testing parser")
+    print_info("===========================================")
+    try:
+        if test_parser():
+            print_passed("Both parse modes agree and report syntax errors correctly.")
+        else:
+            print_error("Some test cases failed, go debug your code.")
+    except Exception as e:
+        print_error("Something went seriously wrong.")
+        print (e)
+        print(traceback.format_exc())
+
+    print_info("===========================================")
+    print_info("Testing circuit cache")
+    print_info("===========================================")
+    try:
+        if test_cache():
+            print_passed("Cached circuits match the parsed ones.")
+        else:
+            print_error("Some test cases failed, go debug your code.")
+    except Exception as e:
+        print_error("Something went seriously wrong.")
+        print (e)
+        print(traceback.format_exc())
+
+    print_info("===========================================")
+    print_info("Testing circuit checks")
+    print_info("===========================================")
+    try:
+        if test_check():
+            print_passed("Signals are sorted and loops are reported correctly.")
+        else:
+            print_error("Some test cases failed, go debug your code.")
+    except Exception as e:
+        print_error("Something went seriously wrong.")
+        print (e)
+        print(traceback.format_exc())
+
+    print_info("===========================================")
+    print_info("Testing dependency index")
+    print_info("===========================================")
+    try:
+        if test_index():
+            print_passed("The dependency index agrees with its definitions.")
+        else:
+            print_error("Some test cases failed, go debug your code.")
+    except Exception as e:
+        print_error("Something went seriously wrong.")
+        print (e)
+        print(traceback.format_exc())
+
+    print_info("===========================================")
+    print_info("Testing CNF API and solvers")
+    print_info("===========================================")
+    try:
+        if test_cnf():
+            print_passed("The CNF API and the solvers work as documented.")
+        else:
+            print_error("Some test cases failed, go debug your code.")
+    except Exception as e:
+        print_error("Something went seriously wrong.")
+        print (e)
+        print(traceback.format_exc())
@@ -1,11 +1,7 @@
 #!/usr/bin/env python3
 
-import sys
-
-import circuit.circuit as circ
-from circuit.cnf import SatVar, Solver, Cnf
-from circuit.circuit import Circuit
-from adder import *
+from circuit.cnf import Cnf, VarPool
+from circuit.circuit import Circuit, Literal, Variable, BinOp, UnOp, nogc
 
 # Implementation hints:
 #
@@ -31,89 +27,294 @@ from adder import *
 
 
 
-def transform_rec(node, prefix = ''):
-    cnf = Cnf()
+# Gate encodings. Literals are DIMACS integers (see SatVar.__int__), and
+# the clauses are passed straight to a ClauseSink.
+#
+# The polarity of a gate s <=> f says which half of the definition is
+# emitted: POSITIVE for s => f, NEGATIVE for f => s. Both halves are
+# needed for a signal whose value is read back, but a signal which is
+# only ever constrained to be true (or false) needs only one of them
+# (Plaisted-Greenbaum encoding).
+
+POSITIVE = 1
+NEGATIVE = 2
+BOTH = POSITIVE | NEGATIVE
 
-    children = node.getChildren()
-    if type(node).__name__ == "Variable":
-        s = SatVar(prefix+node.getName())
-        return s, cnf
+def emit_and(sink, s, a, b, polarity=BOTH):
+    """Emit the clauses of the gate s <=> a & b"""
+    if polarity & NEGATIVE:
+        sink.addClause([-a, -b, s])
+    if polarity & POSITIVE:
+        sink.addClause([-s, a])
+        sink.addClause([-s, b])
 
-    s = SatVar(prefix+ "s" + str(node.getID()))
-    if type(node).__name__ == "Literal":
-        if (node.getValue()):
-            cnf = cnf & s
-        else:
-            cnf = cnf & ~s
-        return s, cnf
-
-    if type(node).__name__ == "BinOp":
-        a, cnf1 = transform_rec(node.getChild(0), prefix)
-        b, cnf2 = transform_rec(node.getChild(1), prefix)
-        cnf = cnf & cnf1 & cnf2
-        if (node.getOp() == "&"):
-            cnf = cnf & mk_and(s, a, b)
-        elif (node.getOp() == "^"):
-            cnf = cnf & mk_xor(s, a, b)
-        elif (node.getOp() == "|"):
-            cnf = cnf & mk_or(s, a, b)
+def emit_or(sink, s, a, b, polarity=BOTH):
+    """Emit the clauses of the gate s <=> a | b"""
+    if polarity & POSITIVE:
+        sink.addClause([a, b, -s])
+    if polarity & NEGATIVE:
+        sink.addClause([s, -a])
+        sink.addClause([s, -b])
+
+def emit_xor(sink, s, a, b, polarity=BOTH):
+    """Emit the clauses of the gate s <=> a ^ b"""
+    if polarity & POSITIVE:
+        sink.addClause([-s, a, b])
+        sink.addClause([-s, -a, -b])
+    if polarity & NEGATIVE:
+        sink.addClause([s, -a, b])
+        sink.addClause([s, a, -b])
+
+def emit_not(sink, s, a, polarity=BOTH):
+    """Emit the clauses of the gate s <=> ~a"""
+    if polarity & NEGATIVE:
+        sink.addClause([s, a])
+    if polarity & POSITIVE:
+        sink.addClause([-s, -a])
+
+def emit_eq(sink, s, a, polarity=BOTH):
+    """Emit the clauses of the gate s <=> a"""
+    if polarity & NEGATIVE:
+        sink.addClause([s, -a])
+    if polarity & POSITIVE:
+        sink.addClause([-s, a])
+
+def emit_literal(sink, s, b, polarity=BOTH):
+    """Emit the clause of s <=> b, where b is a Boolean constant"""
+    if polarity & (NEGATIVE if b else POSITIVE):
+        sink.addClause([s if b else -s])
+
+def emit_gate(sink, s, node, a, b=None, polarity=BOTH):
+    """Emit the clauses of s <=> node, where node is a gate whose
+    children stand for the DIMACS literals a (and b)"""
+
+    op = node.getOp()
+    if op == "&":
+        emit_and(sink, s, a, b, polarity)
+    elif op == "^":
+        emit_xor(sink, s, a, b, polarity)
+    elif op == "|":
+        emit_or(sink, s, a, b, polarity)
+    elif op == "~":
+        emit_not(sink, s, a, polarity)
+    else:
+        raise ValueError("Unrecognized operator " + op)
+
+# Associative chains. With flatten=True, transform() encodes a chain of
+# & (or |) nodes, such as the left-deep ones built by the parser, as a
+# single n-ary gate: n + 1 clauses and one variable, instead of 3 clauses
+# and one variable per binary node. A ^ chain becomes parity constraints
+# over at most XOR_WIDTH literals each (2^XOR_WIDTH clauses), chained by
+# auxiliary variables. Only the nodes with a single parent are merged
+# into the chain, so that no node is encoded twice.
+
+XOR_WIDTH = 3
+
+def emit_and_n(sink, s, lits, polarity=BOTH):
+    """Emit the clauses of the gate s <=> lits[0] & lits[1] & ..."""
+    if polarity & NEGATIVE:
+        sink.addClause([-a for a in lits] + [s])
+    if polarity & POSITIVE:
+        for a in lits:
+            sink.addClause([-s, a])
+
+def emit_or_n(sink, s, lits, polarity=BOTH):
+    """Emit the clauses of the gate s <=> lits[0] | lits[1] | ..."""
+    if polarity & POSITIVE:
+        sink.addClause(list(lits) + [-s])
+    if polarity & NEGATIVE:
+        for a in lits:
+            sink.addClause([s, -a])
+
+def emit_xor_n(sink, s, lits, polarity=BOTH):
+    """Emit the clauses of the gate s <=> lits[0] ^ lits[1] ^ ..., one
+    per assignment of s and lits of the wrong parity"""
+    n = len(lits)
+    for bits in range(1 << n):
+        # Odd number of negations among the literals and s
+        odd = bin(bits).count("1") & 1
+        if odd and not polarity & NEGATIVE or not odd and not polarity & POSITIVE:
+            continue
+        clause = [-a if bits >> i & 1 else a for i, a in enumerate(lits)]
+        clause.append(s if odd else -s)
+        sink.addClause(clause)
+
+def chain(node, fanout):
+    """Return the operands of the chain of & (or | or ^) nodes rooted at
+    node, from left to right: the children of the nodes with the same
+    operator which have a single parent are replaced by their own.
+    fanout maps the node ids to their number of parents (see
+    Index.getParents())."""
+
+    op = node.getOp()
+    leaves = []
+    stack = list(reversed(node.kids))
+    while stack:
+        k = stack.pop()
+        if type(k) is BinOp and k.getOp() == op and fanout[k.id] == 1:
+            stack.extend(reversed(k.kids))
         else:
-            raise ValueError("Unrecognized operator " + node.getOp())
-        return s, cnf
-
-    if type(node).__name__ == "UnOp":
-        a, cnf1 = transform_rec(node.getChild(0), prefix)
-        cnf = cnf & cnf1
-        if (node.getOp() == "~"):
-            cnf = cnf & mk_not(s, a)
+            leaves.append(k)
+    return leaves
+
+def polarities(c, roots):
+    """Return the polarities needed by the signals and the nodes of the
+    circuit c, as two dicts from signal names and node ids to polarities,
+    when roots maps some signals to the polarities they are used with.
+    Signals and nodes which are not needed at all are left out.
+
+    A node passes its polarity on to the children of & and |, the
+    opposite one to the child of ~, and both to the children of ^.
+    """
+
+    signals = {x: p for x, p in roots.items() if x in c.equations}
+    nodes = dict()
+    roots = dict()
+    for x in c.order:
+        roots.setdefault(c.getEquation(x).id, []).append(x)
+
+    # Every node comes after its children in the index
+    order = c.index().getNodes()
+    for node in reversed(order):
+        p = nodes.get(node.id, 0)
+        for x in roots.get(node.id, ()):
+            p |= signals.get(x, 0)
+        if not p:
+            continue
+        nodes[node.id] = p
+        t = type(node)
+        if t is Variable:
+            signals[node.name] = signals.get(node.name, 0) | p
+            continue
+        if t is UnOp:
+            p = (p & POSITIVE) << 1 | (p & NEGATIVE) >> 1
+        elif t is BinOp and node.getOp() == "^":
+            p = BOTH
+        for k in node.kids:
+            nodes[k.id] = nodes.get(k.id, 0) | p
+    return signals, nodes
+
+def emit_node(sink, s, root, prefix, lits, var, nodes=None, fanout=None):
+    """Emit the clauses of s <=> root, where s is a DIMACS literal.
+
+    lits maps the ids of the nodes already encoded to their literals;
+    these nodes are not encoded again, and the new ones are added.
+    var(name) returns the variable id of a name. If nodes is given, it
+    maps the node ids to their polarities (see polarities()); otherwise
+    every node gets both. If fanout is given (see chain()), the chains
+    of associative gates are encoded as n-ary gates. The traversal uses
+    an explicit stack, so deep expressions do not hit the recursion limit.
+    """
+
+    stack = [root]
+    while stack:
+        node = stack[-1]
+        if node.id in lits:
+            stack.pop()
+            continue
+        t = type(node)
+        if t is Variable:
+            lits[node.id] = var(prefix + node.name)
+            stack.pop()
+            continue
+        kids = node.kids if fanout is None or t is not BinOp else chain(node, fanout)
+        missing = [k for k in kids if not k.id in lits]
+        if missing:
+            stack.extend(missing)
+            continue
+        l = s if node is root else var(prefix + "#" + str(node.id))
+        polarity = BOTH if nodes is None else nodes[node.id]
+        if t is Literal:
+            emit_literal(sink, l, node.getValue(), polarity)
+        elif len(kids) > 2:
+            operands = [lits[k.id] for k in kids]
+            op = node.getOp()
+            if op == "&":
+                emit_and_n(sink, l, operands, polarity)
+            elif op == "|":
+                emit_or_n(sink, l, operands, polarity)
+            else:
+                # Each parity constraint but the last one goes to an
+                # auxiliary variable, which starts the next one. The
+                # next constraint reads it with both polarities, so it
+                # is always encoded in full.
+                k = 0
+                while len(operands) > XOR_WIDTH:
+                    k += 1
+                    a = var(prefix + "#" + str(node.id) + "_" + str(k))
+                    emit_xor_n(sink, a, operands[:XOR_WIDTH])
+                    operands[:XOR_WIDTH] = [a]
+                emit_xor_n(sink, l, operands, polarity)
+        elif t is BinOp or t is UnOp:
+            emit_gate(sink, l, node, *[lits[k.id] for k in kids], polarity=polarity)
         else:
-            raise ValueError("Unrecognized operator " + node.getOp())
-        return s, cnf
+            raise TypeError("invalid node")
+        lits[node.id] = l
+        stack.pop()
 
-def transform(c: Circuit, prefix: str='') -> Cnf:
+def transform(c: Circuit, prefix: str='', sink=None, encoding: str='tseitin',
+              polarity=None, keep=(), flatten: bool=False) -> Cnf:
     '''The function transform takes a Circuit c and returns a Cnf obtained by the
     Tseitin transformation of c. The optional prefix string will be used for
     all variable names in the Cnf.
-    '''
 
-    cnf = Cnf()
-    for keys in c.getSignals():
-        s = SatVar(prefix+keys)
-        node = c.getEquation(keys)
+    If a ClauseSink is given, the clauses are passed to it one by one as
+    they are generated, and the sink is returned instead of a Cnf. The
+    variables are taken from the pool of the sink, if it has one, and
+    from the current pool otherwise.
 
-        children = node.getChildren()
+    The signals are encoded in topological order, and every node gets a
+    single variable and a single group of clauses, even if it is shared
+    by several expressions. The variable of a signal stands for the root
+    of its equation. The variables of the other nodes are named after
+    their node ids with a '#', which the parser rejects in signal names,
+    so that they never stand for a signal.
 
-        # This case should not really happen in a real circuit.
-        if type(node).__name__ == "Variable":
-            a = SatVar(prefix+node.getName())
-            cnf = cnf & mk_eq(s, a)
-
-        if type(node).__name__ == "Literal":
-            if (node.getValue()):
-                cnf = cnf & s
-            else:
-                cnf = cnf & ~s
-
-        if type(node).__name__ == "BinOp":
-            a, cnf1 = transform_rec(node.getChild(0), prefix)
-            b, cnf2 = transform_rec(node.getChild(1), prefix)
-            cnf = cnf & cnf1 & cnf2
-            if (node.getOp() == "&"):
-                cnf = cnf & mk_and(s, a, b)
-            elif (node.getOp() == "^"):
-                cnf = cnf & mk_xor(s, a, b)
-            elif (node.getOp() == "|"):
-                cnf = cnf & mk_or(s, a, b)
-            else:
-                raise ValueError("Unrecognized operator " + node.getOp())
+    With encoding='pg' (Plaisted-Greenbaum), polarity maps the outputs
+    to the way the caller uses them: POSITIVE if they are only ever
+    constrained to be true, NEGATIVE if only to be false, and BOTH (the
+    default for the outputs left out) otherwise. Every node then gets
+    only the halves of its definition that the outputs need, and the
+    signals that no output needs are left out. The signals in keep are
+    encoded in full, so that their values in a solution are the ones of
+    the circuit for the inputs of the solution, which is only sure for
+    the other signals if they are needed with both polarities.
 
+    With flatten=True, the chains of & and | nodes are encoded as n-ary
+    gates, and the chains of ^ nodes as bounded-width parity constraints
+    (see XOR_WIDTH). This saves the variables of the inner nodes of the
+    chains, which no longer appear in the Cnf.
+    '''
 
-        if type(node).__name__ == "UnOp":
-            a, cnf1 = transform_rec(node.getChild(0), prefix)
-            cnf = cnf & cnf1
-            if (node.getOp() == "~"):
-                cnf = cnf & mk_not(s, a)
+    if encoding == 'tseitin':
+        signals = nodes = None
+    elif encoding == 'pg':
+        roots = dict.fromkeys(c.getOutputs(), BOTH)
+        roots.update(polarity or ())
+        for x in keep:
+            roots[x] = BOTH
+        signals, nodes = polarities(c, roots)
+    else:
+        raise ValueError("Unknown encoding " + encoding)
+    if sink is None:
+        sink = Cnf()
+    pool = getattr(sink, 'pool', None)
+    if pool is None:
+        pool = VarPool.current()
+    var = pool.id
+    lits = dict()
+    fanout = c.index().getParents() if flatten else None
+    with nogc():
+        for x in c.order:
+            polarity = BOTH if signals is None else signals.get(x, 0)
+            if not polarity:
+                continue
+            s = var(prefix + x)
+            root = c.getEquation(x)
+            if type(root) is Variable:
+                emit_eq(sink, s, var(prefix + root.name), polarity)
+            elif root.id in lits:
+                emit_eq(sink, s, lits[root.id], polarity)
             else:
-                raise ValueError("Unrecognized operator " + node.getOp())
-
-    return cnf
+                emit_node(sink, s, root, prefix, lits, var, nodes, fanout)
+    return sink